@@ -1,16 +1,45 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory
+from flask import Flask, g, render_template, request, redirect, stream_with_context, url_for, send_from_directory
 from werkzeug.utils import secure_filename
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from bisect import bisect_left
+from itertools import groupby
 import os
 import sys
+import csv
+import io
 import json
+import gzip
+import hashlib
 try:
     import fitz  # PyMuPDF
 except Exception:
     fitz = None
 
+from cmm_index import CMMIndex, folder_key
+from cmm_watch import FolderWatcher
+from cmm_report import (
+    CMM_ROWS_ARTIFACT as _CMM_ROWS_ARTIFACT,
+    cached_cmm_rows as _cached_cmm_rows,
+    extract_die_number as _extract_die_number,
+    init_worker as _init_cmm_worker,
+)
+from content_store import (
+    ARTIFACTS, configure_artifacts, file_digest, is_stored_name, resolve_upload, store_upload, upload_labels,
+)
+from doc_cache import DOCUMENTS, LRUCache, cache_stats
+from feature_store import FeatureStore
+import metrics
+from metrics import stage
+from multicompare import compare_many
+from ocr import ocr_kind
+from page_align import align_documents
+from precompute import DiffPrecomputer, payload_tag
+from render_cache import RenderCache, quantize_scale, render_png
+from textcompare import ENGINES, diff_document, diff_page, encode_compact
+from workerpool import TaskPool, default_workers
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -26,6 +55,9 @@ def _resource_root() -> str:
 def _runtime_root() -> str:
     """Return the folder where runtime artifacts (uploads) should live."""
 
+    override = os.environ.get("PDF_COMPARE_DATA_DIR")
+    if override:
+        return os.path.abspath(override)
     if getattr(sys, "frozen", False):
         # When frozen, keep uploads beside the .exe so the app stays portable
         return os.path.dirname(sys.executable)
@@ -35,6 +67,8 @@ def _runtime_root() -> str:
 RESOURCE_ROOT = _resource_root()
 RUNTIME_ROOT = _runtime_root()
 UPLOAD_FOLDER = os.path.join(RUNTIME_ROOT, "uploads")
+# Per-document derived data (words, CMM rows) keyed by content hash
+DERIVED_FOLDER = os.path.join(UPLOAD_FOLDER, ".derived")
 ALLOWED_EXTENSIONS = {'pdf'}
 
 app = Flask(
@@ -43,15 +77,106 @@ app = Flask(
     template_folder=os.path.join(RESOURCE_ROOT, "templates"),
 )
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Whole-document diffs fan pages out over a process pool
+app.config['DIFF_WORKERS'] = int(os.environ.get("PDF_COMPARE_DIFF_WORKERS") or default_workers())
+app.config['DIFF_PAGE_TIMEOUT'] = float(os.environ.get("PDF_COMPARE_PAGE_TIMEOUT") or 30)
+# CMM trend scans parse new reports in worker processes, one time limit per file
+app.config['CMM_WORKERS'] = int(os.environ.get("PDF_COMPARE_CMM_WORKERS") or default_workers())
+app.config['CMM_FILE_TIMEOUT'] = float(os.environ.get("PDF_COMPARE_CMM_FILE_TIMEOUT") or 120)
+# Report folders (os.pathsep separated) whose new reports are indexed in the background
+app.config['CMM_WATCH'] = [f for f in (os.environ.get("PDF_COMPARE_CMM_WATCH") or "").split(os.pathsep) if f]
+app.config['CMM_WATCH_INTERVAL'] = float(os.environ.get("PDF_COMPARE_CMM_WATCH_INTERVAL") or 5)
+app.config['CMM_WATCH_SETTLE'] = float(os.environ.get("PDF_COMPARE_CMM_WATCH_SETTLE") or 3)
+app.config['CMM_WATCH_QUEUE'] = int(os.environ.get("PDF_COMPARE_CMM_WATCH_QUEUE") or 64)
+# Per-stage request timing (Server-Timing headers, /metrics); 0 turns it off
+app.config['METRICS'] = os.environ.get("PDF_COMPARE_METRICS", "1") != "0"
+# Requests slower than this many milliseconds are logged with their stages; 0 disables
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get("PDF_COMPARE_SLOW_REQUEST_MS") or 2000)
+# "production" serves with waitress request threads instead of the werkzeug debug server
+app.config['SERVER'] = os.environ.get("PDF_COMPARE_SERVER") or "dev"
+app.config['SERVER_THREADS'] = int(os.environ.get("PDF_COMPARE_THREADS") or 8)
+# Diff and render pages in the diff worker processes instead of under FITZ_LOCK
+app.config['OFFLOAD_PYMUPDF'] = os.environ.get(
+    "PDF_COMPARE_OFFLOAD_PYMUPDF", "1" if app.config['SERVER'] == "production" else "0"
+) != "0"
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+configure_artifacts(DERIVED_FOLDER)
+
+
+
+def _diff_page(left_path: str, right_path: str, page: int, right_page: Optional[int] = None, engine: str = 'box'):
+    """``diff_page``, run in a diff worker process when ``OFFLOAD_PYMUPDF`` is set.
+
+    PyMuPDF calls in this process are serialized on ``FITZ_LOCK``, so with
+    several request threads the workers do the parsing instead; they share
+    extracted words through the artifact store on disk.
+    """
+
+    if not app.config['OFFLOAD_PYMUPDF']:
+        return diff_page(left_path, right_path, page, right_page, engine)
+    with stage('worker'):
+        return _get_diff_pool().call(
+            diff_page, left_path, right_path, page, right_page, engine,
+            timeout=app.config['DIFF_PAGE_TIMEOUT'] or None,
+        )
+
+
+def _render_png(path: str, page: int, scale: float, tile: Optional[Tuple[int, int]] = None) -> bytes:
+    """``render_png``, offloaded like :func:`_diff_page`."""
+
+    if not app.config['OFFLOAD_PYMUPDF']:
+        return render_png(path, page, scale, tile)
+    with stage('worker'):
+        return _get_diff_pool().call(render_png, path, page, scale, tile, timeout=app.config['DIFF_PAGE_TIMEOUT'] or None)
+
+
+# Finished /textdiff payloads are stored beside the uploads they came from
+PRECOMPUTE = DiffPrecomputer(os.path.join(UPLOAD_FOLDER, ".textdiff"), compute=_diff_page)
+
+# Rendered page images for the viewer, trimmed to a disk budget
+RENDERS = RenderCache(
+    os.path.join(DERIVED_FOLDER, "render"),
+    max_disk_bytes=int(os.environ.get("PDF_COMPARE_RENDER_CACHE_MB") or 512) * 1024 * 1024,
+    max_memory_bytes=64 * 1024 * 1024,
+    render=_render_png,
+)
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.before_request
+def _start_timing():
+    if app.config['METRICS']:
+        g.timings, g.timings_token = metrics.begin()
+
+
+@app.after_request
+def _finish_timing(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    metrics.end(g.pop('timings_token'))
+    # Streamed bodies are produced later; their header covers the setup only.
+    response.headers['Server-Timing'] = timings.server_timing()
+    elapsed = timings.elapsed()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(elapsed, route, request.method, str(response.status_code))
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        metrics.SLOW_REQUESTS.inc(route)
+        app.logger.warning(
+            "slow request: %s %s -> %s in %.0fms (%s)",
+            request.method, request.full_path.rstrip('?'), response.status_code, elapsed * 1000,
+            metrics.format_stages(timings.stages.items()) or 'no stages',
+        )
+    return response
+
+
 @app.route('/', methods=['GET'])
 def index():
     return render_template('index.html')
@@ -67,31 +192,70 @@ def upload():
     if not allowed_file(left.filename) or not allowed_file(right.filename):
         return 'Only PDF files allowed', 400
 
-    left_name = secure_filename(left.filename)
-    right_name = secure_filename(right.filename)
-
-    left_path = os.path.join(app.config['UPLOAD_FOLDER'], left_name)
-    right_path = os.path.join(app.config['UPLOAD_FOLDER'], right_name)
+    # Files are stored as <sha256>.pdf; names.json maps the original names
+    folder = app.config['UPLOAD_FOLDER']
+    left_name = store_upload(left, folder, secure_filename(left.filename))
+    right_name = store_upload(right, folder, secure_filename(right.filename))
 
-    left.save(left_path)
-    right.save(right_path)
+    left_path = os.path.join(folder, left_name)
+    right_path = os.path.join(folder, right_name)
+    PRECOMPUTE.submit(left_path, right_path)
 
     return redirect(url_for('viewer', l=left_name, r=right_name))
 
 
+@app.route('/upload_many', methods=['POST'])
+def upload_many():
+    base = request.files.get('base')
+    candidates = [f for f in request.files.getlist('candidates') if f and f.filename]
+    if not base or not candidates:
+        return 'Please upload a base PDF and at least one candidate PDF', 400
+
+    if not all(allowed_file(f.filename) for f in [base] + candidates):
+        return 'Only PDF files allowed', 400
+
+    folder = app.config['UPLOAD_FOLDER']
+    base_name = store_upload(base, folder, secure_filename(base.filename))
+    names = [store_upload(f, folder, secure_filename(f.filename)) for f in candidates]
+    return redirect(url_for('matrix', base=base_name, c=names))
+
+
+@app.route('/matrix')
+def matrix():
+    if not request.args.get('base') or not request.args.getlist('c'):
+        return redirect(url_for('index'))
+    return render_template('matrix.html')
+
+
 @app.route('/viewer')
 def viewer():
     left = request.args.get('l')
     right = request.args.get('r')
     if not left or not right:
         return redirect(url_for('index'))
+    # accept original upload names as well as stored <sha256>.pdf names
+    left_path = _upload_path(left)
+    right_path = _upload_path(right)
+    if left_path:
+        left = os.path.basename(left_path)
+    if right_path:
+        right = os.path.basename(right_path)
     left_url = url_for('uploaded_file', filename=left)
     right_url = url_for('uploaded_file', filename=right)
     return render_template('viewer.html', left_url=left_url, right_url=right_url)
 
 
+def _upload_path(name: str) -> Optional[str]:
+    """Return the stored path for an upload referenced by stored or original name."""
+
+    return resolve_upload(app.config['UPLOAD_FOLDER'], name)
+
+
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
+    # Only stored PDFs: names.json and the derived caches share this folder
+    if not is_stored_name(filename):
+        return {'error': 'file not found'}, 404
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
@@ -100,285 +264,97 @@ def cmm():
     return render_template('cmm.html', part_types=["675", "50TT", "50TL"])
 
 
-def normalize_text(s: str) -> str:
-    # simple normalization: lowercase, keep letters+numbers and spaces
-    import re
-    # allow hyphen and vertical bar as well (keep them as characters to compare)
-    return re.sub(r'[^0-9a-z\-\| ]+', '', s.lower())
-
-
-def _is_numeric_token(token: str) -> bool:
-    import re
-    # A numeric column token must be strictly numeric (no letters),
-    # optionally comma-separated and with an optional decimal part.
-    # Examples: 10, -10.25, 1,234.50
-    return re.match(r'^[+-]?\d[\d,]*(\.\d+)?$', token) is not None
+# Report rows per folder file, so trend queries only parse new or changed PDFs
+CMM_INDEX = CMMIndex(
+    os.environ.get("PDF_COMPARE_CMM_INDEX") or os.path.join(DERIVED_FOLDER, "cmm-index.sqlite3"),
+    extract=_cached_cmm_rows,
+    die_number=_extract_die_number,
+    parser=ocr_kind(_CMM_ROWS_ARTIFACT),
+)
 
+_cmm_pool: Optional[TaskPool] = None
 
-def _parse_numeric_token(token: str) -> Optional[float]:
-    """Return float value for token that may contain commas; otherwise None."""
 
-    try:
-        cleaned = token.replace(",", "")
-        return float(cleaned)
-    except Exception:
-        return None
+def _get_cmm_pool() -> TaskPool:
+    global _cmm_pool
+    if _cmm_pool is None:
+        _cmm_pool = TaskPool(
+            app.config['CMM_WORKERS'],
+            initializer=_init_cmm_worker,
+            initargs=(ARTIFACTS.root,),
+        )
+    return _cmm_pool
 
 
-def _extract_die_number(filename: str) -> Optional[str]:
-    """Return the two-digit die number embedded after a WB0i prefix."""
+def _cmm_filters(part_type: Optional[str], die_number: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Return the normalized ``(part type, two-digit die number)`` filters."""
 
-    import re
+    part_type_upper = part_type.upper() if part_type else None
+    die_filter = None
 
-    match = re.search(r"wb0i(\d+)", filename, flags=re.IGNORECASE)
-    if not match:
-        return None
+    if die_number:
+        digits = "".join(ch for ch in die_number if ch.isdigit())
+        if digits:
+            if len(digits) >= 2:
+                digits = digits[-2:]
+            die_filter = digits.zfill(2)
 
-    digits = "".join(ch for ch in match.group(1) if ch.isdigit())
-    if not digits:
-        return None
+    return part_type_upper, die_filter
 
-    if len(digits) >= 2:
-        digits = digits[-2:]
 
-    return digits.zfill(2)
+def _index_cmm_folder(
+    folder: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    part_type_upper: Optional[str],
+    die_filter: Optional[str],
+    errors: Optional[List[str]] = None,
+) -> None:
+    """Index the matching reports in *folder*, adding parse failures to *errors*."""
 
+    # Only new or changed reports are parsed; the filters run as SQL.
+    with stage('cmm_sync'):
+        CMM_INDEX.sync(folder)
+        records = CMM_INDEX.files(folder, start_date, end_date, part_type_upper, die_filter)
+    with stage('cmm_parse'):
+        CMM_INDEX.parse(records, _get_cmm_pool(), app.config['CMM_FILE_TIMEOUT'] or None)
+    if errors is not None:
+        errors.extend(f"{r.name}: {r.error}" for r in records if r.error is not None)
 
-def _extract_cmm_rows(
-    path: str,
-) -> List[Tuple[str, float, Optional[float], Optional[float], Optional[float], Optional[float]]]:
-    """
-    Extract ZEISS CMM feature rows with support for:
-    - Standard single-line features
-    - POS X-Y-Z multi-line features → converted into separate X, Y, Z features.
 
-    Each tuple contains: (feature name, deviation, upper tolerance, lower tolerance,
-    nominal, actual). Tolerance values are optional and may be ``None`` if not
-    present in the report.
-    """
+# Columnar stores of recent trend queries, keyed by filters and index state
+_CMM_STORES = LRUCache(max_entries=8)
 
-    if fitz is None:
-        raise RuntimeError("PyMuPDF is required to parse CMM reports")
-
-    rows: List[Tuple[str, float]] = []
-    doc = fitz.open(path)
-
-    for page in doc:
-        words = page.get_text("words")
-        if not words:
-            continue
-
-        # Locate header columns
-        nominal_x = actual_x = deviation_x = hist_x = None
-        upper_tol_x = lower_tol_x = None
-
-        for x0, y0, x1, y1, text, *_ in words:
-            if text == "Nominal":
-                nominal_x = x0
-            elif text == "Actual":
-                actual_x = x0
-            elif text == "Deviation":
-                deviation_x = x0
-            elif text == "Histogram":
-                hist_x = x0
-            elif text.lower().startswith("upper"):
-                upper_tol_x = x0
-            elif text.lower().startswith("lower"):
-                lower_tol_x = x0
-
-        if actual_x is None or deviation_x is None or hist_x is None:
-            continue
-
-        columns = [
-            ("nominal", nominal_x) if nominal_x is not None else None,
-            ("actual", actual_x),
-            ("deviation", deviation_x),
-            ("upper_tol", upper_tol_x) if upper_tol_x is not None else None,
-            ("lower_tol", lower_tol_x) if lower_tol_x is not None else None,
-            ("histogram", hist_x),
-        ]
-        columns = [c for c in columns if c is not None]
-        columns.sort(key=lambda c: c[1])
-
-        first_column_x = columns[0][1]
-        feature_limit_x = first_column_x - 5
-
-        def column_for_x(x_val: float) -> Optional[str]:
-            """Assign an x-position to the nearest header column using midpoints."""
-
-            for idx, (name, col_x) in enumerate(columns):
-                left_bound = -float("inf") if idx == 0 else (columns[idx - 1][1] + col_x) / 2
-                right_bound = float("inf") if idx == len(columns) - 1 else (col_x + columns[idx + 1][1]) / 2
-                if left_bound <= x_val < right_bound:
-                    return name
-            return None
-
-        # Convert to row clusters by Y
-        items = []
-        for (x0, y0, x1, y1, text, *_) in words:
-            y_center = (y0 + y1) / 2
-            items.append({"x": x0, "y": y_center, "text": text})
-
-        items.sort(key=lambda w: (w["y"], w["x"]))
-
-        row_groups = []
-        current = []
-        last_y = None
-
-        for w in items:
-            if last_y is None or abs(w["y"] - last_y) <= 1.0:
-                current.append(w)
-            else:
-                row_groups.append(current)
-                current = [w]
-            last_y = w["y"]
-
-        if current:
-            row_groups.append(current)
-
-        # Parent state
-        current_parent_feature = None
-
-        def parse_axis_row(text):
-            return text in ("X", "Y", "Z")
-
-        for group in row_groups:
-            feature_tokens = []
-            deviation_candidates = []
-            nominal_candidates = []
-            actual_candidates = []
-            upper_tol_candidates = []
-            lower_tol_candidates = []
-            axis_row_label = None
-
-            # Detect axis-only child rows
-            for w in group:
-                if parse_axis_row(w["text"].strip()):
-                    axis_row_label = w["text"].strip()
-
-            # Handle axis child rows → create separate features
-            if axis_row_label and current_parent_feature:
-                # collect deviation number
-                dev_val = upper_val = lower_val = nominal_val = actual_val = None
-                for w in group:
-                    tx = w["text"].strip()
-                    if not _is_numeric_token(tx):
-                        continue
-
-                    col = column_for_x(w["x"])
-                    if col == "nominal":
-                        nominal_val = _parse_numeric_token(tx)
-                    elif col == "actual":
-                        actual_val = _parse_numeric_token(tx)
-                    elif col == "deviation":
-                        dev_val = _parse_numeric_token(tx)
-                    elif col == "upper_tol":
-                        upper_val = _parse_numeric_token(tx)
-                    elif col == "lower_tol":
-                        lower_val = _parse_numeric_token(tx)
-
-                if dev_val is not None:
-                    # Example: H203 POS X
-                    feature_full = f"{current_parent_feature} {axis_row_label}"
-                    rows.append(
-                        (
-                            feature_full,
-                            dev_val,
-                            upper_val,
-                            lower_val,
-                            nominal_val,
-                            actual_val,
-                        )
-                    )
-
-                continue
-
-            # Otherwise, process normally (parent row or single-line feature)
-            for w in group:
-                tx = w["text"].strip()
-                x = w["x"]
-
-                if x < feature_limit_x:
-                    feature_tokens.append(tx)
-                else:
-                    if not _is_numeric_token(tx):
-                        continue
-
-                    col = column_for_x(x)
-                    if col == "nominal":
-                        nominal_candidates.append(tx)
-                    elif col == "actual":
-                        actual_candidates.append(tx)
-                    elif col == "deviation":
-                        deviation_candidates.append(tx)
-                    elif col == "upper_tol":
-                        upper_tol_candidates.append(tx)
-                    elif col == "lower_tol":
-                        lower_tol_candidates.append(tx)
-
-            feature_name = " ".join(feature_tokens).strip()
-
-            if not feature_name or not any(c.isalpha() for c in feature_name):
-                continue
-
-            lname = feature_name.lower()
-            if (
-                "plan name" in lname or
-                "part serial" in lname or
-                lname.startswith("date") or
-                "histogram" in lname or
-                "nominal" in lname or
-                "actual" in lname
-            ):
-                continue
-
-            # Detect POS X-Y-Z multi-parent row
-            if "pos x-y-z" in lname or "pos x-y-z" in lname:
-                current_parent_feature = feature_name.replace("X-Y-Z", "").strip()
-
-                if deviation_candidates:
-                    deviation_value = _parse_numeric_token(deviation_candidates[-1])
-                    nominal_value = _parse_numeric_token(nominal_candidates[-1]) if nominal_candidates else None
-                    actual_value = _parse_numeric_token(actual_candidates[-1]) if actual_candidates else None
-                    upper_tol_value = _parse_numeric_token(upper_tol_candidates[-1]) if upper_tol_candidates else None
-                    lower_tol_value = _parse_numeric_token(lower_tol_candidates[-1]) if lower_tol_candidates else None
-                    rows.append(
-                        (
-                            feature_name,
-                            deviation_value,
-                            upper_tol_value,
-                            lower_tol_value,
-                            nominal_value,
-                            actual_value,
-                        )
-                    )
-                continue
-
-            # Normal single-line feature
-            current_parent_feature = None
-
-            if deviation_candidates:
-                deviation_value = _parse_numeric_token(deviation_candidates[-1])
-                nominal_value = _parse_numeric_token(nominal_candidates[-1]) if nominal_candidates else None
-                actual_value = _parse_numeric_token(actual_candidates[-1]) if actual_candidates else None
-                upper_tol_value = _parse_numeric_token(upper_tol_candidates[-1]) if upper_tol_candidates else None
-                lower_tol_value = _parse_numeric_token(lower_tol_candidates[-1]) if lower_tol_candidates else None
-                rows.append(
-                    (
-                        feature_name,
-                        deviation_value,
-                        upper_tol_value,
-                        lower_tol_value,
-                        nominal_value,
-                        actual_value,
-                    )
-                )
-
-    return rows
 
+def _cmm_feature_store(
+    folder: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    part_type: Optional[str],
+    die_number: Optional[str],
+    errors: Optional[List[str]] = None,
+    refresh: bool = True,
+) -> FeatureStore:
+    """Return the matching report rows of *folder* as a columnar store.
 
+    With ``refresh=False`` the folder is not re-listed or parsed; the store
+    reflects whatever is indexed, e.g. while a streamed scan is running.
+    """
 
+    part_type_upper, die_filter = _cmm_filters(part_type, die_number)
+    if refresh:
+        _index_cmm_folder(folder, start_date, end_date, part_type_upper, die_filter, errors)
+    elif errors is not None:
+        records = CMM_INDEX.files(folder, start_date, end_date, part_type_upper, die_filter)
+        errors.extend(f"{r.name}: {r.error}" for r in records if r.error is not None)
 
+    key = (folder_key(folder), start_date, end_date, part_type_upper, die_filter, CMM_INDEX.generation)
+    store = _CMM_STORES.get(key)
+    if store is None:
+        with stage('cmm_rows'):
+            store = FeatureStore.from_rows(CMM_INDEX.rows(folder, start_date, end_date, part_type_upper, die_filter))
+        _CMM_STORES.put(key, store)
+    return store
 
 
 def _collect_cmm_data(
@@ -392,48 +368,14 @@ def _collect_cmm_data(
     """Scan PDFs in *folder* and return feature deviations keyed by feature name."""
 
     results: Dict[str, List[Dict[str, object]]] = {}
-    part_type_upper = part_type.upper() if part_type else None
-    die_filter = None
-
-    if die_number:
-        digits = "".join(ch for ch in die_number if ch.isdigit())
-        if digits:
-            if len(digits) >= 2:
-                digits = digits[-2:]
-            die_filter = digits.zfill(2)
-
-    for entry in sorted(os.listdir(folder)):
-        if not entry.lower().endswith('.pdf'):
-            continue
-
-        full_path = os.path.join(folder, entry)
-        if not os.path.isfile(full_path):
-            continue
-
-        if part_type_upper and part_type_upper not in entry.upper():
-            continue
-
-        if die_filter:
-            extracted_die = _extract_die_number(entry)
-            if extracted_die != die_filter:
-                continue
-
-        mtime = datetime.fromtimestamp(os.path.getmtime(full_path))
-        if start_date and mtime < start_date:
-            continue
-        if end_date and mtime > end_date:
-            continue
+    part_type_upper, die_filter = _cmm_filters(part_type, die_number)
 
-        try:
-            rows = _extract_cmm_rows(full_path)
-        except Exception as exc:
-            if errors is not None:
-                errors.append(f"{entry}: {exc}")
-            continue
-
-        for feature, deviation, upper_tol, lower_tol, nominal, actual in rows:
+    _index_cmm_folder(folder, start_date, end_date, part_type_upper, die_filter, errors)
+    with stage('cmm_rows'):
+        for entry, mtime, row in CMM_INDEX.rows(folder, start_date, end_date, part_type_upper, die_filter):
+            feature, deviation, upper_tol, lower_tol, nominal, actual = row
             results.setdefault(feature, []).append({
-                'date': mtime.isoformat(),
+                'date': datetime.fromtimestamp(mtime).isoformat(),
                 'deviation': deviation,
                 'upperTol': upper_tol,
                 'lowerTol': lower_tol,
@@ -442,8 +384,8 @@ def _collect_cmm_data(
                 'report': entry,
             })
 
-    for feature in results:
-        results[feature].sort(key=lambda r: r['date'])
+        for feature in results:
+            results[feature].sort(key=lambda r: r['date'])
 
     return results
 
@@ -457,23 +399,64 @@ def _parse_date(date_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
-@app.route('/api/cmm_summary', methods=['POST'])
-def cmm_summary():
-    payload = request.get_json(silent=True) or {}
-    folder = payload.get('folder')
-    part_type = payload.get('partType')
-    die_number = payload.get('dieNumber')
-    start_date = _parse_date(payload.get('startDate'))
-    end_date = _parse_date(payload.get('endDate'))
+def _parse_cmm_query(payload: Dict[str, object]):
+    """Return ``(query, None)`` for a trend request body, or ``(None, error response)``."""
 
+    folder = payload.get('folder')
     if not folder:
-        return {'error': 'Missing folder path'}, 400
+        return None, ({'error': 'Missing folder path'}, 400)
     if not os.path.isdir(folder):
-        return {'error': f'Folder does not exist: {folder}'}, 400
+        return None, ({'error': f'Folder does not exist: {folder}'}, 400)
     if fitz is None:
-        return {'error': 'PyMuPDF is required to parse CMM reports'}, 500
+        return None, ({'error': 'PyMuPDF is required to parse CMM reports'}, 500)
+    return {
+        'folder': folder,
+        'start_date': _parse_date(payload.get('startDate')),
+        'end_date': _parse_date(payload.get('endDate')),
+        'part_type': payload.get('partType'),
+        'die_number': payload.get('dieNumber'),
+    }, None
+
+
+@app.route('/api/cmm_summary', methods=['POST'])
+def cmm_summary():
+    payload = request.get_json(silent=True) or {}
+    query, error = _parse_cmm_query(payload)
+    if error:
+        return error
+    folder = query['folder']
+    part_type = query['part_type']
+    die_number = query['die_number']
+    start_date = query['start_date']
+    end_date = query['end_date']
+
+    if request.args.get('format') == 'ndjson':
+        detail = request.args.get('detail') != '0'
+        stream = _stream_cmm_summary(folder, start_date, end_date, part_type, die_number, detail)
+        return app.response_class(
+            stream_with_context(stream),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
 
     errors: List[str] = []
+    if request.args.get('format') == 'compact':
+        store = _cmm_feature_store(folder, start_date, end_date, part_type, die_number, errors)
+        with stage('serialize'):
+            return json.dumps({
+                'v': 1,
+                'reports': store.reports,
+                'dates': store.dates,
+                'features': store.aggregates(),
+                'series': {
+                    'offsets': store.offsets.tolist(),
+                    'report': store.report.tolist(),
+                    'deviation': store.series_column('deviation'),
+                },
+                'reportsAnalyzed': len(store.reports),
+                'errors': errors,
+            })
+
     data = _collect_cmm_data(folder, start_date, end_date, part_type, die_number, errors)
 
     features = []
@@ -494,7 +477,269 @@ def cmm_summary():
         'reportsAnalyzed': len(report_names),
         'errors': errors,
     }
-    return json.dumps(response)
+    with stage('serialize'):
+        return json.dumps(response)
+
+
+def _stream_cmm_summary(
+    folder: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    part_type: Optional[str],
+    die_number: Optional[str],
+    detail: bool = True,
+):
+    """Yield the trend summary as NDJSON events while reports are parsed.
+
+    Events, one JSON object per line:
+
+    - ``start``: ``files`` matching the filters, ``toParse`` of them new
+    - ``report``: one report's ``date`` and feature ``rows`` as
+      ``[feature, deviation, upperTol, lowerTol, nominal, actual]``;
+      indexed reports come first, then new ones as they are parsed
+    - ``progress``: ``parsed``/``failed`` counts out of ``toParse``
+    - ``stats``: per-feature aggregates (see ``FeatureStore.aggregates``)
+    - ``summary``: ``features``, ``reportsAnalyzed`` and ``errors``
+
+    Points are not sorted; clients order them by ``(date, report)``. With
+    ``detail=False`` only ``start``, ``progress`` and ``summary`` are sent,
+    for clients that page through ``/api/cmm_features`` instead.
+    """
+
+    part_type_upper, die_filter = _cmm_filters(part_type, die_number)
+    CMM_INDEX.sync(folder)
+    records = CMM_INDEX.files(folder, start_date, end_date, part_type_upper, die_filter)
+    pending = [r for r in records if not r.parsed]
+    yield json.dumps({'type': 'start', 'files': len(records), 'toParse': len(pending)}) + "\n"
+
+    reports = set()
+
+    def report_event(name: str, mtime: float, rows) -> str:
+        reports.add(name)
+        return json.dumps({
+            'type': 'report',
+            'report': name,
+            'date': datetime.fromtimestamp(mtime).isoformat(),
+            'rows': [list(row) for row in rows],
+        }) + "\n"
+
+    if detail:
+        indexed = CMM_INDEX.rows(folder, start_date, end_date, part_type_upper, die_filter)
+        for (name, mtime), group in groupby(indexed, key=lambda item: item[:2]):
+            yield report_event(name, mtime, [row for _name, _mtime, row in group])
+
+    parsed = failed = 0
+    pool = _get_cmm_pool() if pending else None
+    for record, rows in CMM_INDEX.parse_iter(pending, pool, app.config['CMM_FILE_TIMEOUT'] or None):
+        if record.error is not None:
+            failed += 1
+        else:
+            parsed += 1
+            # a concurrent scan may have indexed it before our rows query
+            if detail and rows and record.name not in reports:
+                yield report_event(record.name, record.mtime, rows)
+        yield json.dumps({'type': 'progress', 'parsed': parsed, 'failed': failed, 'toParse': len(pending)}) + "\n"
+
+    # Aggregates over everything matching, computed from the index
+    store = _cmm_feature_store(folder, start_date, end_date, part_type, die_number, refresh=False)
+    if detail:
+        yield json.dumps({'type': 'stats', 'features': store.aggregates()}) + "\n"
+
+    yield json.dumps({
+        'type': 'summary',
+        'features': len(store.names),
+        'reportsAnalyzed': len(store.reports),
+        'errors': [f"{r.name}: {r.error}" for r in records if r.error is not None],
+    }) + "\n"
+
+
+def _bounded_int(value, default: int, low: int, high: int) -> int:
+    """Parse *value* as an int clamped to ``[low, high]``; raises ValueError."""
+
+    if value is None:
+        return default
+    return min(high, max(low, int(value)))
+
+
+@app.route('/api/cmm_features', methods=['POST'])
+def cmm_features():
+    """One page of trend features with their aggregates and sparkline series.
+
+    Body: the ``/api/cmm_summary`` filters plus ``offset``, ``limit``
+    (default 50), ``sort`` (``name``, ``cpk`` or ``outOfTolerance``),
+    ``width`` (sparkline points, default 140) and ``refresh`` (default
+    true; false skips re-listing and parsing the folder).
+    """
+
+    payload = request.get_json(silent=True) or {}
+    query, error = _parse_cmm_query(payload)
+    if error:
+        return error
+    try:
+        offset = _bounded_int(payload.get('offset'), 0, 0, 10 ** 9)
+        limit = _bounded_int(payload.get('limit'), 50, 1, 500)
+        width = _bounded_int(payload.get('width'), 140, 16, 2000)
+    except (TypeError, ValueError):
+        return {'error': 'invalid offset, limit or width'}, 400
+    sort = payload.get('sort') or 'name'
+    if sort not in ('name', 'cpk', 'outOfTolerance'):
+        return {'error': 'unknown sort'}, 400
+
+    errors: List[str] = []
+    store = _cmm_feature_store(**query, errors=errors, refresh=payload.get('refresh', True) is not False)
+    page = store.order(sort)[offset:offset + limit]
+
+    # Sparkline series reference a report table local to this page.
+    local: Dict[int, int] = {}
+    series = []
+    for index in page:
+        points = store.series(index, width)
+        series.append({
+            'total': points['total'],
+            'index': points['index'],
+            'report': [local.setdefault(r, len(local)) for r in points['report']],
+            'deviation': points['deviation'],
+            'outOfTolerance': points['outOfTolerance'],
+        })
+
+    return json.dumps({
+        'total': len(store.names),
+        'offset': offset,
+        'limit': limit,
+        'sort': sort,
+        'features': store.select(page),
+        'series': series,
+        'reports': [store.reports[r] for r in local],
+        'dates': [store.dates[r] for r in local],
+        'reportsAnalyzed': len(store.reports),
+        'errors': errors,
+    })
+
+
+@app.route('/api/cmm_series', methods=['POST'])
+def cmm_series():
+    """All points of one feature (``feature``), or ``width`` of them downsampled."""
+
+    payload = request.get_json(silent=True) or {}
+    query, error = _parse_cmm_query(payload)
+    if error:
+        return error
+    name = payload.get('feature')
+    if not name:
+        return {'error': 'Missing feature name'}, 400
+    try:
+        width = None if payload.get('width') is None else _bounded_int(payload.get('width'), 0, 16, 100000)
+    except (TypeError, ValueError):
+        return {'error': 'invalid width'}, 400
+
+    store = _cmm_feature_store(**query, refresh=payload.get('refresh', True) is not False)
+    index = bisect_left(store.names, name)
+    if index >= len(store.names) or store.names[index] != name:
+        return {'error': f'Unknown feature: {name}'}, 404
+
+    points = store.series(index, width)
+    reports = points['report']
+    points['report'] = [store.reports[r] for r in reports]
+    points['date'] = [store.dates[r] for r in reports]
+    stats = store.select([index])
+    return json.dumps({
+        'name': name,
+        'stats': {key: values[0] for key, values in stats.items()},
+        'series': points,
+    })
+
+
+_CMM_EXPORT_COLUMNS = ['report', 'date', 'feature', 'deviation', 'upperTol', 'lowerTol', 'nominal', 'actual']
+
+
+@app.route('/api/cmm_export', methods=['POST'])
+def cmm_export():
+    """Stream the points of the features matching ``feature`` (a GLOB) across reports.
+
+    One record per point in report date order, as NDJSON objects or, with
+    ``?format=csv``, CSV rows under a header. Reports are indexed first
+    unless ``refresh`` is false; the features are looked up in the index.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    query, error = _parse_cmm_query(payload)
+    if error:
+        return error
+    pattern = payload.get('feature')
+    if not pattern or not isinstance(pattern, str):
+        return {'error': 'Missing feature name or pattern'}, 400
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return {'error': f'Unknown format: {fmt}'}, 400
+
+    folder = query['folder']
+    start_date, end_date = query['start_date'], query['end_date']
+    part_type_upper, die_filter = _cmm_filters(query['part_type'], query['die_number'])
+    if payload.get('refresh', True) is not False:
+        _index_cmm_folder(folder, start_date, end_date, part_type_upper, die_filter)
+    rows = CMM_INDEX.rows(folder, start_date, end_date, part_type_upper, die_filter, feature=pattern, by_date=True)
+
+    def records():
+        for name, mtime, row in rows:
+            yield [name, datetime.fromtimestamp(mtime).isoformat(), *row]
+
+    def stream_ndjson():
+        chunk = []
+        for record in records():
+            chunk.append(json.dumps(dict(zip(_CMM_EXPORT_COLUMNS, record))))
+            if len(chunk) >= 1000:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+
+    def stream_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(_CMM_EXPORT_COLUMNS)
+        for count, record in enumerate(records(), 1):
+            writer.writerow(record)
+            if count % 1000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if fmt == 'csv':
+        return app.response_class(
+            stream_with_context(stream_csv()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename="cmm-export.csv"'},
+        )
+    return app.response_class(stream_with_context(stream_ndjson()), mimetype='application/x-ndjson')
+
+
+_cmm_watcher: Optional[FolderWatcher] = None
+
+
+def start_cmm_watcher() -> Optional[FolderWatcher]:
+    """Start ingesting the ``CMM_WATCH`` folders, if any are configured."""
+
+    global _cmm_watcher
+    if _cmm_watcher is None and app.config['CMM_WATCH']:
+        _cmm_watcher = FolderWatcher(
+            CMM_INDEX,
+            app.config['CMM_WATCH'],
+            pool=_get_cmm_pool,
+            interval=app.config['CMM_WATCH_INTERVAL'],
+            settle=app.config['CMM_WATCH_SETTLE'],
+            max_queue=app.config['CMM_WATCH_QUEUE'],
+            timeout=app.config['CMM_FILE_TIMEOUT'] or None,
+        )
+        _cmm_watcher.start()
+    return _cmm_watcher
+
+
+@app.route('/api/cmm_watch')
+def cmm_watch_status():
+    if _cmm_watcher is None:
+        return {'enabled': False, 'folders': app.config['CMM_WATCH']}
+    return _cmm_watcher.status()
 
 
 @app.route('/textdiff')
@@ -504,120 +749,292 @@ def textdiff():
         return {'error': 'PyMuPDF not installed on server'}, 500
     left_name = request.args.get('l')
     right_name = request.args.get('r')
-    page = int(request.args.get('page', '1'))
     if not left_name or not right_name:
         return {'error': 'missing filenames'}, 400
+    try:
+        page = int(request.args.get('page', '1'))
+        # right-hand page from /api/alignment when the documents are out of step
+        right_page = int(request.args.get('rpage', page))
+    except ValueError:
+        return {'error': 'invalid page or rpage'}, 400
+    if page < 1 or right_page < 1:
+        return {'error': 'invalid page or rpage'}, 400
 
-    left_path = os.path.join(app.config['UPLOAD_FOLDER'], left_name)
-    right_path = os.path.join(app.config['UPLOAD_FOLDER'], right_name)
-    if not os.path.exists(left_path) or not os.path.exists(right_path):
+    left_path = _upload_path(left_name)
+    right_path = _upload_path(right_name)
+    if not left_path or not right_path:
         return {'error': 'file not found'}, 404
 
-    def deviation_score(text: str) -> int:
-        """Return a simple deviation metric for strings like "--|".
-
-        A lower score indicates a value closer to nominal. Ignore numbers so
-        regular values aren't treated as deviation markers.
-        """
-
-        if any(c.isdigit() for c in text):
-            return -1
-        if '-' not in text and '|' not in text:
-            return -1
-        return text.count('-')
-
-    def dash_metric(text: str) -> int:
-        """Return the dash count used for coloring overlays."""
-
-        if any(c.isdigit() for c in text):
-            return 0
-        return text.count('-') + text.count('|')
-
-    def extract_words(path, page_num):
-        doc = fitz.open(path)
-        if page_num < 1 or page_num > doc.page_count:
-            return []
-        p = doc.load_page(page_num-1)
-        # words: list of tuples (x0, y0, x1, y1, word)
-        words = p.get_text('words')
-        # page size
-        rect = p.rect
-        pw = rect.width
-        ph = rect.height
-        items = []
-        for w in words:
-            x0,y0,x1,y1,text = w[0],w[1],w[2],w[3],w[4]
-            tn = normalize_text(text)
-            if tn.strip() == '':
-                continue
-            items.append({
-                'text': text,
-                'norm': tn,
-                'x0': x0/pw,
-                'y0': y0/ph,
-                'x1': x1/pw,
-                'y1': y1/ph,
-            })
-        return items
-
-    left_words = extract_words(left_path, page)
-    right_words = extract_words(right_path, page)
-
-    # compare: for each left word, find matching right word by normalized text and overlap
-    def intersects(a,b):
-        return not (a['x1'] < b['x0'] or a['x0'] > b['x1'] or a['y1'] < b['y0'] or a['y0'] > b['y1'])
-
-    matched_right = [False]*len(right_words)
-    left_boxes = []
-    for lw in left_words:
-        found = False
-        for i,rw in enumerate(right_words):
-            if matched_right[i]:
-                continue
-            if lw['norm'] == rw['norm'] and intersects(lw,rw):
-                matched_right[i] = True
-                found = True
-                break
-        if not found:
-            left_boxes.append({
-                'box': [lw['x0'], lw['y0'], lw['x1'], lw['y1']],
-                'text': lw['text'],
-                'dashCount': dash_metric(lw['text'])
-            })
+    fmt = request.args.get('format', 'full')
+    if fmt not in ('full', 'compact'):
+        return {'error': 'unknown format'}, 400
+    engine = request.args.get('engine', 'box')
+    if engine not in ENGINES:
+        return {'error': 'unknown engine'}, 400
+
+    # The payload is fully determined by both documents' content and the page,
+    # so the ETag can be checked before any diff work happens.
+    etag = hashlib.sha1(
+        f"{payload_tag()}:{file_digest(left_path)}:{file_digest(right_path)}:{page}:{right_page}:{engine}:{fmt}".encode()
+    ).hexdigest()
+    # gzip and identity bodies are different representations: distinct ETags
+    for tag in (etag, etag + _GZIP_ETAG_SUFFIX):
+        if request.if_none_match.contains(tag):
+            return _textdiff_response(b'', tag, status=304)
+
+    use_gzip = 'gzip' in request.accept_encodings
+    cached = _TEXTDIFF_BODIES.get((etag, use_gzip))
+    if cached is not None:
+        return _textdiff_response(cached[0], etag, gzipped=cached[1])
+
+    # only the default same-page comparison is precomputed after upload
+    if right_page == page and engine == 'box':
+        # Waits if the background worker is on this page right now;
+        # otherwise claims the page so the worker does not diff it too.
+        with stage('precompute_wait'):
+            payload = PRECOMPUTE.get(left_path, right_path, page, wait=app.config['DIFF_PAGE_TIMEOUT'] or None)
+        if payload is None:
+            try:
+                result = _diff_page(left_path, right_path, page)
+                with stage('serialize'):
+                    payload = json.dumps(result)
+                PRECOMPUTE.store(left_path, right_path, page, payload)
+            finally:
+                PRECOMPUTE.release(left_path, right_path, page)
+    else:
+        result = _diff_page(left_path, right_path, page, right_page, engine)
+        with stage('serialize'):
+            payload = json.dumps(result)
+    with stage('serialize'):
+        if fmt == 'compact':
+            payload = json.dumps(encode_compact(json.loads(payload)), separators=(',', ':'))
+        body = payload.encode('utf-8')
+
+    gzipped = use_gzip and len(body) >= _GZIP_MIN_BYTES
+    if gzipped:
+        with stage('gzip'):
+            body = gzip.compress(body, compresslevel=6)
+    _TEXTDIFF_BODIES.put((etag, use_gzip), (body, gzipped), len(body))
+    return _textdiff_response(body, etag, gzipped=gzipped)
+
+
+_GZIP_MIN_BYTES = 1400
+_GZIP_ETAG_SUFFIX = '-gz'
+# Encoded (and possibly gzipped) /textdiff bodies keyed by (etag, gzip)
+_TEXTDIFF_BODIES = LRUCache(max_entries=4096, max_bytes=32 * 1024 * 1024)
+
+
+def _textdiff_response(body: bytes, etag: str, status: int = 200, gzipped: bool = False):
+    resp = app.response_class(body, status=status, mimetype='application/json')
+    resp.set_etag(etag + _GZIP_ETAG_SUFFIX if gzipped else etag)
+    # always revalidate; unchanged pages come back as an empty 304
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.vary.add('Accept-Encoding')
+    if gzipped:
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
+
+
+@app.route('/api/docinfo')
+def docinfo():
+    # page count and page sizes (in points) for the viewer's layout
+    if fitz is None:
+        return {'error': 'PyMuPDF not installed on server'}, 500
+    name = request.args.get('f')
+    if not name:
+        return {'error': 'missing filename'}, 400
+    path = _upload_path(name)
+    if not path:
+        return {'error': 'file not found'}, 404
 
-    right_boxes = []
-    matched_left = [False]*len(left_words)
-    for i,rw in enumerate(right_words):
-        found = False
-        for lw in left_words:
-            if rw['norm'] == lw['norm'] and intersects(rw,lw):
-                found = True
-                break
-        if not found:
-            # only count dashes/pipes if text contains no numbers
-            dashCount = dash_metric(rw['text'])
-            deviation = deviation_score(rw['text'])
-            improved = False
-            if deviation >= 0 and '|' in rw['text']:
-                for lw in left_words:
-                    left_deviation = deviation_score(lw['text'])
-                    if left_deviation < 0:
-                        continue
-                    if rw['text'].count('|') != lw['text'].count('|'):
-                        continue
-                    if not intersects(rw, lw):
-                        continue
-                    if deviation < left_deviation:
-                        improved = True
-                        break
-            right_boxes.append({
-                'box': [rw['x0'], rw['y0'], rw['x1'], rw['y1']],
-                'text': rw['text'],
-                'dashCount': dashCount,
-                'improved': improved
-            })
+    with DOCUMENTS.document(path) as doc:
+        sizes = [[p.rect.width, p.rect.height] for p in doc]
+    return {'pageCount': len(sizes), 'pageSizes': sizes}
+
+
+@app.route('/render')
+def render_page():
+    # returns a PNG of one page (or one 512px tile) at the viewer's zoom level
+    if fitz is None:
+        return {'error': 'PyMuPDF not installed on server'}, 500
+    name = request.args.get('f')
+    if not name:
+        return {'error': 'missing filename'}, 400
+    path = _upload_path(name)
+    if not path:
+        return {'error': 'file not found'}, 404
+    try:
+        page = int(request.args.get('page', '1'))
+        scale = quantize_scale(float(request.args.get('scale', '1')))
+        tile = request.args.get('tile')
+        if tile:
+            col, row = (int(v) for v in tile.split(','))
+            tile = (col, row)
+        else:
+            tile = None
+    except ValueError:
+        return {'error': 'invalid page, scale or tile'}, 400
+
+    etag = f"{file_digest(path)}-{page}-{scale:g}" + (f"-{tile[0]}_{tile[1]}" if tile else "")
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        try:
+            data = RENDERS.get(path, page, scale, tile)
+        except IndexError as exc:
+            return {'error': str(exc)}, 404
+        resp = app.response_class(data, mimetype='image/png')
+        if tile is None:
+            RENDERS.prefetch(path, (page + 1, page - 1), scale)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+@app.route('/api/precompute_status')
+def precompute_status():
+    left_name = request.args.get('l')
+    right_name = request.args.get('r')
+    if not left_name or not right_name:
+        return {'error': 'missing filenames'}, 400
 
-    return json.dumps({'left': left_boxes, 'right': right_boxes})
+    left_path = _upload_path(left_name)
+    right_path = _upload_path(right_name)
+    if not left_path or not right_path:
+        return {'error': 'file not found'}, 404
+    return PRECOMPUTE.status(left_path, right_path)
+
+
+_diff_pool: Optional[TaskPool] = None
+
+
+def _get_diff_pool() -> TaskPool:
+    global _diff_pool
+    if _diff_pool is None:
+        _diff_pool = TaskPool(
+            app.config['DIFF_WORKERS'],
+            initializer=configure_artifacts,
+            initargs=(ARTIFACTS.root,),
+        )
+    return _diff_pool
+
+
+# Whole-document diffs get a pool of their own: a page that times out kills
+# every worker of its pool, which should not cost the interactive requests
+# running on the diff pool their work.
+_batch_pool: Optional[TaskPool] = None
+
+
+def _get_batch_pool() -> TaskPool:
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = TaskPool(
+            app.config['DIFF_WORKERS'],
+            initializer=configure_artifacts,
+            initargs=(ARTIFACTS.root,),
+        )
+    return _batch_pool
+
+
+@app.route('/api/docdiff')
+def docdiff():
+    # returns per-page boxes for every page plus a summary of changed pages
+    if fitz is None:
+        return {'error': 'PyMuPDF not installed on server'}, 500
+    left_name = request.args.get('l')
+    right_name = request.args.get('r')
+    if not left_name or not right_name:
+        return {'error': 'missing filenames'}, 400
+
+    left_path = _upload_path(left_name)
+    right_path = _upload_path(right_name)
+    if not left_path or not right_path:
+        return {'error': 'file not found'}, 404
+
+    try:
+        page_timeout = float(request.args.get('timeout', app.config['DIFF_PAGE_TIMEOUT']))
+    except ValueError:
+        return {'error': 'invalid timeout'}, 400
+
+    engine = request.args.get('engine', 'box')
+    if engine not in ENGINES:
+        return {'error': 'unknown engine'}, 400
+
+    rows = align_documents(left_path, right_path)['rows'] if request.args.get('align') == '1' else None
+    result = diff_document(left_path, right_path, _get_batch_pool(), page_timeout or None, rows, engine)
+    return json.dumps(result)
+
+
+@app.route('/api/multidiff', methods=['POST'])
+def multidiff():
+    # change matrix (candidate x page) of many documents against one base
+    if fitz is None:
+        return {'error': 'PyMuPDF not installed on server'}, 500
+    payload = request.get_json(silent=True) or {}
+    base_name = payload.get('base')
+    names = payload.get('candidates')
+    if not base_name or not names or not isinstance(names, list):
+        return {'error': 'missing base or candidates'}, 400
+
+    base_path = _upload_path(base_name)
+    paths = [_upload_path(str(name)) for name in names]
+    if not base_path or not all(paths):
+        return {'error': 'file not found'}, 404
+
+    engine = payload.get('engine', 'box')
+    if engine not in ENGINES:
+        return {'error': 'unknown engine'}, 400
+    try:
+        page_timeout = float(payload.get('timeout', app.config['DIFF_PAGE_TIMEOUT']))
+    except (TypeError, ValueError):
+        return {'error': 'invalid timeout'}, 400
+
+    try:
+        with stage('worker'):
+            result = compare_many(base_path, paths, _get_batch_pool(), page_timeout or None, engine)
+    except ValueError as exc:
+        return {'error': str(exc)}, 400
+
+    labels = upload_labels(app.config['UPLOAD_FOLDER'])
+    base_file = os.path.basename(base_path)
+    result['base'] = {'name': base_file, 'label': labels.get(base_file, base_file)}
+    for path, candidate in zip(paths, result['candidates']):
+        candidate['name'] = os.path.basename(path)
+        candidate['label'] = labels.get(candidate['name'], candidate['name'])
+    return result
+
+
+@app.route('/api/alignment')
+def alignment():
+    # page mapping between documents with inserted or removed pages
+    if fitz is None:
+        return {'error': 'PyMuPDF not installed on server'}, 500
+    left_name = request.args.get('l')
+    right_name = request.args.get('r')
+    if not left_name or not right_name:
+        return {'error': 'missing filenames'}, 400
+
+    left_path = _upload_path(left_name)
+    right_path = _upload_path(right_name)
+    if not left_path or not right_path:
+        return {'error': 'file not found'}, 404
+    return align_documents(left_path, right_path)
+
+
+@app.route('/api/cache_stats')
+def cache_stats_view():
+    return dict(cache_stats(), render=RENDERS.stats())
+
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus text exposition of request/stage latencies, counters and cache hit rates."""
+
+    caches = dict(cache_stats())
+    caches['render'] = RENDERS.stats()['memory']
+    caches['textdiffBodies'] = _TEXTDIFF_BODIES.stats()
+    caches['cmmStores'] = _CMM_STORES.stats()
+    return app.response_class(metrics.render(caches), mimetype='text/plain; version=0.0.4')
 
 
 def _find_free_port(host: str) -> int:
@@ -668,7 +1085,43 @@ def _auto_launch_browser(host: str, port: int):
     threading.Timer(1.0, _open).start()
 
 
-def _run_app():
+def _serve(host: str, port: int):
+    if app.config['SERVER'] != 'production':
+        app.run(host=host, port=port, debug=True, use_reloader=False)
+        return
+
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress is not installed (pip install waitress); "
+              "falling back to the threaded development server without the debugger.")
+        app.run(host=host, port=port, debug=False, threaded=True, use_reloader=False)
+        return
+
+    pymupdf = "the server process"
+    if app.config['OFFLOAD_PYMUPDF']:
+        pymupdf = f"{app.config['DIFF_WORKERS']} worker processes"
+        # Spawning a worker imports PyMuPDF; do it before the first request.
+        _get_diff_pool().warm_up()
+    print(f"Production server: {app.config['SERVER_THREADS']} request threads, PyMuPDF work in {pymupdf}")
+    serve(app, host=host, port=port, threads=app.config['SERVER_THREADS'], ident="pdf-compare")
+
+
+def _run_app(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PDF Compare server")
+    parser.add_argument('--production', action='store_true',
+                        help='serve with waitress and diff pages in worker processes (PDF_COMPARE_SERVER=production)')
+    parser.add_argument('--threads', type=int, help='request threads in production mode (PDF_COMPARE_THREADS)')
+    args, _unknown = parser.parse_known_args(argv)
+    if args.production:
+        app.config['SERVER'] = 'production'
+        if "PDF_COMPARE_OFFLOAD_PYMUPDF" not in os.environ:
+            app.config['OFFLOAD_PYMUPDF'] = True
+    if args.threads:
+        app.config['SERVER_THREADS'] = args.threads
+
     # Default to a localhost-only host on Windows to avoid corporate socket restrictions
     host_hint = os.environ.get("PDF_COMPARE_HOST")
     port_hint = os.environ.get("PDF_COMPARE_PORT")
@@ -677,9 +1130,14 @@ def _run_app():
     if note:
         print("\n" + note + "\n")
 
-    _auto_launch_browser(host, port)
-    app.run(host=host, port=port, debug=True, use_reloader=False)
+    start_cmm_watcher()
+    if os.environ.get("PDF_COMPARE_OPEN_BROWSER", "1") != "0":
+        _auto_launch_browser(host, port)
+    _serve(host, port)
 
 
 if __name__ == '__main__':
+    # Needed for process pools inside the frozen PyInstaller executable
+    import multiprocessing
+    multiprocessing.freeze_support()
     _run_app()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Compare batches of PDF pairs without the web UI.
+
+Usage:
+  python batch_compare.py LEFT_DIR RIGHT_DIR [-o report.json]
+  python batch_compare.py --manifest pairs.csv [-o report.json]
+
+With two directories, PDFs are paired by filename; files present on one
+side only are listed under ``leftOnly`` / ``rightOnly``. A manifest is either CSV rows of
+``left,right[,name]`` or a JSON list of ``[left, right]`` pairs or
+``{"left", "right", "name"}`` objects; relative paths are resolved against
+the manifest's folder.
+
+Every page of every pair is diffed with the same word extraction and
+matching as ``/textdiff``, spread over a process pool so a batch of small
+documents keeps all workers busy. The JSON report lists, per pair, the
+changed pages with their box counts, failed pages and the seconds spent
+on the pair's pages, plus overall throughput in pages per second. The exit
+status is 0 when no pair changed, 1 when any did, 2 when a pair failed.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from content_store import configure_artifacts
+from textcompare import ENGINES, diff_page, page_count
+from workerpool import TaskPool, default_workers
+
+
+def _pair_rows(left_path: str, right_path: str, align: bool) -> List[List[int]]:
+    """Return the ``[left page, right page]`` rows to compare for one pair."""
+
+    if align:
+        from page_align import align_documents
+        return align_documents(left_path, right_path)['rows']
+    pages = max(page_count(left_path), page_count(right_path))
+    return [[p, p] for p in range(1, pages + 1)]
+
+
+def _compare_page(left_path: str, right_path: str, left_page: int, right_page: int, engine: str, boxes: bool):
+    """Diff one row in a worker; returns box counts (and the boxes if asked) plus seconds."""
+
+    started = time.perf_counter()
+    result = diff_page(left_path, right_path, left_page, right_page, engine)
+    out = {'left': len(result['left']), 'right': len(result['right'])}
+    if boxes and (out['left'] or out['right']):
+        out['boxes'] = result
+    out['seconds'] = time.perf_counter() - started
+    return out
+
+
+def pairs_from_dirs(left_dir: str, right_dir: str) -> Tuple[List[Dict[str, str]], Dict[str, List[str]]]:
+    """Pair the PDFs of two folders by filename."""
+
+    def pdfs(folder):
+        return {name: os.path.join(folder, name) for name in os.listdir(folder)
+                if name.lower().endswith('.pdf') and os.path.isfile(os.path.join(folder, name))}
+
+    left, right = pdfs(left_dir), pdfs(right_dir)
+    pairs = [{'name': name, 'left': left[name], 'right': right[name]} for name in sorted(left.keys() & right.keys())]
+    unpaired = {'leftOnly': sorted(left.keys() - right.keys()), 'rightOnly': sorted(right.keys() - left.keys())}
+    return pairs, unpaired
+
+
+def pairs_from_manifest(path: str) -> List[Dict[str, str]]:
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8', newline='') as fh:
+        if path.lower().endswith('.json'):
+            entries = json.load(fh)
+        else:
+            entries = [row for row in csv.reader(fh) if row and not row[0].startswith('#')]
+
+    pairs = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            left, right, name = entry['left'], entry['right'], entry.get('name')
+        else:
+            left, right = entry[0].strip(), entry[1].strip()
+            name = entry[2].strip() if len(entry) > 2 else None
+        left = os.path.join(base, left)
+        right = os.path.join(base, right)
+        pairs.append({'name': name or os.path.basename(left), 'left': left, 'right': right})
+    return pairs
+
+
+def compare_pairs(
+    pairs: List[Dict[str, str]],
+    pool: TaskPool,
+    engine: str = 'box',
+    page_timeout: Optional[float] = None,
+    align: bool = False,
+    boxes: bool = False,
+) -> Dict[str, object]:
+    """Diff every page of every pair on *pool* and return the batch report."""
+
+    started = time.perf_counter()
+    results = [
+        {'name': p['name'], 'left': p['left'], 'right': p['right'], 'pageCount': 0, 'pages': [],
+         'failedPages': [], 'seconds': 0.0, 'error': None}
+        for p in pairs
+    ]
+
+    # Page counts (or alignments) are read in the workers too.
+    rows: List[List[List[int]]] = [[] for _ in pairs]
+    tasks = [(p['left'], p['right'], align) for p in pairs]
+    for idx, pair_rows, error in pool.imap(_pair_rows, tasks):
+        if error is not None:
+            results[idx]['error'] = str(error) or type(error).__name__
+        else:
+            rows[idx] = pair_rows
+            results[idx]['pageCount'] = len(pair_rows)
+
+    page_tasks = []
+    owners = []
+    for idx, pair in enumerate(pairs):
+        for row, (left_page, right_page) in enumerate(rows[idx], 1):
+            page_tasks.append((pair['left'], pair['right'], left_page, right_page, engine, boxes))
+            owners.append((idx, row))
+
+    for task_idx, page, error in pool.imap(_compare_page, page_tasks, timeout=page_timeout):
+        idx, row = owners[task_idx]
+        result = results[idx]
+        if error is not None:
+            result['failedPages'].append({'page': row, 'error': str(error) or type(error).__name__})
+            continue
+        result['seconds'] += page['seconds']
+        if page['left'] or page['right']:
+            left_page, right_page = page_tasks[task_idx][2:4]
+            entry = {'page': row, 'leftPage': left_page, 'rightPage': right_page,
+                     'left': page['left'], 'right': page['right']}
+            if 'boxes' in page:
+                entry['boxes'] = page['boxes']
+            result['pages'].append(entry)
+
+    for result in results:
+        result['pages'].sort(key=lambda p: p['page'])
+        result['failedPages'].sort(key=lambda p: p['page'])
+        result['changedPages'] = [p['page'] for p in result['pages']]
+        result['totalChanges'] = sum(p['left'] + p['right'] for p in result['pages'])
+        result['seconds'] = round(result['seconds'], 4)
+
+    elapsed = time.perf_counter() - started
+    total_pages = sum(r['pageCount'] for r in results)
+    return {
+        'engine': engine,
+        'workers': pool.workers,
+        'pairs': results,
+        'summary': {
+            'pairs': len(results),
+            'changedPairs': sum(1 for r in results if r['changedPages']),
+            'failedPairs': sum(1 for r in results if r['error'] or r['failedPages']),
+            'pages': total_pages,
+            'seconds': round(elapsed, 3),
+            'pagesPerSecond': round(total_pages / elapsed, 2) if elapsed > 0 else None,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('left_dir', nargs='?', help='folder of reference PDFs')
+    parser.add_argument('right_dir', nargs='?', help='folder of PDFs to check, paired by filename')
+    parser.add_argument('--manifest', help='CSV or JSON list of left/right pairs instead of two folders')
+    parser.add_argument('-o', '--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--timeout', type=float, default=30, help='seconds per page, 0 for no limit')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='box')
+    parser.add_argument('--align', action='store_true', help='align inserted or removed pages first')
+    parser.add_argument('--boxes', action='store_true', help='include the changed boxes in the report')
+    parser.add_argument('--cache', help='folder for extracted words, reused across runs')
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        pairs, unpaired = pairs_from_manifest(args.manifest), {'leftOnly': [], 'rightOnly': []}
+    elif args.left_dir and args.right_dir:
+        pairs, unpaired = pairs_from_dirs(args.left_dir, args.right_dir)
+    else:
+        parser.error('give LEFT_DIR and RIGHT_DIR, or --manifest')
+
+    configure_artifacts(args.cache)
+    pool = TaskPool(args.workers, initializer=configure_artifacts, initargs=(args.cache,))
+    try:
+        report = compare_pairs(pairs, pool, args.engine, args.timeout or None, args.align, args.boxes)
+    finally:
+        pool.shutdown()
+    report.update(unpaired)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+    summary = report['summary']
+    print(
+        f"Compared {summary['pairs']} pair(s), {summary['pages']} page(s) in {summary['seconds']:.2f}s "
+        f"({summary['pagesPerSecond'] or 0:.1f} pages/s): {summary['changedPairs']} changed, "
+        f"{summary['failedPairs']} with errors",
+        file=sys.stderr,
+    )
+    if summary['failedPairs']:
+        return 2
+    return 1 if summary['changedPairs'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Benchmark CMM report row extraction against the original implementation.
+
+Usage: python benchmarks/bench_cmm_extract.py [--reports 20] [--pages 4] [--features 40]
+
+Synthetic ZEISS-style reports (a header row, single-line features and
+POS X-Y-Z blocks with X/Y/Z child rows) are written with PyMuPDF to a
+temporary folder. The table shows pages per second for the row parser
+alone (words already extracted) and end to end (open, extract, parse);
+the rows of every report are checked to be identical to the original
+parser's, including the sign of zero deviations.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402
+
+from bench_matcher import best_of  # noqa: E402
+from cmm_report import extract_cmm_rows, parse_numeric_token, rows_from_words  # noqa: E402
+from synthetic import write_cmm_report  # noqa: E402
+
+
+def _legacy_is_numeric(token):
+    import re
+    return re.match(r'^[+-]?\d[\d,]*(\.\d+)?$', token) is not None
+
+
+def legacy_rows_from_words(page_words):
+    """The row parser of the original ``_extract_cmm_rows``, unchanged."""
+
+    rows = []
+
+    for words in page_words:
+        if not words:
+            continue
+
+        # Locate header columns
+        nominal_x = actual_x = deviation_x = hist_x = None
+        upper_tol_x = lower_tol_x = None
+
+        for x0, y0, x1, y1, text, *_ in words:
+            if text == "Nominal":
+                nominal_x = x0
+            elif text == "Actual":
+                actual_x = x0
+            elif text == "Deviation":
+                deviation_x = x0
+            elif text == "Histogram":
+                hist_x = x0
+            elif text.lower().startswith("upper"):
+                upper_tol_x = x0
+            elif text.lower().startswith("lower"):
+                lower_tol_x = x0
+
+        if actual_x is None or deviation_x is None or hist_x is None:
+            continue
+
+        columns = [
+            ("nominal", nominal_x) if nominal_x is not None else None,
+            ("actual", actual_x),
+            ("deviation", deviation_x),
+            ("upper_tol", upper_tol_x) if upper_tol_x is not None else None,
+            ("lower_tol", lower_tol_x) if lower_tol_x is not None else None,
+            ("histogram", hist_x),
+        ]
+        columns = [c for c in columns if c is not None]
+        columns.sort(key=lambda c: c[1])
+
+        first_column_x = columns[0][1]
+        feature_limit_x = first_column_x - 5
+
+        def column_for_x(x_val: float) -> Optional[str]:
+            """Assign an x-position to the nearest header column using midpoints."""
+
+            for idx, (name, col_x) in enumerate(columns):
+                left_bound = -float("inf") if idx == 0 else (columns[idx - 1][1] + col_x) / 2
+                right_bound = float("inf") if idx == len(columns) - 1 else (col_x + columns[idx + 1][1]) / 2
+                if left_bound <= x_val < right_bound:
+                    return name
+            return None
+
+        # Convert to row clusters by Y
+        items = []
+        for (x0, y0, x1, y1, text, *_) in words:
+            y_center = (y0 + y1) / 2
+            items.append({"x": x0, "y": y_center, "text": text})
+
+        items.sort(key=lambda w: (w["y"], w["x"]))
+
+        row_groups = []
+        current = []
+        last_y = None
+
+        for w in items:
+            if last_y is None or abs(w["y"] - last_y) <= 1.0:
+                current.append(w)
+            else:
+                row_groups.append(current)
+                current = [w]
+            last_y = w["y"]
+
+        if current:
+            row_groups.append(current)
+
+        # Parent state
+        current_parent_feature = None
+
+        def parse_axis_row(text):
+            return text in ("X", "Y", "Z")
+
+        for group in row_groups:
+            feature_tokens = []
+            deviation_candidates = []
+            nominal_candidates = []
+            actual_candidates = []
+            upper_tol_candidates = []
+            lower_tol_candidates = []
+            axis_row_label = None
+
+            # Detect axis-only child rows
+            for w in group:
+                if parse_axis_row(w["text"].strip()):
+                    axis_row_label = w["text"].strip()
+
+            # Handle axis child rows → create separate features
+            if axis_row_label and current_parent_feature:
+                # collect deviation number
+                dev_val = upper_val = lower_val = nominal_val = actual_val = None
+                for w in group:
+                    tx = w["text"].strip()
+                    if not _legacy_is_numeric(tx):
+                        continue
+
+                    col = column_for_x(w["x"])
+                    if col == "nominal":
+                        nominal_val = parse_numeric_token(tx)
+                    elif col == "actual":
+                        actual_val = parse_numeric_token(tx)
+                    elif col == "deviation":
+                        dev_val = parse_numeric_token(tx)
+                    elif col == "upper_tol":
+                        upper_val = parse_numeric_token(tx)
+                    elif col == "lower_tol":
+                        lower_val = parse_numeric_token(tx)
+
+                if dev_val is not None:
+                    # Example: H203 POS X
+                    feature_full = f"{current_parent_feature} {axis_row_label}"
+                    rows.append(
+                        (
+                            feature_full,
+                            dev_val,
+                            upper_val,
+                            lower_val,
+                            nominal_val,
+                            actual_val,
+                        )
+                    )
+
+                continue
+
+            # Otherwise, process normally (parent row or single-line feature)
+            for w in group:
+                tx = w["text"].strip()
+                x = w["x"]
+
+                if x < feature_limit_x:
+                    feature_tokens.append(tx)
+                else:
+                    if not _legacy_is_numeric(tx):
+                        continue
+
+                    col = column_for_x(x)
+                    if col == "nominal":
+                        nominal_candidates.append(tx)
+                    elif col == "actual":
+                        actual_candidates.append(tx)
+                    elif col == "deviation":
+                        deviation_candidates.append(tx)
+                    elif col == "upper_tol":
+                        upper_tol_candidates.append(tx)
+                    elif col == "lower_tol":
+                        lower_tol_candidates.append(tx)
+
+            feature_name = " ".join(feature_tokens).strip()
+
+            if not feature_name or not any(c.isalpha() for c in feature_name):
+                continue
+
+            lname = feature_name.lower()
+            if (
+                "plan name" in lname or
+                "part serial" in lname or
+                lname.startswith("date") or
+                "histogram" in lname or
+                "nominal" in lname or
+                "actual" in lname
+            ):
+                continue
+
+            # Detect POS X-Y-Z multi-parent row
+            if "pos x-y-z" in lname or "pos x-y-z" in lname:
+                current_parent_feature = feature_name.replace("X-Y-Z", "").strip()
+
+                if deviation_candidates:
+                    deviation_value = parse_numeric_token(deviation_candidates[-1])
+                    nominal_value = parse_numeric_token(nominal_candidates[-1]) if nominal_candidates else None
+                    actual_value = parse_numeric_token(actual_candidates[-1]) if actual_candidates else None
+                    upper_tol_value = parse_numeric_token(upper_tol_candidates[-1]) if upper_tol_candidates else None
+                    lower_tol_value = parse_numeric_token(lower_tol_candidates[-1]) if lower_tol_candidates else None
+                    rows.append(
+                        (
+                            feature_name,
+                            deviation_value,
+                            upper_tol_value,
+                            lower_tol_value,
+                            nominal_value,
+                            actual_value,
+                        )
+                    )
+                continue
+
+            # Normal single-line feature
+            current_parent_feature = None
+
+            if deviation_candidates:
+                deviation_value = parse_numeric_token(deviation_candidates[-1])
+                nominal_value = parse_numeric_token(nominal_candidates[-1]) if nominal_candidates else None
+                actual_value = parse_numeric_token(actual_candidates[-1]) if actual_candidates else None
+                upper_tol_value = parse_numeric_token(upper_tol_candidates[-1]) if upper_tol_candidates else None
+                lower_tol_value = parse_numeric_token(lower_tol_candidates[-1]) if lower_tol_candidates else None
+                rows.append(
+                    (
+                        feature_name,
+                        deviation_value,
+                        upper_tol_value,
+                        lower_tol_value,
+                        nominal_value,
+                        actual_value,
+                    )
+                )
+
+    return rows
+
+
+def read_words(path):
+    with fitz.open(path) as doc:
+        return [page.get_text("words") for page in doc]
+
+
+def legacy_extract(path):
+    # the original never closed the document
+    doc = fitz.open(path)
+    return legacy_rows_from_words([page.get_text("words") for page in doc])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--features', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for k in range(args.reports):
+            path = os.path.join(folder, f"675_WB0i{k % 12 + 1:02d}_{k:04d}.pdf")
+            write_cmm_report(path, args.pages, args.features, seed=k)
+            paths.append(path)
+        words = [read_words(p) for p in paths]
+        pages = sum(len(w) for w in words)
+
+        for path, page_words in zip(paths, words):
+            old = legacy_rows_from_words(page_words)
+            if repr(old) != repr(rows_from_words(page_words)) or repr(old) != repr(extract_cmm_rows(path)):
+                print(f"OUTPUT MISMATCH against legacy parser: {os.path.basename(path)}", file=sys.stderr)
+                return 1
+
+        print(f"{pages} pages in {args.reports} reports, rows identical")
+        print(f"{'stage':>10} {'legacy p/s':>11} {'new p/s':>9} {'speedup':>8}")
+        stages = {
+            'parse': (lambda: [legacy_rows_from_words(w) for w in words],
+                      lambda: [rows_from_words(w) for w in words]),
+            'end2end': (lambda: [legacy_extract(p) for p in paths],
+                        lambda: [extract_cmm_rows(p) for p in paths]),
+        }
+        for stage, (legacy, new) in stages.items():
+            t_old, _ = best_of(legacy, args.repeat)
+            t_new, _ = best_of(new, args.repeat)
+            print(f"{stage:>10} {pages / t_old:>11.0f} {pages / t_new:>9.0f} {t_old / t_new:>7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Compare the box-overlap and reading-order sequence textdiff engines.
+
+Usage: python benchmarks/bench_engines.py [--sizes 100,1000,20000] [--repeat 3]
+
+Two scenarios per page size:
+  edit   - words replaced in place (both engines should agree closely)
+  reflow - a few words inserted early in the text, pushing every later word
+           one slot along its line, which is what a small text change does
+           to a re-generated report
+
+For each engine the table shows the best wall time and the number of boxes
+reported (left + right). Fewer boxes on the reflow scenario is the point of
+the sequence engine.
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_matcher import VOCAB, best_of, synthetic_page  # noqa: E402
+from textcompare import ENGINES, normalize_text  # noqa: E402
+
+
+def reflowed_page(base, seed, inserts=3):
+    """Insert *inserts* words near the top of *base* and lay the text out again."""
+
+    rnd = random.Random(seed)
+    texts = [w['text'] for w in base]
+    for _ in range(inserts):
+        texts.insert(rnd.randrange(0, max(1, len(texts) // 10)), rnd.choice(VOCAB))
+    texts = texts[:len(base)]
+    # reuse the slot geometry of the original layout
+    return [
+        dict(slot, text=t, norm=normalize_text(t))
+        for slot, t in zip(base, texts)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,5000,20000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    names = sorted(ENGINES)
+    header = f"{'scenario':>8} {'words':>7}" + "".join(f" {n + ' ms':>10} {n + ' boxes':>10}" for n in names)
+    print(header)
+    for n in (int(s) for s in args.sizes.split(',')):
+        left = synthetic_page(n, seed=n)
+        scenarios = {
+            'edit': synthetic_page(n, seed=n + 1, base=left),
+            'reflow': reflowed_page(left, seed=n + 2),
+        }
+        for scenario, right in scenarios.items():
+            row = f"{scenario:>8} {n:>7}"
+            for name in names:
+                engine = ENGINES[name]
+                elapsed, (lb, rb) = best_of(lambda: engine(left, right), args.repeat)
+                row += f" {elapsed * 1000:>10.2f} {len(lb) + len(rb):>10}"
+            print(row)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
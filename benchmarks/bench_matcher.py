@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark the /textdiff word matcher against the original linear scans.
+
+Usage: python benchmarks/bench_matcher.py [--sizes 100,1000,20000] [--legacy-max 5000]
+
+Synthetic pages lay words out on a regular grid (like a dense CMM table);
+the right page perturbs a fraction of the words and nudges every box by a
+sub-word offset. Every size where the legacy matcher runs is also checked
+for identical output.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textcompare import dash_metric, deviation_score, intersects, match_words, normalize_text  # noqa: E402
+
+VOCAB = [
+    "Nominal", "Actual", "Deviation", "H203", "POS", "X-Y-Z", "X", "Y", "Z",
+    "0.000", "0.012", "-0.034", "12.500", "--|", "-|", "|", "---|", "|-", "||--",
+]
+
+
+def synthetic_page(n_words, seed, base=None, change_rate=0.05):
+    rnd = random.Random(seed)
+    cols = max(8, int((n_words / 1.4) ** 0.5))
+    rows = (n_words + cols - 1) // cols
+    cw = 1.0 / cols
+    rh = 1.0 / rows
+    words = []
+    for i in range(n_words):
+        if base is not None:
+            text = base[i]['text']
+            if rnd.random() < change_rate:
+                text = rnd.choice(VOCAB)
+            jitter = rnd.uniform(-0.1, 0.1)
+        else:
+            text = rnd.choice(VOCAB)
+            jitter = 0.0
+        c, r = i % cols, i // cols
+        x0 = (c + 0.1 + jitter) * cw
+        y0 = (r + 0.15) * rh
+        words.append({
+            'text': text,
+            'norm': normalize_text(text),
+            'x0': x0, 'y0': y0, 'x1': x0 + 0.7 * cw, 'y1': y0 + 0.7 * rh,
+        })
+    return words
+
+
+def legacy_match_words(left_words, right_words):
+    """The nested-loop matcher that ``match_words`` replaced."""
+
+    matched_right = [False]*len(right_words)
+    left_boxes = []
+    for lw in left_words:
+        found = False
+        for i, rw in enumerate(right_words):
+            if matched_right[i]:
+                continue
+            if lw['norm'] == rw['norm'] and intersects(lw, rw):
+                matched_right[i] = True
+                found = True
+                break
+        if not found:
+            left_boxes.append({
+                'box': [lw['x0'], lw['y0'], lw['x1'], lw['y1']],
+                'text': lw['text'],
+                'dashCount': dash_metric(lw['text'])
+            })
+
+    right_boxes = []
+    for rw in right_words:
+        found = False
+        for lw in left_words:
+            if rw['norm'] == lw['norm'] and intersects(rw, lw):
+                found = True
+                break
+        if not found:
+            dashCount = dash_metric(rw['text'])
+            deviation = deviation_score(rw['text'])
+            improved = False
+            if deviation >= 0 and '|' in rw['text']:
+                for lw in left_words:
+                    left_deviation = deviation_score(lw['text'])
+                    if left_deviation < 0:
+                        continue
+                    if rw['text'].count('|') != lw['text'].count('|'):
+                        continue
+                    if not intersects(rw, lw):
+                        continue
+                    if deviation < left_deviation:
+                        improved = True
+                        break
+            right_boxes.append({
+                'box': [rw['x0'], rw['y0'], rw['x1'], rw['y1']],
+                'text': rw['text'],
+                'dashCount': dashCount,
+                'improved': improved
+            })
+    return left_boxes, right_boxes
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,500,1000,2000,5000,10000,20000')
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='largest page size to time with the legacy matcher')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'words':>7} {'indexed ms':>11} {'legacy ms':>10} {'speedup':>8} {'boxes L/R':>11}")
+    for n in (int(s) for s in args.sizes.split(',')):
+        left = synthetic_page(n, seed=n)
+        right = synthetic_page(n, seed=n + 1, base=left)
+        t_new, new = best_of(lambda: match_words(left, right), args.repeat)
+        boxes = f"{len(new[0])}/{len(new[1])}"
+        if n <= args.legacy_max:
+            t_old, old = best_of(lambda: legacy_match_words(left, right), 1)
+            if old != new:
+                print(f"{n:>7} OUTPUT MISMATCH against legacy matcher", file=sys.stderr)
+                return 1
+            print(f"{n:>7} {t_new*1000:>11.2f} {t_old*1000:>10.2f} {t_old/t_new:>7.1f}x {boxes:>11}")
+        else:
+            print(f"{n:>7} {t_new*1000:>11.2f} {'-':>10} {'-':>8} {boxes:>11}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Compare request throughput of the development and production servers.
+
+Usage: python benchmarks/bench_serve.py [--clients 8] [--pages 24] [-o results.json]
+
+For each mode the app is started as ``app.py`` in a subprocess with its own
+empty data folder (``PDF_COMPARE_DATA_DIR``) holding a synthetic document
+pair, then ``--clients`` threads fire requests at it:
+
+  textdiff.cold  every page's /textdiff once: word extraction and matching
+  textdiff.warm  ``--warm`` rounds over all pages, answered from caches
+  render.cold    every page of both documents rendered once
+
+``dev`` is the werkzeug debug server with all PyMuPDF work in the server
+process; ``production`` is waitress with pages diffed and rendered in the
+worker pool (``PDF_COMPARE_DIFF_WORKERS``, default one per CPU).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_compare_pair  # noqa: E402
+
+MODES = ('dev', 'production')
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(mode, data_dir, threads):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "PDF_COMPARE_SERVER": mode,
+        "PDF_COMPARE_HOST": "127.0.0.1",
+        "PDF_COMPARE_PORT": str(port),
+        "PDF_COMPARE_DATA_DIR": data_dir,
+        "PDF_COMPARE_THREADS": str(threads),
+        "PDF_COMPARE_OPEN_BROWSER": "0",
+    })
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")], env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with status {proc.returncode}")
+        try:
+            urllib.request.urlopen(base + "/api/cache_stats", timeout=2).read()
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def _fetch(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=300) as resp:
+        resp.read()
+    return time.perf_counter() - started
+
+
+def _run_phase(urls, clients):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        latencies = sorted(executor.map(_fetch, urls))
+    seconds = time.perf_counter() - started
+    return {
+        'requests': len(urls),
+        'seconds': round(seconds, 4),
+        'perSecond': round(len(urls) / seconds, 2),
+        'p50Ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p95Ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+    }
+
+
+def bench_mode(mode, args, folder):
+    data_dir = os.path.join(folder, mode)
+    uploads = os.path.join(data_dir, "uploads")
+    os.makedirs(uploads)
+    for name in ("left.pdf", "right.pdf"):
+        shutil.copy(os.path.join(folder, name), uploads)
+
+    proc, base = _start(mode, data_dir, args.clients)
+    try:
+        pages = range(1, args.pages + 1)
+        textdiff = [f"{base}/textdiff?l=left.pdf&r=right.pdf&page={p}" for p in pages]
+        renders = [f"{base}/render?f={name}&page={p}&scale=1.5" for name in ("left.pdf", "right.pdf") for p in pages]
+        return {
+            'textdiff.cold': _run_phase(textdiff, args.clients),
+            'textdiff.warm': _run_phase(textdiff * args.warm, args.clients),
+            'render.cold': _run_phase(renders, args.clients),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--pages', type=int, default=24)
+    parser.add_argument('--words', type=int, default=1500, help='words per page')
+    parser.add_argument('--warm', type=int, default=10, help='rounds over all pages for textdiff.warm')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('-o', '--output', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    modes = [m for m in args.modes.split(',') if m]
+    results = {'params': {k: getattr(args, k) for k in ('clients', 'pages', 'words', 'warm')},
+               'cpus': os.cpu_count(), 'modes': {}}
+    with tempfile.TemporaryDirectory() as folder:
+        write_compare_pair(os.path.join(folder, "left.pdf"), os.path.join(folder, "right.pdf"),
+                           args.pages, args.words, seed=1)
+        for mode in modes:
+            results['modes'][mode] = bench_mode(mode, args, folder)
+
+    print(f"{'phase':<15} {'mode':<11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for phase in ('textdiff.cold', 'textdiff.warm', 'render.cold'):
+        for mode in modes:
+            r = results['modes'][mode][phase]
+            print(f"{phase:<15} {mode:<11} {r['perSecond']:>9.1f} {r['p50Ms']:>9.1f} {r['p95Ms']:>9.1f}")
+        if len(modes) == 2:
+            a, b = (results['modes'][m][phase]['perSecond'] for m in modes)
+            print(f"{'':<15} {'speedup':<11} {b / a:>8.2f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+            fh.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
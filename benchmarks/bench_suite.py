@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Time every stage of the compare and CMM pipelines and catch regressions.
+
+Usage:
+  python benchmarks/bench_suite.py [-o results.json]
+  python benchmarks/bench_suite.py --baseline results.json [--threshold 1.25]
+
+Synthetic documents (see ``synthetic.py``) are written to a temporary
+folder, then each stage is timed as the best of ``--repeat`` runs:
+
+  compare.extract    words of every page of both documents, caches cleared
+  compare.match      box-overlap matcher on the extracted words
+  compare.match_seq  reading-order sequence matcher
+  compare.serialize  /textdiff payloads as JSON, plain and compact
+  cmm.extract        feature rows of every report
+  cmm.index          parsing the reports into a fresh CMM index
+  cmm.summary        index rows to the columnar store and its aggregates
+  cmm.serialize      the /api/cmm_summary response, default and compact
+  align.distinct     page alignment of two ``--align-pages`` documents with
+                     inserted and removed pages
+  align.templated    the same where every page shares a form template
+
+Results (seconds, work units and units per second per stage) are written
+as JSON. With ``--baseline`` every stage's throughput is compared with a
+previous result file and the exit status is 1 when a stage got slower by
+more than ``--threshold`` times.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_matcher import best_of  # noqa: E402
+from cmm_index import CMMIndex  # noqa: E402
+from cmm_report import extract_cmm_rows, extract_die_number  # noqa: E402
+from doc_cache import DOCUMENTS, PAGE_WORDS  # noqa: E402
+from feature_store import FeatureStore  # noqa: E402
+from page_align import align_fingerprints  # noqa: E402
+from synthetic import page_fingerprint_pair, write_cmm_report, write_compare_pair  # noqa: E402
+from textcompare import encode_compact, extract_page_words, match_words, match_words_sequence  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+def compare_stages(folder, args):
+    left = os.path.join(folder, "left.pdf")
+    right = os.path.join(folder, "right.pdf")
+    write_compare_pair(left, right, args.pages, args.words, seed=1)
+    pages = range(1, args.pages + 1)
+
+    def extract():
+        PAGE_WORDS.clear()
+        DOCUMENTS.clear()
+        return [(extract_page_words(left, p), extract_page_words(right, p)) for p in pages]
+
+    words = extract()
+    box = [dict(zip(('left', 'right'), match_words(lw, rw))) for lw, rw in words]
+
+    def serialize():
+        return [(json.dumps(r), json.dumps(encode_compact(r))) for r in box]
+
+    units = 2 * args.pages
+    return {
+        'compare.extract': (extract, units, 'pages'),
+        'compare.match': (lambda: [match_words(lw, rw) for lw, rw in words], units, 'pages'),
+        'compare.match_seq': (lambda: [match_words_sequence(lw, rw) for lw, rw in words], units, 'pages'),
+        'compare.serialize': (serialize, units, 'pages'),
+    }, DOCUMENTS.clear
+
+
+def cmm_stages(folder, args):
+    reports = os.path.join(folder, "reports")
+    os.makedirs(reports)
+    paths = []
+    for k in range(args.reports):
+        path = os.path.join(reports, f"675_WB0i{k % 12 + 1:02d}_{k:04d}.pdf")
+        write_cmm_report(path, args.cmm_pages, args.features, seed=k)
+        paths.append(path)
+    indexes = []
+
+    def index():
+        db = CMMIndex(os.path.join(folder, f"index-{len(indexes)}.sqlite3"), extract_cmm_rows,
+                      extract_die_number, "bench")
+        indexes.append(db)
+        db.sync(reports)
+        db.parse(db.files(reports))
+        return db
+
+    db = index()
+
+    def summary():
+        store = FeatureStore.from_rows(db.rows(reports))
+        store.aggregates()
+        return store
+
+    store = summary()
+
+    def serialize():
+        # The default response: one object per point, as _collect_cmm_data builds it
+        features = []
+        for i, name in enumerate(store.names):
+            lo, hi = int(store.offsets[i]), int(store.offsets[i + 1])
+            points = [
+                {'date': store.dates[r], 'report': store.reports[r], 'deviation': d, 'upperTol': u,
+                 'lowerTol': lt, 'nominal': n, 'actual': a}
+                for r, d, u, lt, n, a in zip(
+                    store.report[lo:hi].tolist(),
+                    *(store.columns[k][lo:hi].tolist() for k in ('deviation', 'upperTol', 'lowerTol', 'nominal', 'actual'))
+                )
+            ]
+            features.append({'name': name, 'latest': points[-1]['deviation'], 'points': points})
+        full = json.dumps({'features': features, 'reportsAnalyzed': len(store.reports), 'errors': []})
+        compact = json.dumps({
+            'v': 1, 'reports': store.reports, 'dates': store.dates, 'features': store.aggregates(),
+            'series': {'offsets': store.offsets.tolist(), 'report': store.report.tolist(),
+                       'deviation': store.series_column('deviation')},
+        })
+        return full, compact
+
+    units = args.reports * args.cmm_pages
+    stages = {
+        'cmm.extract': (lambda: [extract_cmm_rows(p) for p in paths], units, 'pages'),
+        'cmm.index': (index, units, 'pages'),
+        'cmm.summary': (summary, len(store), 'points'),
+        'cmm.serialize': (serialize, len(store), 'points'),
+    }
+    # sqlite files must be closed before the temporary folder is removed
+    return stages, lambda: [db.close() for db in indexes]
+
+
+def align_stages(folder, args):
+    distinct = page_fingerprint_pair(args.align_pages, seed=1, inserted=args.align_pages // 20)
+    templated = page_fingerprint_pair(args.align_pages, seed=1, template_words=400, inserted=args.align_pages // 20)
+    units = 2 * args.align_pages
+    return {
+        'align.distinct': (lambda: align_fingerprints(*distinct), units, 'pages'),
+        'align.templated': (lambda: align_fingerprints(*templated), units, 'pages'),
+    }, lambda: None
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """Print per-stage throughput against *baseline*; return the regressed stage names."""
+
+    regressed = []
+    print(f"\n{'stage':<18} {'baseline/s':>12} {'current/s':>12} {'ratio':>7}")
+    for name, stage in results['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or old.get('unit') != stage['unit']:
+            print(f"{name:<18} {'-':>12} {stage['perSecond']:>12.1f} {'new':>7}")
+            continue
+        slowdown = old['perSecond'] / stage['perSecond']
+        flag = ''
+        if slowdown > threshold:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<18} {old['perSecond']:>12.1f} {stage['perSecond']:>12.1f} {1 / slowdown:>6.2f}x{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help='pages per compare document')
+    parser.add_argument('--words', type=int, default=1500, help='words per compare page')
+    parser.add_argument('--reports', type=int, default=30, help='CMM reports')
+    parser.add_argument('--cmm-pages', type=int, default=3, help='pages per CMM report')
+    parser.add_argument('--features', type=int, default=40, help='features per CMM page')
+    parser.add_argument('--align-pages', type=int, default=1000, help='pages per page-alignment document')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', help='comma-separated stage name prefixes to run, e.g. cmm')
+    parser.add_argument('-o', '--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='fail when a stage is this many times slower than the baseline')
+    args = parser.parse_args(argv)
+
+    prefixes = tuple(args.stages.split(',')) if args.stages else ('',)
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: getattr(args, k) for k in ('pages', 'words', 'reports', 'cmm_pages', 'features', 'align_pages',
+                                                 'repeat')},
+        'stages': {},
+    }
+
+    print(f"{'stage':<18} {'seconds':>9} {'units':>7} {'per second':>14}")
+    with tempfile.TemporaryDirectory() as folder:
+        for family, build in (('compare.', compare_stages), ('cmm.', cmm_stages), ('align.', align_stages)):
+            if not any(family.startswith(p) or p.startswith(family) for p in prefixes):
+                continue
+            stages, cleanup = build(folder, args)
+            for name, (fn, units, unit) in stages.items():
+                if not name.startswith(prefixes):
+                    continue
+                seconds, _ = best_of(fn, args.repeat)
+                results['stages'][name] = {
+                    'seconds': round(seconds, 6),
+                    'units': units,
+                    'unit': unit,
+                    'perSecond': round(units / seconds, 2),
+                }
+                print(f"{name:<18} {seconds:>9.4f} {units:>7} {units / seconds:>10.1f} {unit}")
+            cleanup()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+            fh.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if baseline.get('params') != results['params']:
+            print("note: baseline was recorded with different sizes; comparing per-unit throughput")
+        regressed = compare_with_baseline(results, baseline, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} stage(s) slower than {args.threshold:g}x the baseline: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
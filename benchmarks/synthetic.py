@@ -0,0 +1,110 @@
+"""Synthetic PDFs for the benchmarks, written with PyMuPDF.
+
+``write_compare_pair`` writes two text-dense documents where the right one
+replaces a fraction of the words, the input of ``/textdiff``;
+``write_cmm_report`` writes a ZEISS-style CMM table (a header row,
+single-line features and POS X-Y-Z blocks with X/Y/Z child rows), the
+input of the CMM trend report. ``page_fingerprint_pair`` skips the PDF and
+returns page SimHashes for page alignment. All are deterministic for a
+given seed.
+"""
+
+import random
+
+import fitz
+
+from bench_matcher import VOCAB
+from page_align import simhash
+
+HEADER = [("Nominal", 200), ("Actual", 260), ("Deviation", 320), ("Upper", 390), ("Lower", 440), ("Histogram", 500)]
+
+_MARGIN = 36
+
+
+def write_compare_pair(left_path, right_path, pages, words_per_page, seed, change_rate=0.05):
+    """Write two documents of *pages* pages with about *words_per_page* words each."""
+
+    rnd = random.Random(seed)
+    per_line = max(8, int((words_per_page / 1.4) ** 0.5))
+    lines = max(1, (words_per_page + per_line - 1) // per_line)
+    left, right = fitz.open(), fitz.open()
+    for _pg in range(pages):
+        lpage, rpage = left.new_page(), right.new_page()
+        spacing = (lpage.rect.height - 2 * _MARGIN) / lines
+        width = lpage.rect.width - 2 * _MARGIN
+        for row in range(lines):
+            y = _MARGIN + (row + 1) * spacing
+            texts = [rnd.choice(VOCAB) for _ in range(min(per_line, words_per_page - row * per_line))]
+            changed = [rnd.choice(VOCAB) if rnd.random() < change_rate else t for t in texts]
+            ltext, rtext = " ".join(texts), " ".join(changed)
+            # One size for both sides, small enough that the longer line fits.
+            em = max(fitz.get_text_length(ltext, fontsize=1), fitz.get_text_length(rtext, fontsize=1))
+            fontsize = min(8.0, spacing * 0.8, width / em)
+            lpage.insert_text((_MARGIN, y), ltext, fontsize=fontsize)
+            rpage.insert_text((_MARGIN, y), rtext, fontsize=fontsize)
+    left.save(left_path)
+    right.save(right_path)
+    left.close()
+    right.close()
+
+
+def page_fingerprint_pair(pages, seed, template_words=0, page_words=120, inserted=10):
+    """Return ``(left, right)`` page fingerprints of two versions of a document.
+
+    Every page holds *page_words* words of its own after *template_words*
+    words shared by all pages (a form or report template). The right side
+    drops *inserted* pages of the left and gains as many new ones, at
+    random positions.
+    """
+
+    rnd = random.Random(seed)
+    template = [rnd.choice(VOCAB) for _ in range(template_words)]
+
+    def page():
+        norms = template + [rnd.choice(VOCAB) for _ in range(page_words)]
+        return simhash(norms + [f"{a} {b}" for a, b in zip(norms, norms[1:])])
+
+    left = [page() for _ in range(pages)]
+    right = list(left)
+    for _ in range(inserted):
+        del right[rnd.randrange(len(right))]
+        right.insert(rnd.randrange(len(right) + 1), page())
+    return left, right
+
+
+def write_cmm_report(path, pages, features, seed):
+    """Write a synthetic CMM report with *features* table rows per page."""
+
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for pg in range(pages):
+        page = doc.new_page()
+        page.insert_text((40, 40), f"Plan name Bench {seed}", fontsize=8)
+        y = 60
+        for text, x in HEADER:
+            page.insert_text((x, y), text, fontsize=8)
+        y += 14
+        for i in range(features):
+            if y > page.rect.height - 60:
+                break
+            nominal = rnd.uniform(-50, 50)
+            deviation = round(rnd.gauss(0, 0.05), 4)
+            if i % 5 == 0:
+                page.insert_text((40, y), f"H{pg}{i:02d} POS X-Y-Z", fontsize=8)
+                y += 12
+                for axis in "XYZ":
+                    page.insert_text((60, y), axis, fontsize=8)
+                    for value, x in ((nominal, 200), (nominal + deviation, 260), (deviation, 320),
+                                     (0.1, 390), (-0.1, 440)):
+                        page.insert_text((x, y), f"{value:.4f}", fontsize=8)
+                    page.insert_text((500, y), "--|", fontsize=8)
+                    y += 12
+            else:
+                page.insert_text((40, y), f"D{pg}{i:02d} Diameter", fontsize=8)
+                for value, x in ((nominal, 200), (nominal + deviation, 260), (deviation, 320),
+                                 (0.05, 390), (-0.05, 440)):
+                    page.insert_text((x, y), f"{value:,.4f}", fontsize=8)
+                page.insert_text((500, y), "-|", fontsize=8)
+                y += 12
+    doc.save(path)
+    doc.close()
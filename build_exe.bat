@@ -16,12 +16,14 @@ pyinstaller ^
   --add-data "templates;templates" ^
   --add-data "static;static" ^
   --hidden-import "fitz" ^
+  --hidden-import "waitress" ^
   app.py
 
 if exist dist\PDFCompare.exe (
   echo.
   echo [OK] Built dist\PDFCompare.exe
   echo Double-click PDFCompare.exe to launch the app without installing Python.
+  echo Run "PDFCompare.exe --production" to serve several users at once.
 ) else (
   echo.
   echo [ERROR] Build failed. Check the PyInstaller output above.
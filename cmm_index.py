@@ -0,0 +1,336 @@
+"""Persistent SQLite index of CMM report rows.
+
+Every PDF seen in a report folder gets a ``files`` row keyed by its path and
+remembered ``(size, mtime)``; the feature rows parsed from it live in
+``rows``. A query re-lists the folder (a cheap ``stat`` per file), parses
+only files that are new or changed since they were indexed, and answers the
+date, part-type and die-number filters with SQL instead of rescanning every
+report.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from metrics import CMM_REPORTS_PARSED
+from workerpool import TaskPool
+
+# Bump when the schema changes; older databases are rebuilt from scratch.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_upper TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    die TEXT,
+    parser TEXT,
+    error TEXT,
+    UNIQUE (folder, name)
+);
+CREATE INDEX IF NOT EXISTS files_folder_mtime ON files (folder, mtime);
+CREATE INDEX IF NOT EXISTS files_folder_die ON files (folder, die);
+CREATE TABLE IF NOT EXISTS rows (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    feature TEXT NOT NULL,
+    -- untyped: REAL affinity would store -0.0 as the integer 0
+    deviation,
+    upper_tol,
+    lower_tol,
+    nominal,
+    actual,
+    PRIMARY KEY (file_id, seq)
+) WITHOUT ROWID;
+-- feature lookups across reports (the primary key columns are included)
+CREATE INDEX IF NOT EXISTS rows_feature ON rows (feature);
+"""
+
+Row = Tuple[str, float, Optional[float], Optional[float], Optional[float], Optional[float]]
+
+
+class FileRecord:
+    __slots__ = ("id", "name", "path", "mtime", "parsed", "error")
+
+    def __init__(self, id: int, name: str, path: str, mtime: float, parsed: bool, error: Optional[str]):
+        self.id = id
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.parsed = parsed
+        self.error = error
+
+
+def folder_key(folder: str) -> str:
+    return os.path.normcase(os.path.abspath(folder))
+
+
+class CMMIndex:
+    """Incrementally maintained index of ``cmm_report.extract_cmm_rows`` output.
+
+    *extract* parses one report into rows, *die_number* maps a filename to
+    its die number and *parser* names the extractor version; files indexed
+    by a different version are parsed again.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        extract: Callable[[str], Sequence[Row]],
+        die_number: Callable[[str], Optional[str]],
+        parser: str,
+    ):
+        self.db_path = db_path
+        self.parser = parser
+        self._extract = extract
+        self._die_number = die_number
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Bumped on every change this process makes, so callers can key
+        # caches of query results on it.
+        self.generation = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS rows; DROP TABLE IF EXISTS files;")
+                conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # -- folder listing ----------------------------------------------------
+    def sync(self, folder: str) -> None:
+        """Bring the ``files`` table in line with the PDFs currently in *folder*."""
+
+        key = folder_key(folder)
+        listing = {}
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(".pdf"):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                listing[entry.name] = st
+
+        with self._lock:
+            conn = self._connect()
+            known = {
+                name: (file_id, size, mtime_ns)
+                for file_id, name, size, mtime_ns in conn.execute(
+                    "SELECT id, name, size, mtime_ns FROM files WHERE folder = ?", (key,)
+                )
+            }
+            with conn:
+                gone = [(known[name][0],) for name in known.keys() - listing.keys()]
+                conn.executemany("DELETE FROM files WHERE id = ?", gone)
+                if gone:
+                    self.generation += 1
+                for name, st in listing.items():
+                    old = known.get(name)
+                    if old is not None and old[1] == st.st_size and old[2] == st.st_mtime_ns:
+                        continue
+                    self.generation += 1
+                    if old is not None:
+                        # Changed on disk: drop the stale rows and parse again.
+                        conn.execute("DELETE FROM rows WHERE file_id = ?", (old[0],))
+                        conn.execute(
+                            "UPDATE files SET size = ?, mtime_ns = ?, mtime = ?, parser = NULL, error = NULL "
+                            "WHERE id = ?",
+                            (st.st_size, st.st_mtime_ns, st.st_mtime, old[0]),
+                        )
+                    else:
+                        conn.execute(
+                            "INSERT INTO files (folder, name, name_upper, size, mtime_ns, mtime, die) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, name, name.upper(), st.st_size, st.st_mtime_ns, st.st_mtime,
+                             self._die_number(name)),
+                        )
+
+    # -- queries -----------------------------------------------------------
+    @staticmethod
+    def _where(
+        key: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        part_type: Optional[str],
+        die: Optional[str],
+    ) -> Tuple[str, list]:
+        clauses = ["f.folder = ?"]
+        args: list = [key]
+        if part_type:
+            clauses.append("instr(f.name_upper, ?) > 0")
+            args.append(part_type.upper())
+        if die:
+            clauses.append("f.die = ?")
+            args.append(die)
+        if start:
+            clauses.append("f.mtime >= ?")
+            args.append(start.timestamp())
+        if end:
+            clauses.append("f.mtime <= ?")
+            args.append(end.timestamp())
+        return " AND ".join(clauses), args
+
+    def files(
+        self,
+        folder: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        part_type: Optional[str] = None,
+        die: Optional[str] = None,
+    ) -> List[FileRecord]:
+        """Return the indexed files matching the filters, ordered by name."""
+
+        where, args = self._where(folder_key(folder), start, end, part_type, die)
+        with self._lock:
+            cur = self._connect().execute(
+                f"SELECT f.id, f.name, f.mtime, f.parser, f.error FROM files f WHERE {where} ORDER BY f.name",
+                args,
+            )
+            return [
+                FileRecord(file_id, name, os.path.join(folder, name), mtime, parser == self.parser, error)
+                for file_id, name, mtime, parser, error in cur
+            ]
+
+    def store(self, record: FileRecord, rows: Optional[Sequence[Row]], error: Optional[str] = None) -> None:
+        """Replace the rows of *record* with *rows*, or remember its parse error."""
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM rows WHERE file_id = ?", (record.id,))
+                if rows:
+                    conn.executemany(
+                        "INSERT INTO rows (file_id, seq, feature, deviation, upper_tol, lower_tol, nominal, actual) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(record.id, seq) + tuple(row) for seq, row in enumerate(rows)],
+                    )
+                conn.execute(
+                    "UPDATE files SET parser = ?, error = ? WHERE id = ?", (self.parser, error, record.id)
+                )
+            self.generation += 1
+        CMM_REPORTS_PARSED.inc('error' if error is not None else 'ok')
+        record.parsed = True
+        record.error = error
+
+    def parse(
+        self,
+        records: Sequence[FileRecord],
+        pool: Optional[TaskPool] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Parse every record that is not indexed by the current parser yet."""
+
+        for _record, _rows in self.parse_iter(records, pool, timeout):
+            pass
+
+    def parse_iter(
+        self,
+        records: Sequence[FileRecord],
+        pool: Optional[TaskPool] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Tuple[FileRecord, Optional[Sequence[Row]]]]:
+        """Parse pending records, yielding ``(record, rows)`` as each is stored.
+
+        With a *pool*, reports are parsed in its worker processes, each
+        limited to *timeout* seconds; *extract* must then be picklable.
+        Failures and timeouts are stored as the record's error (and yielded
+        with ``rows`` set to ``None``), so a report that hangs the parser is
+        not retried until the file changes.
+        """
+
+        pending = [r for r in records if not r.parsed]
+        if pool is None:
+            for record in pending:
+                try:
+                    rows = self._extract(record.path)
+                except Exception as exc:
+                    rows = None
+                    self.store(record, None, str(exc))
+                else:
+                    self.store(record, rows)
+                yield record, rows
+            return
+
+        tasks = [(record.path,) for record in pending]
+        for idx, rows, error in pool.imap(self._extract, tasks, timeout=timeout):
+            if error is None:
+                self.store(pending[idx], rows)
+            else:
+                self.store(pending[idx], None, str(error) or type(error).__name__)
+            yield pending[idx], rows
+
+    def rows(
+        self,
+        folder: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        part_type: Optional[str] = None,
+        die: Optional[str] = None,
+        feature: Optional[str] = None,
+        by_date: bool = False,
+    ) -> Iterator[Tuple[str, float, Row]]:
+        """Yield ``(report name, mtime, row)`` in report-name then row order.
+
+        *feature* is a case-sensitive GLOB pattern (``H203 POS *``) matched
+        through the ``rows_feature`` index; *by_date* orders the reports by
+        modification time instead of name. Rows are read lazily through a
+        connection of their own, so a caller streaming them does not block
+        writers or hold the whole result.
+        """
+
+        where, args = self._where(folder_key(folder), start, end, part_type, die)
+        source = "files f JOIN rows r ON r.file_id = f.id"
+        if feature:
+            where += " AND r.feature GLOB ?"
+            args.append(feature)
+            if feature[0] not in "*?[":
+                # A literal prefix is an index range; without statistics the
+                # planner would rather scan every row of the folder's files.
+                source = "rows r CROSS JOIN files f ON r.file_id = f.id"
+        order = "f.mtime, f.name, r.seq" if by_date else "f.name, r.seq"
+        with self._lock:
+            self._connect()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            cur = conn.execute(
+                "SELECT f.name, f.mtime, r.feature, r.deviation, r.upper_tol, r.lower_tol, r.nominal, r.actual "
+                f"FROM {source} WHERE {where} AND f.error IS NULL "
+                f"ORDER BY {order}",
+                args,
+            )
+            for name, mtime, *row in cur:
+                yield name, mtime, tuple(row)
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            files, parsed, failed = conn.execute(
+                "SELECT count(*), count(parser), count(error) FROM files"
+            ).fetchone()
+            rows = conn.execute("SELECT count(*) FROM rows").fetchone()[0]
+        return {'path': self.db_path, 'files': files, 'parsed': parsed, 'failed': failed, 'rows': rows}
@@ -0,0 +1,263 @@
+"""ZEISS CMM report parsing.
+
+Kept free of Flask so the trend scan can run it in worker processes.
+"""
+
+import re
+from bisect import bisect_right
+from operator import itemgetter
+from typing import List, Optional, Tuple
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+from content_store import ARTIFACTS, configure_artifacts, file_digest
+from ocr import ocr_kind, ocr_pages
+
+# OCR worker count for scanned report pages; 1 inside scan workers so they
+# do not start pools of their own.
+_ocr_workers: Optional[int] = None
+
+
+# A numeric column token must be strictly numeric (no letters),
+# optionally comma-separated and with an optional decimal part.
+# Examples: 10, -10.25, 1,234.50
+_NUMERIC_RE = re.compile(r'^[+-]?\d[\d,]*(\.\d+)?$')
+_DIE_RE = re.compile(r"wb0i(\d+)", re.IGNORECASE)
+
+# Value slots of a row, in the order they follow the feature name.
+_DEVIATION, _UPPER_TOL, _LOWER_TOL, _NOMINAL, _ACTUAL, _HISTOGRAM = range(6)
+_HEADER_SLOTS = {"Nominal": _NOMINAL, "Actual": _ACTUAL, "Deviation": _DEVIATION, "Histogram": _HISTOGRAM}
+_AXES = frozenset(("X", "Y", "Z"))
+_YX = itemgetter(0, 1)
+
+Row = Tuple[str, float, Optional[float], Optional[float], Optional[float], Optional[float]]
+
+
+def is_numeric_token(token: str) -> bool:
+    return _NUMERIC_RE.match(token) is not None
+
+
+def parse_numeric_token(token: str) -> Optional[float]:
+    """Return float value for token that may contain commas; otherwise None."""
+
+    try:
+        cleaned = token.replace(",", "")
+        return float(cleaned)
+    except Exception:
+        return None
+
+
+def extract_die_number(filename: str) -> Optional[str]:
+    """Return the two-digit die number embedded after a WB0i prefix."""
+
+    match = _DIE_RE.search(filename)
+    if not match:
+        return None
+
+    digits = "".join(ch for ch in match.group(1) if ch.isdigit())
+    if not digits:
+        return None
+
+    if len(digits) >= 2:
+        digits = digits[-2:]
+
+    return digits.zfill(2)
+
+
+def _page_columns(words) -> Optional[Tuple[float, List[float], List[int]]]:
+    """Locate the table header of one page.
+
+    Returns ``(feature limit x, column boundaries, column slots)``: a value
+    at ``x`` belongs to ``slots[bisect_right(boundaries, x)]``, i.e. to the
+    nearest header column by midpoint. ``None`` when the page has no table.
+    """
+
+    found = {}
+    for w in words:
+        text = w[4]
+        slot = _HEADER_SLOTS.get(text)
+        if slot is None:
+            # [:5] is enough: only ASCII letters lowercase to "upper"/"lower"
+            prefix = text[:5].lower()
+            if prefix == "upper":
+                slot = _UPPER_TOL
+            elif prefix == "lower":
+                slot = _LOWER_TOL
+            else:
+                continue
+        found[slot] = w[0]
+
+    if _ACTUAL not in found or _DEVIATION not in found or _HISTOGRAM not in found:
+        return None
+
+    # Same tie order as the report's left-to-right header sequence
+    columns = [
+        (slot, found[slot])
+        for slot in (_NOMINAL, _ACTUAL, _DEVIATION, _UPPER_TOL, _LOWER_TOL, _HISTOGRAM)
+        if slot in found
+    ]
+    columns.sort(key=itemgetter(1))
+    xs = [x for _slot, x in columns]
+    bounds = [(xs[i] + xs[i + 1]) / 2 for i in range(len(xs) - 1)]
+    return xs[0] - 5, bounds, [slot for slot, _x in columns]
+
+
+def _value(token: Optional[str]) -> Optional[float]:
+    return None if token is None else parse_numeric_token(token)
+
+
+def _row(name: str, values: List[Optional[str]]) -> Row:
+    return (
+        name,
+        _value(values[_DEVIATION]),
+        _value(values[_UPPER_TOL]),
+        _value(values[_LOWER_TOL]),
+        _value(values[_NOMINAL]),
+        _value(values[_ACTUAL]),
+    )
+
+
+def _page_rows(words, rows: List[Row]) -> None:
+    """Append the feature rows found on one page's words to *rows*."""
+
+    header = _page_columns(words)
+    if header is None:
+        return
+    feature_limit_x, bounds, slots = header
+
+    # (y center, x, text) records, ordered top to bottom then left to right
+    items = [((w[1] + w[3]) / 2, w[0], w[4].strip()) for w in words]
+    items.sort(key=_YX)
+
+    # Cluster into table rows: each word within 1pt of the previous one's y
+    groups = []
+    current = []
+    last_y = None
+    for item in items:
+        y = item[0]
+        if last_y is None or abs(y - last_y) <= 1.0:
+            current.append(item)
+        else:
+            groups.append(current)
+            current = [item]
+        last_y = y
+    if current:
+        groups.append(current)
+
+    parent = None
+    for group in groups:
+        # Only the last numeric token per column counts.
+        values: List[Optional[str]] = [None] * 5
+
+        axis = None
+        for _y, _x, text in group:
+            if text in _AXES:
+                axis = text
+
+        # Axis child row (X / Y / Z) of a POS X-Y-Z feature
+        if axis and parent:
+            for _y, x, text in group:
+                if _NUMERIC_RE.match(text) is not None:
+                    slot = slots[bisect_right(bounds, x)]
+                    if slot != _HISTOGRAM:
+                        values[slot] = text
+            if values[_DEVIATION] is not None:
+                # Example: H203 POS X
+                rows.append(_row(f"{parent} {axis}", values))
+            continue
+
+        # Parent row or single-line feature
+        feature_tokens = []
+        for _y, x, text in group:
+            if x < feature_limit_x:
+                feature_tokens.append(text)
+            elif _NUMERIC_RE.match(text) is not None:
+                slot = slots[bisect_right(bounds, x)]
+                if slot != _HISTOGRAM:
+                    values[slot] = text
+
+        feature_name = " ".join(feature_tokens).strip()
+        if not feature_name or not any(c.isalpha() for c in feature_name):
+            continue
+
+        lname = feature_name.lower()
+        if (
+            "plan name" in lname or
+            "part serial" in lname or
+            lname.startswith("date") or
+            "histogram" in lname or
+            "nominal" in lname or
+            "actual" in lname
+        ):
+            continue
+
+        if "pos x-y-z" in lname:
+            parent = feature_name.replace("X-Y-Z", "").strip()
+        else:
+            parent = None
+
+        if values[_DEVIATION] is not None:
+            rows.append(_row(feature_name, values))
+
+
+def rows_from_words(page_words) -> List[Row]:
+    """Return the feature rows for a report given each page's PyMuPDF words."""
+
+    rows: List[Row] = []
+    for words in page_words:
+        if words:
+            _page_rows(words, rows)
+    return rows
+
+
+def extract_cmm_rows(path: str) -> List[Row]:
+    """
+    Extract ZEISS CMM feature rows with support for:
+    - Standard single-line features
+    - POS X-Y-Z multi-line features → converted into separate X, Y, Z features.
+
+    Each tuple contains: (feature name, deviation, upper tolerance, lower tolerance,
+    nominal, actual). Tolerance values are optional and may be ``None`` if not
+    present in the report.
+    """
+
+    if fitz is None:
+        raise RuntimeError("PyMuPDF is required to parse CMM reports")
+
+    with fitz.open(path) as doc:
+        page_words = [page.get_text("words") for page in doc]
+
+    scanned = [idx + 1 for idx, words in enumerate(page_words) if not words]
+    if scanned:
+        # scanned report pages: OCR them (in parallel) instead of skipping
+        for page_num, words in ocr_pages(path, scanned, workers=_ocr_workers).items():
+            page_words[page_num - 1] = words
+
+    return rows_from_words(page_words)
+
+
+# Bump when extract_cmm_rows output changes so stored rows are re-derived
+CMM_ROWS_ARTIFACT = "cmm-rows-v1"
+
+
+def cached_cmm_rows(path: str):
+    """Return CMM rows for *path*, parsing each distinct report content once."""
+
+    digest = file_digest(path)
+    stored = ARTIFACTS.get(ocr_kind(CMM_ROWS_ARTIFACT), digest)
+    if stored is not None:
+        return [tuple(row) for row in stored]
+    rows = extract_cmm_rows(path)
+    ARTIFACTS.put(ocr_kind(CMM_ROWS_ARTIFACT), digest, rows)
+    return rows
+
+
+def init_worker(artifact_root: Optional[str]) -> None:
+    """Process-pool initializer for report scans."""
+
+    global _ocr_workers
+    _ocr_workers = 1
+    configure_artifacts(artifact_root)
@@ -0,0 +1,198 @@
+"""Background ingestion of CMM reports as they arrive in watched folders.
+
+A polling thread re-lists every watched folder through ``CMMIndex.sync``
+and looks for reports the index has not parsed yet. A new file is only
+queued once it has settled: its size and modification time must be the
+same on two consecutive polls and it must not have been modified for
+``settle`` seconds, so a report that is still being copied is not parsed
+half-written. Settled reports go through a bounded queue to an ingest
+thread that parses them into the index; when the queue is full the poller
+blocks, so a burst of new files never outruns the parser by more than the
+queue size. Polling (rather than inotify) also works on network shares.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from cmm_index import CMMIndex, FileRecord
+from workerpool import TaskPool
+
+
+class FolderWatcher:
+    def __init__(
+        self,
+        index: CMMIndex,
+        folders: Sequence[str],
+        pool: Optional[Callable[[], TaskPool]] = None,
+        interval: float = 5.0,
+        settle: float = 3.0,
+        max_queue: int = 64,
+        timeout: Optional[float] = None,
+    ):
+        self.index = index
+        self.folders = list(folders)
+        self.interval = interval
+        self.settle = settle
+        self.timeout = timeout
+        self._pool = pool
+        self._queue: "queue.Queue[FileRecord]" = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # path -> (size, mtime_ns) as of the previous poll, for files not yet queued
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        # path -> modification time of every queued or in-progress report
+        self._pending: Dict[str, float] = {}
+        self._ingested = 0
+        self._failed = 0
+        self._last_poll: Optional[float] = None
+        self._last_ingest: Optional[float] = None
+        self._last_lag: Optional[float] = None
+        self._poll_errors: Dict[str, str] = {}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._poll_loop, name="cmm-watch-poll", daemon=True),
+                threading.Thread(target=self._ingest_loop, name="cmm-watch-ingest", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # -- polling -------------------------------------------------------------
+    def _poll_loop(self) -> None:
+        while not self._stop.is_set():
+            for folder in self.folders:
+                self.poll(folder)
+            with self._lock:
+                self._last_poll = time.time()
+            self._stop.wait(self.interval)
+
+    def poll(self, folder: str) -> int:
+        """Queue the settled, unparsed reports of *folder*; return how many were queued."""
+
+        try:
+            self.index.sync(folder)
+            records = [r for r in self.index.files(folder) if not r.parsed]
+        except Exception as exc:
+            with self._lock:
+                self._poll_errors[folder] = str(exc)
+            return 0
+        with self._lock:
+            self._poll_errors.pop(folder, None)
+            waiting = set(self._pending)
+
+        queued = 0
+        now = time.time()
+        prefix = os.path.join(folder, "")
+        current = set()
+        for record in records:
+            current.add(record.path)
+            if record.path in waiting:
+                continue
+            try:
+                st = os.stat(record.path)
+            except OSError:
+                continue
+            state = (st.st_size, st.st_mtime_ns)
+            with self._lock:
+                previous = self._seen.get(record.path)
+                self._seen[record.path] = state
+                if previous != state or now - st.st_mtime < self.settle:
+                    continue
+                del self._seen[record.path]
+                self._pending[record.path] = st.st_mtime
+            # Blocks while the queue is full: backpressure on the poller.
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(record, timeout=1.0)
+                    break
+                except queue.Full:
+                    continue
+            queued += 1
+
+        # Forget files that were deleted or parsed by a request in the meantime.
+        with self._lock:
+            for path in [p for p in self._seen if p.startswith(prefix) and p not in current]:
+                del self._seen[path]
+        return queued
+
+    # -- ingest --------------------------------------------------------------
+    def _ingest_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            # Hand the pool up to one report per worker at a time.
+            pool = self._pool() if self._pool is not None else None
+            while pool is not None and len(batch) < pool.workers:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for record, rows in self.index.parse_iter(batch, pool, self.timeout):
+                    self._done(record, rows is not None)
+            except Exception as exc:
+                for record in batch:
+                    if not record.parsed:
+                        record.error = str(exc)
+                        self._done(record, False)
+            finally:
+                with self._lock:
+                    for record in batch:
+                        self._pending.pop(record.path, None)
+
+    def _done(self, record: FileRecord, ok: bool) -> None:
+        now = time.time()
+        with self._lock:
+            mtime = self._pending.pop(record.path, None)
+            if ok:
+                self._ingested += 1
+            else:
+                self._failed += 1
+            self._last_ingest = now
+            if mtime is not None:
+                self._last_lag = now - mtime
+
+    # -- status --------------------------------------------------------------
+    def status(self) -> Dict[str, object]:
+        """Return counters plus the ingest lag.
+
+        ``lagSeconds`` is the age (time since its last modification) of the
+        oldest report that is settling, queued or being parsed, 0 when
+        nothing is waiting; ``lastLagSeconds`` is the delay between
+        modification and indexing of the latest ingested report.
+        """
+
+        now = time.time()
+        with self._lock:
+            waiting = list(self._pending.values()) + [mtime_ns / 1e9 for _size, mtime_ns in self._seen.values()]
+            oldest = min(waiting, default=None)
+            return {
+                'enabled': True,
+                'running': any(t.is_alive() for t in self._threads),
+                'folders': self.folders,
+                'interval': self.interval,
+                'settle': self.settle,
+                'queued': self._queue.qsize(),
+                'maxQueue': self._queue.maxsize,
+                'pending': len(self._pending),
+                'settling': len(self._seen),
+                'ingested': self._ingested,
+                'failed': self._failed,
+                'lastPoll': self._last_poll,
+                'lastIngest': self._last_ingest,
+                'lagSeconds': round(max(0.0, now - oldest), 3) if oldest is not None else 0.0,
+                'lastLagSeconds': round(self._last_lag, 3) if self._last_lag is not None else None,
+                'errors': dict(self._poll_errors),
+            }
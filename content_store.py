@@ -0,0 +1,198 @@
+"""Content-addressed storage for uploads and the artifacts derived from them.
+
+Uploaded PDFs are stored as ``<sha256>.pdf``; the hash is computed while the
+upload streams to disk, so a repeat upload of the same report is detected
+without a second pass and never written twice. ``names.json`` in the upload
+folder maps every original (secured) filename to the digest it was last
+uploaded with.
+
+Anything derived from a document (extracted words, CMM rows) is stored
+under the document's digest by :class:`ArtifactStore`, so identical content
+is parsed once no matter where it lives or who uploaded it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from doc_cache import LRUCache, file_identity
+
+_CHUNK_SIZE = 1024 * 1024
+_DIGEST_NAME_RE = re.compile(r"^([0-9a-f]{64})\.pdf$")
+_INDEX_NAME = "names.json"
+
+# sha256 of files that are not stored under their digest, keyed by identity.
+_DIGESTS = LRUCache(max_entries=65536)
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 hex digest of the file at *path*.
+
+    Files named ``<sha256>.pdf`` are trusted to match their name; any other
+    file is hashed once per ``(path, size, mtime)``.
+    """
+
+    match = _DIGEST_NAME_RE.match(os.path.basename(path))
+    if match:
+        return match.group(1)
+
+    key = file_identity(path)
+    digest = _DIGESTS.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _DIGESTS.put(key, digest)
+    return digest
+
+
+_index_lock = threading.Lock()
+
+
+def _read_index(folder: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(folder, _INDEX_NAME), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json_atomic(path: str, data) -> None:
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def store_upload(storage, folder: str, original_name: str) -> str:
+    """Stream a werkzeug ``FileStorage`` into *folder* and return its stored name.
+
+    The returned name is ``<sha256>.pdf``. If a file with the same content
+    already exists the temporary copy is discarded. *original_name* (already
+    passed through ``secure_filename``) is recorded in the name index.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: storage.stream.read(_CHUNK_SIZE), b""):
+                h.update(chunk)
+                out.write(chunk)
+        stored_name = f"{h.hexdigest()}.pdf"
+        target = os.path.join(folder, stored_name)
+        if os.path.exists(target):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    if original_name:
+        with _index_lock:
+            index = _read_index(folder)
+            if index.get(original_name) != h.hexdigest():
+                index[original_name] = h.hexdigest()
+                _write_json_atomic(os.path.join(folder, _INDEX_NAME), index)
+    return stored_name
+
+
+def is_stored_name(name: str) -> bool:
+    """True for a ``<sha256>.pdf`` name as returned by :func:`store_upload`."""
+
+    return bool(_DIGEST_NAME_RE.match(name))
+
+
+def _plain_name(name: str) -> bool:
+    """True for a bare file name: not absolute, no separators, no ``..``."""
+
+    if not name or os.path.isabs(name) or ".." in name:
+        return False
+    return not any(c in name for c in ("/", "\\", "\0"))
+
+
+def resolve_upload(folder: str, name: str) -> Optional[str]:
+    """Return the on-disk path for an upload given its stored or original name.
+
+    Names are client input: anything but a bare ``.pdf`` file name resolves
+    to ``None``, so neither the name index nor the derived caches beside the
+    uploads can be reached through it.
+    """
+
+    if not _plain_name(name) or not name.lower().endswith(".pdf"):
+        return None
+    path = os.path.join(folder, name)
+    if os.path.isfile(path):
+        return path
+    digest = _read_index(folder).get(name)
+    if digest:
+        path = os.path.join(folder, f"{digest}.pdf")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def upload_labels(folder: str) -> Dict[str, str]:
+    """Return ``{stored name: original name}`` from the name index."""
+
+    return {f"{digest}.pdf": name for name, digest in _read_index(folder).items()}
+
+
+class ArtifactStore:
+    """JSON artifacts stored as ``<root>/<kind>/<digest[:2]>/<digest>[.<part>].json``.
+
+    A store without a root is a no-op, which keeps the extraction helpers
+    usable from scripts that have no upload folder.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root
+
+    def _path(self, kind: str, digest: str, part=None) -> str:
+        name = digest if part is None else f"{digest}.{part}"
+        return os.path.join(self.root, kind, digest[:2], f"{name}.json")
+
+    def get(self, kind: str, digest: str, part=None):
+        if not self.root:
+            return None
+        try:
+            with open(self._path(kind, digest, part), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, kind: str, digest: str, value, part=None) -> None:
+        if not self.root:
+            return
+        try:
+            _write_json_atomic(self._path(kind, digest, part), value)
+        except OSError:
+            # Derived data is an optimization; a read-only disk must not fail requests.
+            pass
+
+
+ARTIFACTS = ArtifactStore()
+
+
+def configure_artifacts(root: Optional[str]) -> None:
+    """Point the shared :data:`ARTIFACTS` store at *root* (also used as a pool initializer)."""
+
+    ARTIFACTS.root = root
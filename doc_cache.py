@@ -0,0 +1,181 @@
+"""Bounded LRU caches for open PyMuPDF documents and extracted page data."""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import stage
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+# PyMuPDF objects must not be used from several threads at once. Every code
+# path that touches a ``fitz.Document`` holds this lock while doing so.
+FITZ_LOCK = threading.RLock()
+
+
+def file_identity(path: str) -> Tuple[str, int, int]:
+    """Return ``(absolute path, size, mtime_ns)`` used to key derived data."""
+
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and approximate bytes."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[Hashable, object], None]] = None,
+    ):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max_bytes
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: object, size: int = 0) -> None:
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                old_key, (old_value, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        if self._on_evict is not None:
+            for old_key, old_value in evicted:
+                self._on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            items = list(self._data.items())
+            self._data.clear()
+            self._bytes = 0
+        if self._on_evict is not None:
+            for key, (value, _size) in items:
+                self._on_evict(key, value)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'bytes': self._bytes,
+            'maxEntries': self.max_entries,
+            'maxBytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': (self.hits / lookups) if lookups else None,
+        }
+
+
+def _close_document(_key, doc) -> None:
+    try:
+        doc.close()
+    except Exception:
+        pass
+
+
+class DocumentPool:
+    """Keep a bounded number of ``fitz.Document`` handles open between requests.
+
+    Handles are keyed by :func:`file_identity`, so a file that is replaced on
+    disk is reopened instead of served from a stale handle.
+    """
+
+    def __init__(self, max_open: int = 8):
+        self._cache = LRUCache(max_open, on_evict=_close_document)
+
+    @contextmanager
+    def document(self, path: str):
+        """Yield an open document for *path* while holding :data:`FITZ_LOCK`."""
+
+        if fitz is None:
+            raise RuntimeError("PyMuPDF is required to open PDF documents")
+
+        key = file_identity(path)
+        with FITZ_LOCK:
+            doc = self._cache.get(key)
+            if doc is None:
+                with stage('open'):
+                    doc = fitz.open(path)
+                self._cache.put(key, doc)
+            yield doc
+
+    def clear(self) -> None:
+        with FITZ_LOCK:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return self._cache.stats()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+DOCUMENTS = DocumentPool(max_open=_env_int("PDF_COMPARE_OPEN_DOCS", 8))
+
+# Normalized word lists keyed by ``(content digest, page)``.
+PAGE_WORDS = LRUCache(
+    max_entries=_env_int("PDF_COMPARE_WORD_CACHE_PAGES", 2048),
+    max_bytes=_env_int("PDF_COMPARE_WORD_CACHE_MB", 128) * 1024 * 1024,
+)
+
+# Page and line hashes (textcompare.page_signature) keyed by ``(content digest, page)``.
+PAGE_SIGNATURES = LRUCache(max_entries=_env_int("PDF_COMPARE_SIGNATURE_CACHE_PAGES", 8192))
+
+
+def cache_stats() -> Dict[str, object]:
+    """Return hit/miss/eviction counters for the shared caches."""
+
+    return {
+        'documents': DOCUMENTS.stats(),
+        'pageWords': PAGE_WORDS.stats(),
+        'pageSignatures': PAGE_SIGNATURES.stats(),
+    }
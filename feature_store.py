@@ -0,0 +1,250 @@
+"""Columnar store of CMM feature points with vectorized SPC aggregates.
+
+Points are kept as parallel NumPy arrays (feature id, report id, deviation,
+tolerances, nominal, actual) sorted by feature name and then by report
+date, the order ``/api/cmm_summary`` has always used for a feature's
+points. Each feature's points are a contiguous slice described by
+``offsets``, so per-feature aggregates are single ``reduceat`` calls.
+"""
+
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_FIELDS = ("deviation", "upperTol", "lowerTol", "nominal", "actual")
+
+
+def _json_list(values: np.ndarray) -> List[Optional[float]]:
+    """``tolist()`` with NaN mapped to ``None``."""
+
+    return [None if v != v else v for v in values.tolist()]
+
+
+def downsample(values: np.ndarray, width: int, keep: Optional[np.ndarray] = None) -> np.ndarray:
+    """Return the sorted indices of a series reduced to about *width* points.
+
+    The finite values are cut into ``width // 2`` equal buckets and each
+    bucket keeps its minimum and maximum (so spikes survive), plus the first
+    and last point and every index where *keep* is true.
+    """
+
+    idx = np.flatnonzero(np.isfinite(values))
+    if len(idx) <= width:
+        selected = idx
+    else:
+        buckets = max(1, width // 2)
+        bucket = (np.arange(len(idx)) * buckets) // len(idx)
+        order = np.lexsort((values[idx], bucket))
+        starts = np.searchsorted(bucket[order], np.arange(buckets))
+        ends = np.append(starts[1:], len(idx)) - 1
+        selected = idx[np.concatenate((order[starts], order[ends], [0, len(idx) - 1]))]
+    if keep is not None:
+        selected = np.concatenate((selected, np.flatnonzero(keep & np.isfinite(values))))
+    return np.unique(selected)
+
+
+class FeatureStore:
+    def __init__(
+        self,
+        names: List[str],
+        reports: List[str],
+        dates: List[str],
+        feature: np.ndarray,
+        report: np.ndarray,
+        columns: Dict[str, np.ndarray],
+    ):
+        self.names = names
+        self.reports = reports
+        self.dates = dates
+        self.feature = feature
+        self.report = report
+        self.columns = columns
+        counts = np.bincount(feature, minlength=len(names))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._aggregates: Optional[Dict[str, list]] = None
+        self._oot: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, float, tuple]]) -> "FeatureStore":
+        """Build a store from ``(report name, mtime, row)`` as yielded by ``CMMIndex.rows``."""
+
+        feature_ids: Dict[str, int] = {}
+        report_ids: Dict[str, int] = {}
+        report_mtimes: List[float] = []
+        feature = array("l")
+        report = array("l")
+        values = {name: array("d") for name in _FIELDS}
+        nan = float("nan")
+
+        for name, mtime, (feat, *fields) in rows:
+            rid = report_ids.get(name)
+            if rid is None:
+                rid = report_ids[name] = len(report_mtimes)
+                report_mtimes.append(mtime)
+            fid = feature_ids.get(feat)
+            if fid is None:
+                fid = feature_ids[feat] = len(feature_ids)
+            feature.append(fid)
+            report.append(rid)
+            for key, value in zip(_FIELDS, fields):
+                values[key].append(nan if value is None else value)
+
+        # Reports ordered by (ISO date, name), features by name.
+        report_names = list(report_ids)
+        dates = [datetime.fromtimestamp(m).isoformat() for m in report_mtimes]
+        report_order = sorted(range(len(report_names)), key=lambda i: (dates[i], report_names[i]))
+        report_rank = np.empty(len(report_names), dtype=np.int64)
+        report_rank[report_order] = np.arange(len(report_names))
+        names = sorted(feature_ids)
+        feature_rank = np.empty(len(names), dtype=np.int64)
+        feature_rank[[feature_ids[n] for n in names]] = np.arange(len(names))
+
+        fid = feature_rank[np.frombuffer(feature, dtype=feature.typecode)] if feature else np.empty(0, np.int64)
+        rid = report_rank[np.frombuffer(report, dtype=report.typecode)] if report else np.empty(0, np.int64)
+        # Stable: points of one report keep their order within the report.
+        order = np.lexsort((rid, fid))
+        columns = {key: np.frombuffer(col, dtype=np.float64)[order] for key, col in values.items()}
+        return cls(
+            names,
+            [report_names[i] for i in report_order],
+            [dates[i] for i in report_order],
+            fid[order],
+            rid[order],
+            columns,
+        )
+
+    def __len__(self) -> int:
+        return len(self.feature)
+
+    def out_of_tolerance(self) -> np.ndarray:
+        """Per-point flags, the check the CMM page used to run in JavaScript.
+
+        With nominal and actual the actual value is compared with nominal
+        plus each tolerance, otherwise the deviation with the tolerances;
+        a missing tolerance never flags (NaN comparisons are false).
+        """
+
+        if self._oot is not None:
+            return self._oot
+        c = self.columns
+        nominal, actual, deviation = c["nominal"], c["actual"], c["deviation"]
+        upper, lower = c["upperTol"], c["lowerTol"]
+        with np.errstate(invalid="ignore"):
+            has_actual = np.isfinite(nominal) & np.isfinite(actual)
+            by_actual = (actual > nominal + upper) | (actual < nominal + lower)
+            by_deviation = (deviation > upper) | (deviation < lower)
+        self._oot = np.where(has_actual, by_actual, by_deviation)
+        return self._oot
+
+    def _first_finite(self, values: np.ndarray) -> np.ndarray:
+        """First finite value of every feature's slice, NaN if there is none."""
+
+        starts = self.offsets[:-1]
+        idx = np.where(np.isfinite(values), np.arange(len(values)), len(values))
+        first = np.minimum.reduceat(idx, starts)
+        found = first < self.offsets[1:]
+        out = np.full(len(starts), np.nan)
+        out[found] = values[first[found]]
+        return out
+
+    def aggregates(self) -> Dict[str, list]:
+        """Return per-feature statistics as columns, one entry per ``names`` item.
+
+        ``latest`` is the deviation of the newest point; ``mean``/``sigma``
+        (sample standard deviation) cover the finite deviations. ``cp`` and
+        ``cpk`` use the feature's first upper/lower tolerance as spec limits
+        on the deviation; ``cp`` needs both limits, ``cpk`` at least one.
+        """
+
+        if self._aggregates is None:
+            self._aggregates = self._compute_aggregates()
+        return self._aggregates
+
+    def _compute_aggregates(self) -> Dict[str, list]:
+        if not self.names:
+            return {'name': [], 'points': [], 'latest': [], 'outOfTolerance': [], 'outOfToleranceCount': [],
+                    'n': [], 'mean': [], 'sigma': [], 'upperTol': [], 'lowerTol': [], 'cp': [], 'cpk': []}
+
+        starts = self.offsets[:-1]
+        sizes = np.diff(self.offsets)
+        deviation = self.columns["deviation"]
+        finite = np.isfinite(deviation)
+        oot = self.out_of_tolerance()
+
+        n = np.add.reduceat(finite.astype(np.int64), starts)
+        total = np.add.reduceat(np.where(finite, deviation, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+            centered = np.where(finite, deviation - np.repeat(mean, sizes), 0.0)
+            sigma = np.sqrt(np.add.reduceat(centered * centered, starts) / (n - 1))
+            sigma[n < 2] = np.nan
+
+            upper = self._first_finite(self.columns["upperTol"])
+            lower = self._first_finite(self.columns["lowerTol"])
+            cp = (upper - lower) / (6 * sigma)
+            cpk = np.fmin((upper - mean) / (3 * sigma), (mean - lower) / (3 * sigma))
+            bad = ~np.isfinite(sigma) | (sigma == 0)
+            cp[bad] = np.nan
+            cpk[bad] = np.nan
+
+        return {
+            'name': self.names,
+            'points': sizes.tolist(),
+            'latest': _json_list(deviation[self.offsets[1:] - 1]),
+            'outOfTolerance': np.logical_or.reduceat(oot, starts).tolist(),
+            'outOfToleranceCount': np.add.reduceat(oot.astype(np.int64), starts).tolist(),
+            'n': n.tolist(),
+            'mean': _json_list(mean),
+            'sigma': _json_list(sigma),
+            'upperTol': _json_list(upper),
+            'lowerTol': _json_list(lower),
+            'cp': _json_list(cp),
+            'cpk': _json_list(cpk),
+        }
+
+    def series_column(self, key: str) -> List[Optional[float]]:
+        """Return one value column for all points, JSON-ready."""
+
+        return _json_list(self.columns[key])
+
+    def order(self, sort: str = "name") -> List[int]:
+        """Return feature indexes for listing: by name, lowest Cpk or most out of tolerance."""
+
+        if sort == "cpk":
+            cpk = np.array([np.inf if v is None else v for v in self.aggregates()['cpk']])
+            return np.argsort(cpk, kind="stable").tolist()
+        if sort == "outOfTolerance":
+            count = np.array(self.aggregates()['outOfToleranceCount'])
+            return np.argsort(-count, kind="stable").tolist()
+        return list(range(len(self.names)))
+
+    def select(self, indexes: List[int]) -> Dict[str, list]:
+        """Return the aggregate columns restricted to *indexes*, in that order."""
+
+        return {key: [column[i] for i in indexes] for key, column in self.aggregates().items()}
+
+    def series(self, index: int, width: Optional[int] = None) -> Dict[str, list]:
+        """Return one feature's points as columns.
+
+        ``report`` indexes ``reports`` and ``index`` is each point's position
+        in the full series of ``total`` points. With *width*, the series is
+        reduced by :func:`downsample`, keeping every out-of-tolerance point.
+        """
+
+        lo, hi = int(self.offsets[index]), int(self.offsets[index + 1])
+        oot = self.out_of_tolerance()[lo:hi]
+        if width is None:
+            picked = np.arange(hi - lo)
+        else:
+            picked = downsample(self.columns["deviation"][lo:hi], width, keep=oot)
+        out = {
+            'total': hi - lo,
+            'index': picked.tolist(),
+            'report': self.report[lo:hi][picked].tolist(),
+            'outOfTolerance': oot[picked].tolist(),
+        }
+        for key, col in self.columns.items():
+            out[key] = _json_list(col[lo:hi][picked])
+        return out
@@ -0,0 +1,250 @@
+"""Per-request stage timers and process-wide metrics in Prometheus text format.
+
+Code marks its phases with ``with stage('match'):``. While a request is
+being timed (:func:`begin` was called in its context) the time is added to
+that request's :class:`Timings`; a nested stage pauses the enclosing one,
+so every stage reports its own time only. Outside a timed request, e.g. in
+worker processes or with instrumentation disabled, :func:`stage` returns a
+shared no-op context manager.
+
+Histograms and counters live in :data:`REGISTRY` and are rendered by
+:func:`render` for a ``/metrics`` endpoint. Counters incremented by a task
+in a worker process are added to the parent's by ``workerpool.TaskPool``
+(see :meth:`Registry.counts` and :meth:`Registry.add_counts`).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; covers cached responses (sub-millisecond) up to long folder scans.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Timings:
+    """Accumulated self time per stage for one request."""
+
+    __slots__ = ("started", "stages", "active")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.active: Optional["_Stage"] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Return a ``Server-Timing`` header value (durations in milliseconds)."""
+
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class _Stage:
+    __slots__ = ("name", "timings", "parent", "start", "nested")
+
+    def __init__(self, name: str, timings: Timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.parent = self.timings.active
+        self.timings.active = self
+        self.nested = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.timings.add(self.name, elapsed - self.nested)
+        STAGE_SECONDS.observe(elapsed - self.nested, self.name)
+        if self.parent is not None:
+            self.parent.nested += elapsed
+        self.timings.active = self.parent
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_current: ContextVar[Optional[Timings]] = ContextVar("pdf_compare_timings", default=None)
+
+
+def stage(name: str):
+    """Return a context manager timing *name* within the current request."""
+
+    timings = _current.get()
+    if timings is None:
+        return _NULL_STAGE
+    return _Stage(name, timings)
+
+
+def begin() -> Tuple[Timings, object]:
+    """Start timing the current context; pass the token to :func:`end`."""
+
+    timings = Timings()
+    return timings, _current.set(timings)
+
+
+def end(token) -> None:
+    _current.reset(token)
+
+
+# -- registry ---------------------------------------------------------------
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][slot] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        names = self.labels + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counts(self) -> Dict[Tuple[str, Tuple[str, ...]], float]:
+        """Return every counter value keyed by ``(counter name, labels)``."""
+
+        return {
+            (metric.name, labels): value
+            for metric in self._metrics if isinstance(metric, Counter)
+            for labels, value in metric.values().items()
+        }
+
+    def add_counts(self, deltas: Dict[Tuple[str, Tuple[str, ...]], float]) -> None:
+        """Add counter increments made elsewhere, e.g. in a worker process."""
+
+        counters = {metric.name: metric for metric in self._metrics if isinstance(metric, Counter)}
+        for (name, labels), amount in deltas.items():
+            if name in counters:
+                counters[name].inc(*labels, amount=amount)
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return lines
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "pdf_compare_request_duration_seconds", "Request latency by route.", ("route", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "pdf_compare_stage_duration_seconds", "Time spent in each request stage (self time).", ("stage",))
+PAGES_PARSED = REGISTRY.counter(
+    "pdf_compare_pages_parsed_total", "PDF pages whose words were read with PyMuPDF, including in worker processes.")
+CMM_REPORTS_PARSED = REGISTRY.counter(
+    "pdf_compare_cmm_reports_parsed_total", "CMM reports parsed into the index.", ("result",))
+SLOW_REQUESTS = REGISTRY.counter(
+    "pdf_compare_slow_requests_total", "Requests slower than the slow-request threshold.", ("route",))
+
+
+def render(caches: Optional[Dict[str, Dict[str, object]]] = None) -> str:
+    """Return every metric, plus cache counters from ``LRUCache.stats()`` dicts."""
+
+    lines = REGISTRY.render()
+    if caches:
+        for metric, key, kind, help in (
+            ("pdf_compare_cache_hits_total", "hits", "counter", "Cache lookups that found an entry."),
+            ("pdf_compare_cache_misses_total", "misses", "counter", "Cache lookups that missed."),
+            ("pdf_compare_cache_entries", "entries", "gauge", "Entries currently cached."),
+            ("pdf_compare_cache_hit_ratio", "hitRate", "gauge", "Hits per lookup since start."),
+        ):
+            lines.append(f"# HELP {metric} {help}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in sorted(caches.items()):
+                value = stats.get(key)
+                if value is not None:
+                    lines.append(f"{metric}{_labels(('cache',), (name,))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def format_stages(stages: Iterable[Tuple[str, float]]) -> str:
+    """``name=12ms`` pairs for log lines."""
+
+    return " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in stages)
@@ -0,0 +1,158 @@
+"""Compare one base document against many candidate documents.
+
+The base document's pages are extracted once (by the pool, into the shared
+artifact store) and every worker keeps them as
+:class:`textcompare.PreparedPage` objects, so their box index, marker index
+and reading order are built once per worker rather than once per candidate.
+Candidate pages are then matched against them page by page across all
+candidates, which keeps each worker's prepared base pages warm. The result
+is a change matrix (candidate x page) with the cells that stand out from
+the other candidates flagged as outliers.
+"""
+
+import time
+from statistics import median
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from content_store import file_digest
+from doc_cache import LRUCache
+from textcompare import PreparedPage, extract_page_words, match_pages, page_count, page_signature
+from workerpool import TaskPool
+
+# A cell is an outlier when its change count exceeds the page's median by
+# more than this many (scaled) median absolute deviations, and by at least one.
+OUTLIER_MADS = 3.0
+
+# Prepared base pages per process; tasks arrive page by page, so only a few
+# pages of the base are in use at any time.
+_PREPARED = LRUCache(max_entries=64)
+
+
+def prepared_page(path: str, page: int) -> PreparedPage:
+    key = (file_digest(path), page)
+    prepared = _PREPARED.get(key)
+    if prepared is None:
+        prepared = PreparedPage(extract_page_words(path, page))
+        _PREPARED.put(key, prepared)
+    return prepared
+
+
+def _extract_base_page(path: str, page: int) -> int:
+    return page_signature(path, page)['words']
+
+
+def diff_against_base(base_path: str, candidate_path: str, page: int, engine: str = 'box') -> Tuple[int, int]:
+    """Return the number of changed base and candidate boxes on one page."""
+
+    base_sig = page_signature(base_path, page)
+    candidate_sig = page_signature(candidate_path, page)
+    if base_sig['hash'] == candidate_sig['hash']:
+        return 0, 0
+    prepared = prepared_page(base_path, page)
+    left, right = match_pages(
+        prepared.words, extract_page_words(candidate_path, page), base_sig, candidate_sig, engine, prepared
+    )
+    return len(left), len(right)
+
+
+def _outliers(matrix: List[List[Optional[int]]], pages: int) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """Return per-page statistics and the outlier cells, largest excess first."""
+
+    page_stats = []
+    outliers = []
+    for p in range(pages):
+        column = [(c, row[p]) for c, row in enumerate(matrix) if p < len(row) and row[p] is not None]
+        if not column:
+            page_stats.append({'page': p + 1, 'median': None, 'max': None, 'changedCandidates': 0})
+            continue
+        values = [v for _c, v in column]
+        mid = median(values)
+        spread = 1.4826 * median(abs(v - mid) for v in values)
+        margin = OUTLIER_MADS * spread
+        page_stats.append({
+            'page': p + 1, 'median': mid, 'max': max(values), 'changedCandidates': sum(1 for v in values if v),
+        })
+        outliers.extend(
+            {'candidate': c, 'page': p + 1, 'changes': v, 'median': mid}
+            for c, v in column
+            if v - mid > margin and v - mid >= 1
+        )
+    outliers.sort(key=lambda o: (-(o['changes'] - o['median']), o['candidate'], o['page']))
+    return page_stats, outliers
+
+
+def compare_many(
+    base_path: str,
+    candidate_paths: Sequence[str],
+    pool: TaskPool,
+    page_timeout: Optional[float] = None,
+    engine: str = 'box',
+) -> Dict[str, object]:
+    """Diff every candidate against *base_path* on *pool* and return the change matrix.
+
+    ``candidates[i]['changes'][p - 1]`` is the number of changed boxes
+    (base plus candidate side, as ``/textdiff`` would draw them) on page
+    *p* of candidate *i*, or ``None`` when that page failed. Pages missing
+    on one side count every word on the other as changed.
+    """
+
+    started = time.perf_counter()
+    paths = [base_path] + list(candidate_paths)
+    counts: List[Optional[int]] = [None] * len(paths)
+    errors: List[Optional[str]] = [None] * len(paths)
+    for idx, count, error in pool.imap(page_count, [(p,) for p in paths]):
+        if error is not None:
+            errors[idx] = str(error) or type(error).__name__
+        else:
+            counts[idx] = count
+    if counts[0] is None:
+        raise ValueError(f"cannot open the base document: {errors[0]}")
+    base_pages = counts[0]
+
+    # Extract (and hash) the base once, spread over the workers; the words
+    # and signatures land in the artifact store every worker reads from.
+    for _idx, _words, _error in pool.imap(_extract_base_page, [(base_path, p) for p in range(1, base_pages + 1)]):
+        pass
+
+    candidates = []
+    for i, path in enumerate(candidate_paths, 1):
+        pages = max(base_pages, counts[i]) if counts[i] is not None else 0
+        candidates.append({
+            'pageCount': counts[i], 'changes': [None] * pages, 'left': [None] * pages, 'right': [None] * pages,
+            'failedPages': [], 'error': errors[i],
+        })
+
+    # Page-major order: all candidates of page 1, then page 2, ...
+    tasks = []
+    owners = []
+    for p in range(1, max((len(c['changes']) for c in candidates), default=0) + 1):
+        for c, cand in enumerate(candidates):
+            if p <= len(cand['changes']):
+                tasks.append((base_path, candidate_paths[c], p, engine))
+                owners.append((c, p))
+
+    for task_idx, result, error in pool.imap(diff_against_base, tasks, timeout=page_timeout):
+        c, p = owners[task_idx]
+        cand = candidates[c]
+        if error is not None:
+            cand['failedPages'].append({'page': p, 'error': str(error) or type(error).__name__})
+            continue
+        cand['left'][p - 1], cand['right'][p - 1] = result
+        cand['changes'][p - 1] = result[0] + result[1]
+
+    for cand in candidates:
+        cand['failedPages'].sort(key=lambda f: f['page'])
+        cand['changedPages'] = [p for p, n in enumerate(cand['changes'], 1) if n]
+        cand['totalChanges'] = sum(n for n in cand['changes'] if n)
+
+    pages = max([base_pages] + [len(c['changes']) for c in candidates])
+    page_stats, outliers = _outliers([c['changes'] for c in candidates], pages)
+    return {
+        'engine': engine,
+        'basePageCount': base_pages,
+        'pageCount': pages,
+        'candidates': candidates,
+        'pages': page_stats,
+        'outliers': outliers,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
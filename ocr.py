@@ -0,0 +1,154 @@
+"""OCR fallback for scanned pages that have no text layer.
+
+Pages whose ``get_text('words')`` is empty are rendered with PyMuPDF and
+read with Tesseract (through ``pytesseract``). The result uses the same
+``(x0, y0, x1, y1, text)`` tuples in PDF points as PyMuPDF, so callers can
+treat OCR words exactly like extracted ones. Results are cached in memory
+and as artifacts per document digest and page; OCR of several pages is
+spread over a process pool.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from content_store import ARTIFACTS, file_digest
+from doc_cache import DOCUMENTS, LRUCache
+from workerpool import TaskPool
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+try:
+    import pytesseract
+    from PIL import Image
+except Exception:
+    pytesseract = None
+
+OCR_DPI = 300
+# Tesseract word confidence (0-100) below which a word is discarded.
+MIN_CONFIDENCE = 30
+
+_OCR_ARTIFACT = "ocr-v1"
+_RESULTS = LRUCache(max_entries=1024)
+_available: Optional[bool] = None
+_pool: Optional[TaskPool] = None
+
+Word = Tuple[float, float, float, float, str]
+
+
+def ocr_available() -> bool:
+    """Return True when pytesseract and the tesseract binary can be used."""
+
+    global _available
+    if _available is None:
+        if pytesseract is None:
+            _available = False
+        else:
+            try:
+                pytesseract.get_tesseract_version()
+                _available = True
+            except Exception:
+                _available = False
+    return _available
+
+
+def ocr_kind(kind: str) -> str:
+    """Return the artifact kind for data derived from page words.
+
+    Without OCR, scanned pages read as empty. Data derived that way is
+    stored under a separate ``-noocr`` kind, so once tesseract is installed
+    it is derived again with the OCR words instead of being served as is.
+    """
+
+    return kind if ocr_available() else f"{kind}-noocr"
+
+
+def _render(path: str, page: int):
+    """Return ``(PIL image, page origin)`` for a 1-based page at OCR_DPI."""
+
+    with DOCUMENTS.document(path) as doc:
+        p = doc.load_page(page - 1)
+        zoom = OCR_DPI / 72.0
+        pix = p.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return image, (p.rect.x0, p.rect.y0)
+
+
+def _ocr_page(path: str, page: int) -> List[Word]:
+    """Run Tesseract on one page; module-level so it can run in a worker process."""
+
+    image, (ox, oy) = _render(path, page)
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    scale = 72.0 / OCR_DPI
+    words: List[Word] = []
+    for text, conf, left, top, width, height in zip(
+        data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]
+    ):
+        text = (text or "").strip()
+        try:
+            confidence = float(conf)
+        except (TypeError, ValueError):
+            confidence = -1
+        if not text or confidence < MIN_CONFIDENCE:
+            continue
+        x0 = ox + left * scale
+        y0 = oy + top * scale
+        words.append((x0, y0, x0 + width * scale, y0 + height * scale, text))
+    return words
+
+
+def _cached(digest: str, page: int) -> Optional[List[Word]]:
+    words = _RESULTS.get((digest, page))
+    if words is not None:
+        return words
+    stored = ARTIFACTS.get(_OCR_ARTIFACT, digest, page)
+    if stored is not None:
+        words = [tuple(w) for w in stored]
+        _RESULTS.put((digest, page), words)
+    return words
+
+
+def _remember(digest: str, page: int, words: List[Word]) -> None:
+    _RESULTS.put((digest, page), words)
+    ARTIFACTS.put(_OCR_ARTIFACT, digest, [list(w) for w in words], page)
+
+
+def ocr_words(path: str, page: int) -> List[Word]:
+    """Return OCR words for one page, or ``[]`` when OCR is unavailable."""
+
+    return ocr_pages(path, [page], workers=1).get(page, [])
+
+
+def ocr_pages(path: str, pages: Iterable[int], workers: Optional[int] = None) -> Dict[int, List[Word]]:
+    """OCR several pages of one document, in parallel when more than one is missing.
+
+    Pass ``workers=1`` from code that already runs inside a worker process.
+    """
+
+    if not ocr_available():
+        return {}
+
+    digest = file_digest(path)
+    results: Dict[int, List[Word]] = {}
+    missing = []
+    for page in pages:
+        words = _cached(digest, page)
+        if words is None:
+            missing.append(page)
+        else:
+            results[page] = words
+
+    if len(missing) == 1 or (missing and workers == 1):
+        for page in missing:
+            results[page] = _ocr_page(path, page)
+            _remember(digest, page, results[page])
+    elif missing:
+        global _pool
+        if _pool is None or (workers and _pool.workers != workers):
+            _pool = TaskPool(workers)
+        for idx, words, error in _pool.imap(_ocr_page, ((path, p) for p in missing)):
+            if error is None:
+                results[missing[idx]] = words
+                _remember(digest, missing[idx], words)
+    return results
@@ -0,0 +1,204 @@
+"""Align the pages of two documents that differ by inserted or removed pages.
+
+Every page is reduced to a 64-bit SimHash over its normalized words and word
+pairs. Candidate page pairs come from locality-sensitive hashing (the hash
+is cut into bands; pages that agree on any band collide) plus the pages at
+and next to the same position. Bands shared by many pages (a form or report
+template) only contribute the pages near the current offset between the
+documents, so the work grows roughly linearly with the page count. The alignment is the order-preserving set of candidate pairs
+with the highest total similarity, found as a weighted longest increasing
+subsequence.
+"""
+
+import hashlib
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from content_store import ARTIFACTS, file_digest
+from doc_cache import LRUCache
+from ocr import ocr_kind
+from textcompare import extract_page_words, page_count
+
+_BITS = 64
+_BANDS = 8
+_BAND_BITS = _BITS // _BANDS
+# Pairs less similar than this are treated as an inserted/removed page.
+MIN_SIMILARITY = 0.7
+# Band buckets with more pages than this only yield the pages within
+# _WINDOW of where the previous left page matched at _ANCHOR_SIMILARITY.
+_BUCKET_LIMIT = 16
+_WINDOW = 16
+_ANCHOR_SIMILARITY = 0.95
+
+_FINGERPRINTS_ARTIFACT = "simhash-v1"
+_ALIGNMENTS = LRUCache(max_entries=256)
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens: Sequence[str]) -> int:
+    """Return the 64-bit SimHash of *tokens* (0 for an empty page)."""
+
+    if not tokens:
+        return 0
+    # Column-wise bit counts over the binary strings keep the loop in C.
+    rows = [format(_token_hash(t), "064b") for t in tokens]
+    half = len(rows) / 2
+    bits = "".join("1" if column.count("1") > half else "0" for column in zip(*rows))
+    return int(bits, 2)
+
+
+def page_fingerprints(path: str) -> List[int]:
+    """Return one SimHash per page, stored per document digest."""
+
+    digest = file_digest(path)
+    stored = ARTIFACTS.get(ocr_kind(_FINGERPRINTS_ARTIFACT), digest)
+    if stored is not None:
+        return stored
+
+    prints = []
+    for page in range(1, page_count(path) + 1):
+        norms = [w['norm'] for w in extract_page_words(path, page)]
+        tokens = norms + [f"{a} {b}" for a, b in zip(norms, norms[1:])]
+        prints.append(simhash(tokens))
+    ARTIFACTS.put(ocr_kind(_FINGERPRINTS_ARTIFACT), digest, prints)
+    return prints
+
+
+def similarity(a: int, b: int) -> float:
+    return 1.0 - bin(a ^ b).count("1") / _BITS
+
+
+def _bands(value: int):
+    mask = (1 << _BAND_BITS) - 1
+    for band in range(_BANDS):
+        yield band, (value >> (band * _BAND_BITS)) & mask
+
+
+def _candidates(left: List[int], right: List[int]) -> Dict[Tuple[int, int], float]:
+    buckets: Dict[Tuple[int, int], List[int]] = {}
+    for j, fp in enumerate(right):
+        for band in _bands(fp):
+            buckets.setdefault(band, []).append(j)
+
+    # A bucket holding many pages says they use the same template, not
+    # which page is which; pairing through all of it would score every page
+    # against every other. Only its pages near the current offset (just
+    # after the previous page's best match) are kept.
+    pairs: Dict[Tuple[int, int], float] = {}
+    expect = 0
+    for i, fp in enumerate(left):
+        js = {j for j in (i - 1, i, i + 1) if 0 <= j < len(right)}
+        for band in _bands(fp):
+            members = buckets.get(band, ())
+            if len(members) <= _BUCKET_LIMIT:
+                js.update(members)
+            else:
+                # bucket members are in ascending page order
+                js.update(members[bisect_left(members, expect - _WINDOW):bisect_right(members, expect + _WINDOW)])
+        best = None
+        for j in js:
+            sim = similarity(fp, right[j])
+            if sim >= MIN_SIMILARITY:
+                pairs[(i, j)] = sim
+                if best is None or (sim, -abs(j - expect)) > best[0]:
+                    best = ((sim, -abs(j - expect)), j)
+        # Only a close match moves the offset; a page missing on the right
+        # would otherwise drag it to whichever template page scored best.
+        expect = best[1] + 1 if best is not None and best[0][0] >= _ANCHOR_SIMILARITY else expect + 1
+    return pairs
+
+
+def _best_monotone(pairs: Dict[Tuple[int, int], float], n_right: int) -> List[Tuple[int, int]]:
+    """Pick strictly increasing (i, j) pairs with maximal total similarity."""
+
+    # Fenwick tree over right indices holding (best score, pair id) prefixes.
+    tree: List[Tuple[float, int]] = [(0.0, -1)] * (n_right + 1)
+
+    def query(j: int) -> Tuple[float, int]:
+        best = (0.0, -1)
+        while j > 0:
+            if tree[j][0] > best[0]:
+                best = tree[j]
+            j -= j & -j
+        return best
+
+    def update(j: int, value: Tuple[float, int]) -> None:
+        while j <= n_right:
+            if value[0] > tree[j][0]:
+                tree[j] = value
+            j += j & -j
+
+    ordered = sorted(pairs)
+    back: List[int] = []
+    scores: List[float] = []
+    start = 0
+    while start < len(ordered):
+        # Pairs sharing a left page must not chain onto each other, so query
+        # the whole group before updating the tree with any of it.
+        end = start
+        while end < len(ordered) and ordered[end][0] == ordered[start][0]:
+            end += 1
+        group = []
+        for k in range(start, end):
+            i, j = ordered[k]
+            prev_score, prev = query(j)
+            group.append((k, j, prev_score + pairs[(i, j)], prev))
+        for k, j, score, prev in group:
+            back.append(prev)
+            scores.append(score)
+            update(j + 1, (score, k))
+        start = end
+
+    if not scores:
+        return []
+    k = max(range(len(scores)), key=scores.__getitem__)
+    chain = []
+    while k != -1:
+        chain.append(ordered[k])
+        k = back[k]
+    chain.reverse()
+    return chain
+
+
+def align_fingerprints(left: List[int], right: List[int]) -> Dict[str, object]:
+    """Align two fingerprint lists; page numbers in the result are 1-based.
+
+    ``rows`` lists ``[left page, right page]`` in reading order, with 0 for a
+    page that only exists on one side.
+    """
+
+    chain = _best_monotone(_candidates(left, right), len(right))
+    rows: List[List[int]] = []
+    li = ri = 0
+    for i, j in chain + [(len(left), len(right))]:
+        while li < i:
+            li += 1
+            rows.append([li, 0])
+        while ri < j:
+            ri += 1
+            rows.append([0, ri])
+        if i < len(left) and j < len(right):
+            li, ri = i + 1, j + 1
+            rows.append([li, ri])
+
+    return {
+        'rows': rows,
+        'pairs': [[i + 1, j + 1] for i, j in chain],
+        'leftOnly': [r[0] for r in rows if r[1] == 0],
+        'rightOnly': [r[1] for r in rows if r[0] == 0],
+        'similarity': [round(similarity(left[i], right[j]), 4) for i, j in chain],
+    }
+
+
+def align_documents(left_path: str, right_path: str) -> Dict[str, object]:
+    """Return the cached page alignment for a document pair."""
+
+    key = f"{file_digest(left_path)}:{file_digest(right_path)}"
+    result: Optional[Dict[str, object]] = _ALIGNMENTS.get(key)
+    if result is None:
+        result = align_fingerprints(page_fingerprints(left_path), page_fingerprints(right_path))
+        _ALIGNMENTS.put(key, result)
+    return result
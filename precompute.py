@@ -0,0 +1,261 @@
+"""Background precomputation of ``/textdiff`` results after an upload.
+
+Each uploaded pair becomes a job whose pages are diffed by a single worker
+thread in page order. Results are written as the exact ``/textdiff`` JSON
+payload to ``<uploads>/.textdiff/<payload tag>/<pair key>/<page>.json`` and
+kept in a bounded in-memory cache, so a request for a finished page is a
+dictionary lookup. A request for a page that has not been computed yet claims
+it and diffs it itself; the worker skips claimed pages, and a request for the
+page the worker is diffing right now waits for that result.
+"""
+
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+from content_store import file_digest
+from doc_cache import LRUCache
+from ocr import ocr_kind
+from textcompare import diff_page, page_count
+
+# Bump when the /textdiff payload for the same input changes; it is part of
+# the storage path (and of the /textdiff ETag), so old payloads are not served.
+PAYLOAD_VERSION = 1
+
+
+def payload_tag() -> str:
+    """Return the tag stored payloads and /textdiff ETags are versioned by.
+
+    Besides :data:`PAYLOAD_VERSION` it records whether scanned pages were
+    OCR'd, so payloads diffed without OCR are not served once it is there.
+    """
+
+    return ocr_kind(f"v{PAYLOAD_VERSION}")
+
+# Queue priorities: job setup, then the pages in page order.
+_SETUP, _NORMAL = 0, 1
+# Finished jobs are forgotten after this many seconds; status() then reports
+# the pages found on disk.
+_FINISHED_TTL = 600
+
+
+def pair_key(left_path: str, right_path: str) -> str:
+    """Return a key derived from the content digests of both documents."""
+
+    ident = f"{file_digest(left_path)}:{file_digest(right_path)}"
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+class _Job:
+    def __init__(self, key: str, left_path: str, right_path: str):
+        self.key = key
+        self.left_path = left_path
+        self.right_path = right_path
+        self.page_count: Optional[int] = None
+        self.done: Set[int] = set()
+        self.errors: Dict[int, str] = {}
+        # Pages a request is diffing itself, by thread id, and the page the
+        # worker is diffing.
+        self.claimed: Dict[int, int] = {}
+        self.running: Optional[int] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+
+    def in_range(self, page: int) -> bool:
+        """False once setup has shown *page* is outside the documents."""
+
+        return self.page_count is None or 1 <= page <= self.page_count
+
+
+class DiffPrecomputer:
+    def __init__(self, root: str, compute: Callable[[str, str, int], object] = diff_page, max_cached_mb: int = 64):
+        self.root = os.path.join(root, payload_tag())
+        self._compute = compute
+        self._memory = LRUCache(max_entries=100000, max_bytes=max_cached_mb * 1024 * 1024)
+        self._jobs: Dict[str, _Job] = {}
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- storage -----------------------------------------------------------
+    def _page_file(self, key: str, page: int) -> str:
+        return os.path.join(self.root, key, f"{page}.json")
+
+    def _load(self, key: str, page: int) -> Optional[str]:
+        payload = self._memory.get((key, page))
+        if payload is not None:
+            return payload
+        try:
+            with open(self._page_file(key, page), "r", encoding="utf-8") as fh:
+                payload = fh.read()
+        except OSError:
+            return None
+        self._memory.put((key, page), payload, len(payload))
+        return payload
+
+    def store(self, left_path: str, right_path: str, page: int, payload: str) -> None:
+        """Persist a payload computed outside the background worker."""
+
+        key = pair_key(left_path, right_path)
+        self._save(key, page, payload)
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None and job.in_range(page):
+                job.claimed.pop(page, None)
+                self._mark_done(job, page)
+
+    def release(self, left_path: str, right_path: str, page: int) -> None:
+        """Give back a page claimed by :meth:`get` without storing a payload."""
+
+        with self._cond:
+            job = self._jobs.get(pair_key(left_path, right_path))
+            if job is None or job.claimed.get(page) != threading.get_ident():
+                return
+            del job.claimed[page]
+            if page not in job.done and job.page_count is not None:
+                self._push(_NORMAL, page, job.key, page)
+            self._cond.notify_all()
+
+    def _save(self, key: str, page: int, payload: str) -> None:
+        path = self._page_file(key, page)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(payload)
+        os.replace(tmp, path)
+        self._memory.put((key, page), payload, len(payload))
+
+    # -- queue -------------------------------------------------------------
+    def _push(self, priority: int, order: int, key: str, page: Optional[int]) -> None:
+        heapq.heappush(self._heap, (priority, order, next(self._seq), key, page))
+
+    def submit(self, left_path: str, right_path: str) -> str:
+        """Queue every page of the pair for background diffing."""
+
+        key = pair_key(left_path, right_path)
+        with self._cond:
+            self._prune()
+            if key not in self._jobs:
+                self._jobs[key] = _Job(key, left_path, right_path)
+                self._push(_SETUP, 0, key, None)
+                self._cond.notify_all()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="textdiff-precompute", daemon=True)
+                self._thread.start()
+        return key
+
+    def get(self, left_path: str, right_path: str, page: int, wait: Optional[float] = None) -> Optional[str]:
+        """Return the stored payload for *page*, or ``None`` if the caller should diff it.
+
+        If the worker (or another request) is diffing the page right now,
+        this blocks for up to *wait* seconds (``None``: until it is done or
+        failed) for that result instead. Otherwise a pending job's page is
+        claimed for the calling thread, so the worker skips it; the caller
+        then hands the result to :meth:`store` and calls :meth:`release`
+        (a no-op after ``store``) when done, also on failure.
+        """
+
+        key = pair_key(left_path, right_path)
+        payload = self._load(key, page)
+        if payload is not None:
+            return payload
+
+        deadline = None if wait is None else time.monotonic() + wait
+        with self._cond:
+            while True:
+                job = self._jobs.get(key)
+                if job is None or job.finished is not None or not job.in_range(page) or page in job.done:
+                    break
+                if job.running != page and page not in job.claimed:
+                    job.claimed[page] = threading.get_ident()
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self._load(key, page)
+
+    def status(self, left_path: str, right_path: str) -> Dict[str, object]:
+        key = pair_key(left_path, right_path)
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None:
+                finished = job.finished or time.time()
+                return {
+                    'state': 'done' if job.finished else ('running' if job.page_count is not None else 'queued'),
+                    'pageCount': job.page_count,
+                    'pagesDone': len(job.done),
+                    'errors': {str(p): e for p, e in sorted(job.errors.items())},
+                    'elapsed': round(finished - job.created, 3),
+                }
+        folder = os.path.join(self.root, key)
+        stored = len([f for f in os.listdir(folder) if f.endswith('.json')]) if os.path.isdir(folder) else 0
+        return {'state': 'stored' if stored else 'unknown', 'pageCount': None, 'pagesDone': stored}
+
+    # -- worker ------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _prio, _order, _seq, key, page = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+                if job is None or job.finished is not None:
+                    continue
+                if page is not None:
+                    if page in job.done or page in job.claimed or not job.in_range(page):
+                        continue
+                    job.running = page
+
+            if page is None:
+                self._setup(job)
+                continue
+
+            try:
+                if self._load(key, page) is None:
+                    payload = json.dumps(self._compute(job.left_path, job.right_path, page))
+                    self._save(key, page, payload)
+            except Exception as exc:
+                with self._cond:
+                    job.errors[page] = str(exc)
+
+            with self._cond:
+                job.running = None
+                self._mark_done(job, page)
+
+    def _mark_done(self, job: _Job, page: int) -> None:
+        job.done.add(page)
+        if job.page_count is not None and len(job.done) >= job.page_count:
+            job.finished = time.time()
+        self._cond.notify_all()
+
+    def _prune(self) -> None:
+        """Forget jobs that finished more than ``_FINISHED_TTL`` seconds ago."""
+
+        cutoff = time.time() - _FINISHED_TTL
+        for key in [k for k, job in self._jobs.items() if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[key]
+
+    def _setup(self, job: _Job) -> None:
+        try:
+            pages = max(page_count(job.left_path), page_count(job.right_path))
+        except Exception as exc:
+            pages = 0
+            job.errors[0] = str(exc)
+        with self._cond:
+            job.page_count = pages
+            # Pages already served (or failed) before setup count as done.
+            job.done = {p for p in job.done if 1 <= p <= pages}
+            job.errors = {p: e for p, e in job.errors.items() if p == 0 or 1 <= p <= pages}
+            for p in range(1, pages + 1):
+                if p not in job.done:
+                    self._push(_NORMAL, p, job.key, p)
+            if len(job.done) >= pages:
+                job.finished = time.time()
+            self._cond.notify_all()
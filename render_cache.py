@@ -0,0 +1,188 @@
+"""Server-side page rasterization with a two-level (memory + disk) cache.
+
+Rendered PNGs are keyed by ``(content digest, page, scale, tile)``. The disk
+level lives under ``<root>/<digest[:2]>/`` and is trimmed oldest-first once
+it grows past its byte budget. After a page is served its neighbours are
+queued for rendering on a background thread so paging through a document
+mostly hits the cache.
+"""
+
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from content_store import file_digest
+from doc_cache import DOCUMENTS, LRUCache
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+MIN_SCALE = 0.25
+MAX_SCALE = 5.0
+TILE_SIZE = 512
+
+
+def quantize_scale(scale: float) -> float:
+    """Clamp *scale* and snap it to the viewer's 0.1 zoom steps."""
+
+    scale = min(MAX_SCALE, max(MIN_SCALE, scale))
+    return round(scale * 10) / 10
+
+
+def render_png(path: str, page: int, scale: float, tile: Optional[Tuple[int, int]] = None) -> bytes:
+    """Rasterize a 1-based page (optionally one TILE_SIZE tile of it) to PNG."""
+
+    with DOCUMENTS.document(path) as doc:
+        if page < 1 or page > doc.page_count:
+            raise IndexError(f"page {page} out of range")
+        p = doc.load_page(page - 1)
+        matrix = fitz.Matrix(scale, scale)
+        clip = None
+        if tile is not None:
+            col, row = tile
+            step = TILE_SIZE / scale
+            rect = p.rect
+            clip = fitz.Rect(
+                rect.x0 + col * step,
+                rect.y0 + row * step,
+                min(rect.x1, rect.x0 + (col + 1) * step),
+                min(rect.y1, rect.y0 + (row + 1) * step),
+            )
+            if clip.is_empty:
+                raise IndexError(f"tile {col},{row} out of range")
+        pix = p.get_pixmap(matrix=matrix, clip=clip, alpha=False)
+        return pix.tobytes("png")
+
+
+class RenderCache:
+    def __init__(
+        self,
+        root: str,
+        max_disk_bytes: int,
+        max_memory_bytes: int,
+        render: Callable[..., bytes] = render_png,
+    ):
+        self.root = root
+        self._render = render
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = LRUCache(max_entries=4096, max_bytes=max_memory_bytes)
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._scanned = False
+        self._prefetch: "queue.Queue" = queue.Queue(maxsize=32)
+        self._prefetch_thread: Optional[threading.Thread] = None
+
+    def _scan(self) -> None:
+        """Index files left on disk by earlier runs, oldest first."""
+
+        if self._scanned:
+            return
+        self._scanned = True
+        entries = []
+        for folder, _dirs, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".png"):
+                    full = os.path.join(folder, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, full, st.st_size))
+        for _mtime, full, size in sorted(entries):
+            self._disk[full] = size
+            self._disk_bytes += size
+
+    def _file(self, digest: str, page: int, scale: float, tile) -> str:
+        suffix = "" if tile is None else f"-t{tile[0]}_{tile[1]}"
+        return os.path.join(self.root, digest[:2], f"{digest}-p{page}-s{scale:g}{suffix}.png")
+
+    def get(self, path: str, page: int, scale: float, tile=None) -> bytes:
+        """Return PNG bytes for the page, rendering and caching on a miss."""
+
+        digest = file_digest(path)
+        key = (digest, page, scale, tile)
+        data = self._memory.get(key)
+        if data is not None:
+            return data
+
+        disk_path = self._file(digest, page, scale, tile)
+        with self._lock:
+            self._scan()
+            on_disk = disk_path in self._disk
+            if on_disk:
+                self._disk.move_to_end(disk_path)
+        if on_disk:
+            try:
+                with open(disk_path, "rb") as fh:
+                    data = fh.read()
+            except OSError:
+                data = None
+        if data is None:
+            data = self._render(path, page, scale, tile)
+            self._write(disk_path, data)
+        self._memory.put(key, data, len(data))
+        return data
+
+    def contains(self, path: str, page: int, scale: float, tile=None) -> bool:
+        digest = file_digest(path)
+        if (digest, page, scale, tile) in self._memory:
+            return True
+        with self._lock:
+            self._scan()
+            return self._file(digest, page, scale, tile) in self._disk
+
+    def _write(self, disk_path: str, data: bytes) -> None:
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            tmp = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, disk_path)
+        except OSError:
+            return
+        evict = []
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(disk_path, 0)
+            self._disk[disk_path] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evict.append(old)
+        for old in evict:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def prefetch(self, path: str, pages, scale: float) -> None:
+        """Queue whole-page renders of *pages* without blocking the caller."""
+
+        if self._prefetch_thread is None or not self._prefetch_thread.is_alive():
+            self._prefetch_thread = threading.Thread(target=self._run_prefetch, name="render-prefetch", daemon=True)
+            self._prefetch_thread.start()
+        for page in pages:
+            try:
+                self._prefetch.put_nowait((path, page, scale))
+            except queue.Full:
+                # Prefetching is best effort; the page renders on demand instead.
+                return
+
+    def _run_prefetch(self) -> None:
+        while True:
+            path, page, scale = self._prefetch.get()
+            try:
+                if not self.contains(path, page, scale):
+                    self.get(path, page, scale)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            disk = {'entries': len(self._disk), 'bytes': self._disk_bytes, 'maxBytes': self.max_disk_bytes}
+        return {'memory': self._memory.stats(), 'disk': disk}
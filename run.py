@@ -3,8 +3,10 @@
 PDF Compare Tool Launcher
 Cross-platform executable to start the PDF Compare application.
 Usage: python run.py  (or ./run.py on Linux/macOS after chmod +x)
+       python run.py --production [--threads 8]   (multi-user server)
 """
 
+import argparse
 import os
 import platform
 import shutil
@@ -36,6 +38,12 @@ def ensure_venv(venv_path: Path) -> Path:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Start the PDF Compare Tool")
+    parser.add_argument("--production", action="store_true",
+                        help="serve with waitress and diff pages in worker processes, for several users at once")
+    parser.add_argument("--threads", type=int, help="request threads in production mode (default 8)")
+    args = parser.parse_args()
+
     script_dir = Path(__file__).parent.absolute()
     os.chdir(script_dir)
 
@@ -72,12 +80,16 @@ def main():
     )
     port = os.environ.get("PDF_COMPARE_PORT", "5000")
 
-    print("Starting PDF Compare Tool...")
+    print("Starting PDF Compare Tool" + (" (production server)..." if args.production else "..."))
     print(f"Open your browser to: http://{host}:{port}")
     print("Press Ctrl+C to stop the server\n")
 
     env = os.environ.copy()
     env.update({"PDF_COMPARE_HOST": host, "PDF_COMPARE_PORT": str(port)})
+    if args.production:
+        env["PDF_COMPARE_SERVER"] = "production"
+    if args.threads:
+        env["PDF_COMPARE_THREADS"] = str(args.threads)
     subprocess.run([str(venv_python), "app.py"], env=env)
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""Linear-space Myers diff over sequences of hashable tokens.
+
+This follows the bisection used by diff-match-patch: the forward and reverse
+D-paths are advanced together until they overlap, the problem is split at
+that point, and both halves are solved recursively after trimming their
+common prefix and suffix. Memory stays O(N + M) and time is O((N + M) D),
+where D is the number of edits.
+"""
+
+from typing import Hashable, List, Sequence, Tuple
+
+EQUAL = 'equal'
+DELETE = 'delete'
+INSERT = 'insert'
+
+# (tag, a_start, a_end, b_start, b_end), like difflib opcodes without 'replace'
+Opcode = Tuple[str, int, int, int, int]
+
+
+def diff(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Opcode]:
+    """Return opcodes that turn *a* into *b*, merged into maximal runs."""
+
+    raw: List[Opcode] = []
+    _diff(a, 0, len(a), b, 0, len(b), raw)
+
+    merged: List[Opcode] = []
+    for op in raw:
+        if op[1] == op[2] and op[3] == op[4]:
+            continue
+        if merged and merged[-1][0] == op[0]:
+            tag, a1, _a2, b1, _b2 = merged[-1]
+            merged[-1] = (tag, a1, op[2], b1, op[4])
+        else:
+            merged.append(op)
+    return merged
+
+
+def _diff(a, alo: int, ahi: int, b, blo: int, bhi: int, out: List[Opcode]) -> None:
+    # common prefix
+    start_a, start_b = alo, blo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start_a:
+        out.append((EQUAL, start_a, alo, start_b, blo))
+
+    # common suffix (emitted after the middle)
+    end_a, end_b = ahi, bhi
+    while ahi > alo and bhi > blo and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+
+    if alo == ahi:
+        out.append((INSERT, alo, alo, blo, bhi))
+    elif blo == bhi:
+        out.append((DELETE, alo, ahi, blo, blo))
+    else:
+        x, y = _bisect(a, alo, ahi, b, blo, bhi)
+        if x is None:
+            out.append((DELETE, alo, ahi, blo, blo))
+            out.append((INSERT, ahi, ahi, blo, bhi))
+        else:
+            _diff(a, alo, x, b, blo, y, out)
+            _diff(a, x, ahi, b, y, bhi, out)
+
+    if ahi < end_a:
+        out.append((EQUAL, ahi, end_a, bhi, end_b))
+
+
+def _bisect(a, alo: int, ahi: int, b, blo: int, bhi: int):
+    """Return the absolute split point of the middle snake, or ``(None, None)``."""
+
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    # With an odd delta the paths can only meet while extending forward.
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return alo + x1, blo + y1
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+
+    return None, None
@@ -4,6 +4,18 @@
   const resultsSection = document.getElementById('results');
   const summaryEl = document.getElementById('summary');
   const tableBody = document.querySelector('#resultsTable tbody');
+  const pageInfoEl = document.getElementById('pageInfo');
+  const prevPageBtn = document.getElementById('prevPage');
+  const nextPageBtn = document.getElementById('nextPage');
+  const sortSelect = document.getElementById('sortBy');
+  const detailSection = document.getElementById('featureDetail');
+  const detailTitle = document.getElementById('detailTitle');
+  const detailStats = document.getElementById('detailStats');
+  const detailCanvas = document.getElementById('detailChart');
+
+  const PAGE_SIZE = 50;
+  const SPARKLINE_WIDTH = 140;
+  const SPARKLINE_HEIGHT = 36;
 
   function setStatus(message, isError=false) {
     statusEl.textContent = message;
@@ -25,39 +37,9 @@
     return Number.isFinite(num) ? num : NaN;
   }
 
-  function firstNumeric(values) {
-    for (const v of values) {
-      const num = parseNumeric(v);
-      if (Number.isFinite(num)) return num;
-    }
-    return null;
-  }
-
-  function isOutOfTolerance(points) {
-    if (!points || !points.length) return false;
-    for (const pt of points) {
-      const nominal = parseNumeric(pt.nominal);
-      const actual = parseNumeric(pt.actual);
-      const deviation = parseNumeric(pt.deviation);
-
-      const upper = parseNumeric(pt.upperTol);
-      const lower = parseNumeric(pt.lowerTol);
-
-      const hasActual = Number.isFinite(nominal) && Number.isFinite(actual);
-      const hasUpper = Number.isFinite(upper);
-      const hasLower = Number.isFinite(lower);
-
-      if (hasActual) {
-        if (hasUpper && actual > nominal + upper) return true;
-        if (hasLower && actual < nominal + lower) return true;
-      } else {
-        if (!Number.isNaN(deviation)) {
-          if (hasUpper && deviation > upper) return true;
-          if (hasLower && deviation < lower) return true;
-        }
-      }
-    }
-    return false;
+  function formatStat(value, digits) {
+    if (value === null || value === undefined) return '—';
+    return Number(value).toFixed(digits);
   }
 
   let tooltipEl;
@@ -108,24 +90,26 @@
     canvas.addEventListener('mouseleave', hideTooltip);
   }
 
-  function renderSparkline(canvas, points) {
+  // points: [{ deviation, report, pos }] where pos (0..1) places a point of a
+  // downsampled series; stats: server aggregates ({ upperTol, lowerTol, outOfTolerance })
+  function renderSparkline(canvas, points, stats, width = SPARKLINE_WIDTH, height = SPARKLINE_HEIGHT) {
     if (!canvas || !points || points.length === 0) return;
     const ctx = canvas.getContext('2d');
-    const width = canvas.width = 140;
-    const height = canvas.height = 36;
+    canvas.width = width;
+    canvas.height = height;
 
     const plottedPoints = points
       .map((p, idx) => {
         const deviation = parseNumeric(p.deviation);
         if (!Number.isFinite(deviation)) return null;
-        return { deviation, report: p.report || `Report ${idx + 1}` };
+        return { deviation, report: p.report || `Report ${idx + 1}`, pos: p.pos };
       })
       .filter(Boolean);
 
     const deviationValues = plottedPoints.map(p => p.deviation);
-    const upperTol = firstNumeric(points.map(p => p.upperTol));
-    const lowerTol = firstNumeric(points.map(p => p.lowerTol));
-    const outOfTolerance = isOutOfTolerance(points);
+    const upperTol = stats && stats.upperTol !== null ? stats.upperTol : null;
+    const lowerTol = stats && stats.lowerTol !== null ? stats.lowerTol : null;
+    const outOfTolerance = Boolean(stats && stats.outOfTolerance);
 
     const domainValues = deviationValues.slice();
     if (upperTol !== null) domainValues.push(upperTol);
@@ -153,9 +137,14 @@
     ctx.lineWidth = 2;
     ctx.beginPath();
 
+    const xFor = (pt, idx) => {
+      if (pt.pos !== undefined) return pt.pos * (width - 6) + 3;
+      return deviationValues.length === 1 ? width / 2 : (idx / (deviationValues.length - 1)) * (width - 6) + 3;
+    };
+
     const pointMeta = [];
     plottedPoints.forEach((pt, idx) => {
-      const x = deviationValues.length === 1 ? width / 2 : (idx / (deviationValues.length - 1)) * (width - 6) + 3;
+      const x = xFor(pt, idx);
       const y = height - ((pt.deviation - min) / range) * (height - 6) - 3;
       pointMeta.push({ x, y, label: pt.report });
       if (idx === 0) ctx.moveTo(x, y);
@@ -164,11 +153,12 @@
     ctx.stroke();
 
     ctx.fillStyle = '#1e88e5';
+    const radius = plottedPoints.length > width / 4 ? 1.5 : 3;
     plottedPoints.forEach((pt, idx) => {
-      const x = deviationValues.length === 1 ? width / 2 : (idx / (deviationValues.length - 1)) * (width - 6) + 3;
+      const x = xFor(pt, idx);
       const y = height - ((pt.deviation - min) / range) * (height - 6) - 3;
       ctx.beginPath();
-      ctx.arc(x, y, 3, 0, Math.PI * 2);
+      ctx.arc(x, y, radius, 0, Math.PI * 2);
       ctx.fill();
     });
 
@@ -208,47 +198,77 @@
     }
   }
 
-  function renderTable(data) {
-    tableBody.innerHTML = '';
-    const features = data.features || [];
+  // Current query and page; the table shows one page of /api/cmm_features
+  let currentQuery = null;
+  let pageOffset = 0;
+  let totalFeatures = 0;
+  let loadSeq = 0;
+
+  function seriesPoints(series, reports) {
+    const last = Math.max(1, series.total - 1);
+    return series.index.map((pointIndex, i) => ({
+      deviation: series.deviation[i],
+      report: reports[series.report[i]],
+      pos: series.total === 1 ? 0.5 : pointIndex / last,
+    }));
+  }
 
-    if (!features.length) {
-      setStatus('No feature rows were found with the current filters.', false);
-      resultsSection.hidden = true;
-      return false;
+  function featureRow(stats, points) {
+    const row = document.createElement('tr');
+    row.classList.toggle('cmm-row-out-of-tolerance', Boolean(stats.outOfTolerance));
+    row.classList.add('cmm-row-clickable');
+    row.addEventListener('click', () => loadDetail(stats.name));
+
+    const nameCell = document.createElement('td');
+    nameCell.textContent = stats.name;
+    row.appendChild(nameCell);
+
+    const deviationCell = document.createElement('td');
+    deviationCell.innerHTML = formatDeviation(stats.latest);
+    row.appendChild(deviationCell);
+
+    const meanCell = document.createElement('td');
+    meanCell.textContent = stats.mean !== null
+      ? `${formatStat(stats.mean, 4)} ± ${formatStat(stats.sigma, 4)}`
+      : '—';
+    row.appendChild(meanCell);
+
+    const cpkCell = document.createElement('td');
+    cpkCell.textContent = formatStat(stats.cpk, 2);
+    if (stats.outOfToleranceCount) {
+      cpkCell.title = `${stats.outOfToleranceCount} of ${stats.points} point(s) out of tolerance`;
     }
+    row.appendChild(cpkCell);
+
+    const trendCell = document.createElement('td');
+    const canvas = document.createElement('canvas');
+    canvas.className = 'sparkline';
+    renderSparkline(canvas, points, stats);
+    trendCell.appendChild(canvas);
+    row.appendChild(trendCell);
+    return row;
+  }
 
-    features.forEach(feature => {
-      const row = document.createElement('tr');
-      const outOfTolerance = isOutOfTolerance(feature.points || []);
-
-      if (outOfTolerance) {
-        row.classList.add('cmm-row-out-of-tolerance');
-      }
-
-      const nameCell = document.createElement('td');
-      nameCell.textContent = feature.name;
-      row.appendChild(nameCell);
-
-      const deviationCell = document.createElement('td');
-      deviationCell.innerHTML = formatDeviation(feature.latest);
-      row.appendChild(deviationCell);
-
-      const trendCell = document.createElement('td');
-      if (feature.points && feature.points.length) {
-        const canvas = document.createElement('canvas');
-        canvas.className = 'sparkline';
-        renderSparkline(canvas, feature.points);
-        trendCell.appendChild(canvas);
-      } else {
-        trendCell.textContent = 'No data';
-      }
-      row.appendChild(trendCell);
+  function renderPage(data) {
+    const columns = data.features || {};
+    const names = columns.name || [];
+    totalFeatures = data.total || 0;
 
-      tableBody.appendChild(row);
+    const fragment = document.createDocumentFragment();
+    names.forEach((name, idx) => {
+      const stats = {};
+      Object.keys(columns).forEach(key => { stats[key] = columns[key][idx]; });
+      fragment.appendChild(featureRow(stats, seriesPoints(data.series[idx], data.reports)));
     });
+    tableBody.innerHTML = '';
+    tableBody.appendChild(fragment);
+
+    const first = totalFeatures ? pageOffset + 1 : 0;
+    pageInfoEl.textContent = `Features ${first}–${pageOffset + names.length} of ${totalFeatures}`;
+    prevPageBtn.disabled = pageOffset === 0;
+    nextPageBtn.disabled = pageOffset + names.length >= totalFeatures;
 
-    let summary = `Features: ${features.length}`;
+    let summary = `Features: ${totalFeatures}`;
     if (typeof data.reportsAnalyzed === 'number') {
       summary += ` • Reports analyzed: ${data.reportsAnalyzed}`;
     }
@@ -256,8 +276,107 @@
       summary += ` • ${data.errors.length} files skipped`;
     }
     summaryEl.textContent = summary;
-    resultsSection.hidden = false;
-    return true;
+    resultsSection.hidden = totalFeatures === 0;
+    return totalFeatures > 0;
+  }
+
+  async function postJson(url, body) {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+    const text = await response.text();
+    if (!response.ok) throw new Error(text);
+    return JSON.parse(text || '{}');
+  }
+
+  async function loadPage() {
+    // Reads only what is indexed; the streamed scan does the parsing
+    const seq = ++loadSeq;
+    const data = await postJson('/api/cmm_features', {
+      ...currentQuery,
+      offset: pageOffset,
+      limit: PAGE_SIZE,
+      sort: sortSelect ? sortSelect.value : 'name',
+      width: SPARKLINE_WIDTH,
+      refresh: false,
+    });
+    if (seq !== loadSeq) return null;
+    renderPage(data);
+    return data;
+  }
+
+  async function loadDetail(name) {
+    // full-resolution points are only fetched for the feature being inspected
+    try {
+      const data = await postJson('/api/cmm_series', { ...currentQuery, feature: name, refresh: false });
+      const series = data.series;
+      const points = series.deviation.map((deviation, i) => ({
+        deviation,
+        report: `${series.report[i]} (${series.date[i]})`,
+      }));
+      const stats = data.stats;
+      detailTitle.textContent = name;
+      detailStats.textContent = `${series.total} point(s) • mean ${formatStat(stats.mean, 4)} • σ ${formatStat(stats.sigma, 4)}`
+        + ` • Cp ${formatStat(stats.cp, 2)} • Cpk ${formatStat(stats.cpk, 2)}`
+        + ` • ${stats.outOfToleranceCount} out of tolerance`;
+      detailSection.hidden = false;
+      const width = Math.max(320, detailSection.clientWidth - 32);
+      renderSparkline(detailCanvas, points, stats, width, 220);
+      detailCanvas.style.width = `${width}px`;
+      detailCanvas.style.height = '220px';
+      detailSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+    } catch (err) {
+      setStatus(`Could not load ${name}: ${err.message}`, true);
+    }
+  }
+
+  function resetTable() {
+    loadSeq++;
+    pageOffset = 0;
+    totalFeatures = 0;
+    tableBody.innerHTML = '';
+    summaryEl.textContent = '';
+    resultsSection.hidden = true;
+    if (detailSection) detailSection.hidden = true;
+  }
+
+  function changePage(delta) {
+    const next = pageOffset + delta * PAGE_SIZE;
+    if (!currentQuery || next < 0 || next >= totalFeatures) return;
+    pageOffset = next;
+    loadPage().catch(err => setStatus(`Request failed: ${err.message}`, true));
+  }
+
+  prevPageBtn.addEventListener('click', () => changePage(-1));
+  nextPageBtn.addEventListener('click', () => changePage(1));
+  if (sortSelect) {
+    sortSelect.addEventListener('change', () => {
+      if (!currentQuery) return;
+      pageOffset = 0;
+      loadPage().catch(err => setStatus(`Request failed: ${err.message}`, true));
+    });
+  }
+
+  async function* readEvents(response) {
+    // NDJSON: one event per line, possibly split across chunks
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let newline;
+      while ((newline = buffer.indexOf('\n')) >= 0) {
+        const line = buffer.slice(0, newline).trim();
+        buffer = buffer.slice(newline + 1);
+        if (line) yield JSON.parse(line);
+      }
+    }
+    buffer += decoder.decode();
+    if (buffer.trim()) yield JSON.parse(buffer);
   }
 
   form.addEventListener('submit', async (event) => {
@@ -275,29 +394,55 @@
       return;
     }
 
+    resetTable();
+    currentQuery = payload;
     setStatus('Scanning reports...', false);
 
     try {
-      const response = await fetch('/api/cmm_summary', {
+      // Progress only; the table pages through what is already indexed
+      const response = await fetch('/api/cmm_summary?format=ndjson&detail=0', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
       });
 
-      const text = await response.text();
       if (!response.ok) {
+        const text = await response.text();
         setStatus(`Error: ${text}`, true);
         resultsSection.hidden = true;
         return;
       }
 
-      const data = JSON.parse(text || '{}');
-      const hasFeatures = renderTable(data);
-
-      if (data.errors && data.errors.length) {
-        setStatus(`Completed with ${data.errors.length} skipped file(s).`, false);
-      } else if (hasFeatures) {
-        setStatus('Complete.', false);
+      let total = 0;
+      let lastRefresh = 0;
+      for await (const evt of readEvents(response)) {
+        if (evt.type === 'start') {
+          total = evt.files;
+          setStatus(evt.toParse
+            ? `Found ${evt.files} report(s); parsing ${evt.toParse} new...`
+            : `Found ${evt.files} report(s).`, false);
+          loadPage().catch(() => {});
+          lastRefresh = Date.now();
+        } else if (evt.type === 'progress') {
+          let message = `Parsed ${evt.parsed + evt.failed} of ${evt.toParse} new report(s) (${total} total)`;
+          if (evt.failed) message += `, ${evt.failed} failed`;
+          setStatus(`${message}...`, false);
+          if (Date.now() - lastRefresh > 2000) {
+            // show partial results while the scan continues
+            lastRefresh = Date.now();
+            loadPage().catch(() => {});
+          }
+        } else if (evt.type === 'summary') {
+          const data = await loadPage();
+          const hasFeatures = data ? data.total > 0 : false;
+          if (evt.errors && evt.errors.length) {
+            setStatus(`Completed with ${evt.errors.length} skipped file(s).`, false);
+          } else if (hasFeatures) {
+            setStatus('Complete.', false);
+          } else {
+            setStatus('No feature rows were found with the current filters.', false);
+          }
+        }
       }
     } catch (err) {
       setStatus(`Request failed: ${err.message}`, true);
@@ -0,0 +1,129 @@
+(function(){
+  const params = new URLSearchParams(location.search);
+  const BASE = params.get('base');
+  const CANDIDATES = params.getAll('c');
+
+  const statusEl = document.getElementById('status');
+  const baseInfoEl = document.getElementById('baseInfo');
+  const resultsSection = document.getElementById('results');
+  const summaryEl = document.getElementById('summary');
+  const tableHead = document.querySelector('#matrixTable thead');
+  const tableBody = document.querySelector('#matrixTable tbody');
+  const outlierSection = document.getElementById('outliers');
+  const outlierList = document.getElementById('outlierList');
+  const engineSelect = document.getElementById('engine');
+  const sortSelect = document.getElementById('sortBy');
+
+  const MAX_OUTLIERS = 25;
+
+  let data = null;
+
+  function setStatus(message, isError=false) {
+    statusEl.textContent = message;
+    statusEl.style.color = isError ? '#c62828' : '#555';
+  }
+
+  function viewerUrl(candidate, page) {
+    return `/viewer?l=${encodeURIComponent(data.base.name)}&r=${encodeURIComponent(candidate.name)}&page=${page}`;
+  }
+
+  function cellColor(changes, max) {
+    if (!changes) return '';
+    const alpha = 0.12 + 0.78 * Math.min(1, changes / max);
+    return `rgba(211, 47, 47, ${alpha.toFixed(2)})`;
+  }
+
+  function renderTable() {
+    const outlierCells = new Set(data.outliers.map(o => `${o.candidate}:${o.page}`));
+    const max = Math.max(1, ...data.pages.map(p => p.max || 0));
+    const order = data.candidates.map((_c, i) => i);
+    if (sortSelect.value === 'changes') {
+      order.sort((a, b) => data.candidates[b].totalChanges - data.candidates[a].totalChanges);
+    }
+
+    const head = document.createElement('tr');
+    head.innerHTML = '<th>Candidate</th><th>Changes</th>' +
+      data.pages.map(p => `<th title="median ${p.median ?? '—'}">${p.page}</th>`).join('');
+    tableHead.replaceChildren(head);
+
+    const rows = order.map(index => {
+      const candidate = data.candidates[index];
+      const tr = document.createElement('tr');
+      const label = document.createElement('td');
+      label.textContent = candidate.label;
+      if (candidate.error) {
+        label.title = candidate.error;
+        label.classList.add('matrix-failed');
+      }
+      const total = document.createElement('td');
+      total.textContent = candidate.totalChanges;
+      tr.append(label, total);
+
+      const failed = new Set(candidate.failedPages.map(f => f.page));
+      for (let page = 1; page <= data.pageCount; page++) {
+        const td = document.createElement('td');
+        td.className = 'matrix-cell';
+        const changes = candidate.changes[page - 1];
+        if (page > candidate.changes.length) {
+          td.classList.add('matrix-empty');
+        } else if (failed.has(page)) {
+          td.textContent = '!';
+          td.classList.add('matrix-failed');
+          td.title = candidate.failedPages.find(f => f.page === page).error;
+        } else {
+          td.textContent = changes || '';
+          td.style.background = cellColor(changes, max);
+          td.title = `${candidate.label}, page ${page}: ${changes} change(s)`;
+          if (outlierCells.has(`${index}:${page}`)) td.classList.add('matrix-outlier');
+          td.addEventListener('click', () => { window.open(viewerUrl(candidate, page), '_blank'); });
+        }
+        tr.appendChild(td);
+      }
+      return tr;
+    });
+    tableBody.replaceChildren(...rows);
+  }
+
+  function renderOutliers() {
+    outlierList.replaceChildren(...data.outliers.slice(0, MAX_OUTLIERS).map(o => {
+      const candidate = data.candidates[o.candidate];
+      const li = document.createElement('li');
+      const link = document.createElement('a');
+      link.href = viewerUrl(candidate, o.page);
+      link.target = '_blank';
+      link.textContent = `${candidate.label}, page ${o.page}`;
+      li.append(link, ` — ${o.changes} change(s), page median ${o.median}`);
+      return li;
+    }));
+    outlierSection.hidden = data.outliers.length === 0;
+  }
+
+  async function load() {
+    setStatus(`Comparing ${CANDIDATES.length} document(s) against the base...`);
+    const response = await fetch('/api/multidiff', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ base: BASE, candidates: CANDIDATES, engine: engineSelect.value }),
+    });
+    const text = await response.text();
+    if (!response.ok) throw new Error(text);
+    data = JSON.parse(text);
+
+    baseInfoEl.textContent = `Base: ${data.base.label} (${data.basePageCount} page(s))`;
+    const changed = data.candidates.filter(c => c.totalChanges).length;
+    summaryEl.textContent = `${changed} of ${data.candidates.length} candidate(s) differ from the base; ` +
+      `${data.outliers.length} outlier page(s). Click a cell to open the pair in the viewer.`;
+    setStatus(`Compared ${data.candidates.length} document(s) in ${data.seconds}s.`);
+    renderTable();
+    renderOutliers();
+    resultsSection.hidden = false;
+  }
+
+  function reload() {
+    load().catch(err => { console.error(err); setStatus('Error: ' + err.message, true); });
+  }
+
+  engineSelect.addEventListener('change', reload);
+  sortSelect.addEventListener('change', () => { if (data) renderTable(); });
+  reload();
+})();
@@ -1,13 +1,18 @@
-pdfjsLib.GlobalWorkerOptions.workerSrc = 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.16.105/pdf.worker.min.js';
-
-let leftPdf = null, rightPdf = null;
-let pageNum = 1;
+let leftInfo = null, rightInfo = null;
+// ?page=N opens the viewer at that page (links from the change matrix)
+let pageNum = parseInt(new URLSearchParams(location.search).get('page')) || 1;
 let pageCount = 0;
+// [left page, right page] per step when "Align pages" is on (0 = no page)
+let alignedRows = null;
 let scale = 1.0;
 let sync = true;
 let textDiffActive = false;
 let showLeftDiffs = true;
 let diffOpacity = 1.0;
+// decoded /textdiff results currently drawn on the overlays
+let currentDiff = null;
+// bumped by every renderPage call so a slow page never overwrites a newer one
+let renderSeq = 0;
 
 const leftCanvas = document.getElementById('leftCanvas');
 const rightCanvas = document.getElementById('rightCanvas');
@@ -19,182 +24,296 @@ const rightOverlay = document.getElementById('rightOverlay');
 const leftOvCtx = leftOverlay.getContext('2d');
 const rightOvCtx = rightOverlay.getContext('2d');
 
+const fileName = (url) => ('' + url).split('/').pop();
+
+// Small LRU of promises, so a page requested twice (prefetch, then paging to
+// it) shares one request and repeat visits make no request at all.
+class PromiseCache {
+  constructor(maxEntries) {
+    this.maxEntries = maxEntries;
+    this.entries = new Map();
+  }
+
+  get(key, load) {
+    let value = this.entries.get(key);
+    if (value) {
+      this.entries.delete(key);
+    } else {
+      value = load();
+      // failed loads are retried on the next request
+      value.catch(() => { if (this.entries.get(key) === value) this.entries.delete(key); });
+    }
+    this.entries.set(key, value);
+    while (this.entries.size > this.maxEntries) {
+      this.entries.delete(this.entries.keys().next().value);
+    }
+    return value;
+  }
+}
+
+// two sides x (current page, neighbours) x a few zoom levels
+const imageCache = new PromiseCache(36);
+// keyed by "leftPage:rightPage"; results never change for a given pair
+const diffCache = new PromiseCache(64);
+
+async function fetchDocInfo(url) {
+  const res = await fetch(`/api/docinfo?f=${encodeURIComponent(fileName(url))}`);
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
 async function load() {
-  leftPdf = await pdfjsLib.getDocument(LEFT_PDF).promise;
-  rightPdf = await pdfjsLib.getDocument(RIGHT_PDF).promise;
-  pageCount = Math.max(leftPdf.numPages, rightPdf.numPages);
-  document.getElementById('pageCount').innerText = '/ ' + pageCount;
+  [leftInfo, rightInfo] = await Promise.all([fetchDocInfo(LEFT_PDF), fetchDocInfo(RIGHT_PDF)]);
+  updatePageCount();
   renderPage(pageNum);
 }
 
+function updatePageCount() {
+  pageCount = alignedRows ? alignedRows.length : Math.max(leftInfo.pageCount, rightInfo.pageCount);
+  document.getElementById('pageCount').innerText = '/ ' + pageCount;
+}
+
+// left/right page numbers shown at a step (default: the current one)
+function currentPages(step = pageNum) {
+  if (alignedRows && alignedRows[step - 1]) return alignedRows[step - 1];
+  return [step, step];
+}
+
+// pages are rasterized (and cached) on the server at the current zoom level
+function loadPageImage(url, num, atScale = scale) {
+  const src = `/render?f=${encodeURIComponent(fileName(url))}&page=${num}&scale=${atScale}`;
+  return imageCache.get(src, async () => {
+    const img = new Image();
+    img.src = src;
+    await img.decode();
+    return img;
+  });
+}
+
+function drawSide(img, canvas, ctx, overlay) {
+  if (!img) {
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    overlay.getContext('2d').clearRect(0, 0, overlay.width, overlay.height);
+    return;
+  }
+  canvas.width = img.naturalWidth;
+  canvas.height = img.naturalHeight;
+  overlay.width = img.naturalWidth;
+  overlay.height = img.naturalHeight;
+  ctx.drawImage(img, 0, 0);
+  // ensure overlay displays at the same CSS size as the rendered canvas
+  const rect = canvas.getBoundingClientRect();
+  overlay.style.width = rect.width + 'px';
+  overlay.style.height = rect.height + 'px';
+}
+
+const sideImage = (url, info, num) => (num < 1 || num > info.pageCount) ? Promise.resolve(null) : loadPageImage(url, num);
+
 async function renderPage(num) {
   pageNum = Math.min(Math.max(1, num), pageCount);
   document.getElementById('pageNum').value = pageNum;
+  const seq = ++renderSeq;
 
-  // render left
-  if (pageNum <= leftPdf.numPages) {
-    const page = await leftPdf.getPage(pageNum);
-    const viewport = page.getViewport({ scale });
-    leftCanvas.width = viewport.width;
-    leftCanvas.height = viewport.height;
-    leftOverlay.width = viewport.width;
-    leftOverlay.height = viewport.height;
-    const renderContext = { canvasContext: leftCtx, viewport };
-    await page.render(renderContext).promise;
-    // ensure overlay displays at the same CSS size as the rendered canvas
-    const leftRect = leftCanvas.getBoundingClientRect();
-    leftOverlay.style.width = leftRect.width + 'px';
-    leftOverlay.style.height = leftRect.height + 'px';
-  } else {
-    leftCtx.clearRect(0, 0, leftCanvas.width, leftCanvas.height);
-  }
-
-  // render right
-  if (pageNum <= rightPdf.numPages) {
-    const pageR = await rightPdf.getPage(pageNum);
-    const viewportR = pageR.getViewport({ scale });
-    rightCanvas.width = viewportR.width;
-    rightCanvas.height = viewportR.height;
-    rightOverlay.width = viewportR.width;
-    rightOverlay.height = viewportR.height;
-    const renderContextR = { canvasContext: rightCtx, viewport: viewportR };
-    await pageR.render(renderContextR).promise;
-    // ensure overlay displays at the same CSS size as the rendered canvas
-    const rightRect = rightCanvas.getBoundingClientRect();
-    rightOverlay.style.width = rightRect.width + 'px';
-    rightOverlay.style.height = rightRect.height + 'px';
-  } else {
-    rightCtx.clearRect(0, 0, rightCanvas.width, rightCanvas.height);
-  }
+  const [leftPage, rightPage] = currentPages();
+  // start the diff alongside the images; requestTextDiff picks it up from the cache
+  if (textDiffActive) fetchTextDiff(leftPage, rightPage).catch(() => {});
+  const [leftImg, rightImg] = await Promise.all([
+    sideImage(LEFT_PDF, leftInfo, leftPage),
+    sideImage(RIGHT_PDF, rightInfo, rightPage),
+  ]);
+  if (seq !== renderSeq) return;
+  drawSide(leftImg, leftCanvas, leftCtx, leftOverlay);
+  drawSide(rightImg, rightCanvas, rightCtx, rightOverlay);
+  currentDiff = null;
 
   // if automatic text-diff mode is enabled, request text diff for the new page
   if (textDiffActive) {
-    // run but don't block UI
-    requestTextDiff().then((r)=>{
-      if (r && r.error) console.warn('textdiff request failed', r);
-    });
+    const r = await requestTextDiff();
+    if (r && r.error) console.warn('textdiff request failed', r);
   }
+  if (seq === renderSeq) schedulePrefetch();
+}
+
+// warm the caches for the neighbouring pages once the browser is idle
+const whenIdle = (fn) => (window.requestIdleCallback ? window.requestIdleCallback(fn, { timeout: 1000 }) : setTimeout(fn, 200));
+let prefetchPending = false;
+
+function schedulePrefetch() {
+  if (prefetchPending) return;
+  prefetchPending = true;
+  whenIdle(() => {
+    prefetchPending = false;
+    for (const step of [pageNum + 1, pageNum - 1]) {
+      if (step < 1 || step > pageCount) continue;
+      const [leftPage, rightPage] = currentPages(step);
+      // errors surface when the page is actually shown
+      sideImage(LEFT_PDF, leftInfo, leftPage).catch(() => {});
+      sideImage(RIGHT_PDF, rightInfo, rightPage).catch(() => {});
+      if (textDiffActive) fetchTextDiff(leftPage, rightPage).catch(() => {});
+    }
+  });
 }
 
 
 document.getElementById('prev').addEventListener('click', ()=>{ renderPage(pageNum-1); });
 document.getElementById('next').addEventListener('click', ()=>{ renderPage(pageNum+1); });
 document.getElementById('pageNum').addEventListener('change', (e)=>{ renderPage(parseInt(e.target.value)||1); });
-document.getElementById('scale').addEventListener('input', (e)=>{ scale = parseFloat(e.target.value); renderPage(pageNum); });
+// re-render once the slider rests instead of on every step; zoom levels
+// already visited come straight from the image cache
+let zoomTimer = null;
+document.getElementById('scale').addEventListener('input', (e)=>{
+  scale = parseFloat(e.target.value);
+  clearTimeout(zoomTimer);
+  zoomTimer = setTimeout(() => renderPage(pageNum), 120);
+});
 document.getElementById('sync').addEventListener('change', (e)=>{ sync = e.target.checked; });
+// pair pages by content so inserted/removed pages don't shift every later page
+document.getElementById('alignPages').addEventListener('change', async (e) => {
+  if (e.target.checked) {
+    const res = await fetch(`/api/alignment?l=${encodeURIComponent(fileName(LEFT_PDF))}&r=${encodeURIComponent(fileName(RIGHT_PDF))}`);
+    if (!res.ok) {
+      console.error('alignment error', res.status, await res.text());
+      e.target.checked = false;
+      return;
+    }
+    alignedRows = (await res.json()).rows;
+  } else {
+    alignedRows = null;
+  }
+  changedPagesSelect.hidden = true;
+  updatePageCount();
+  renderPage(1);
+});
 // removed pixel-diff controls; text diff handled separately
 
-async function requestTextDiff() {
-  try {
-    const lfile = ('' + LEFT_PDF).split('/').pop();
-    const rfile = ('' + RIGHT_PDF).split('/').pop();
-    const url = `/textdiff?l=${encodeURIComponent(lfile)}&r=${encodeURIComponent(rfile)}&page=${pageNum}`;
+// expand the columnar `format=compact` payload into {left: [...], right: [...]}
+function decodeCompactDiff(data) {
+  const scaleQ = data.scale || 1;
+  const strings = data.strings || [];
+  const expand = (col, withImproved) => {
+    const boxes = [];
+    if (!col) return boxes;
+    for (let i = 0; i < col.text.length; i++) {
+      const b = col.box;
+      const entry = {
+        box: [b[4*i] / scaleQ, b[4*i+1] / scaleQ, b[4*i+2] / scaleQ, b[4*i+3] / scaleQ],
+        text: strings[col.text[i]],
+        dashCount: col.dash[i],
+      };
+      if (withImproved) entry.improved = !!col.improved[i];
+      boxes.push(entry);
+    }
+    return boxes;
+  };
+  return { left: expand(data.left, false), right: expand(data.right, true) };
+}
+
+function fetchTextDiff(leftPage, rightPage) {
+  return diffCache.get(`${leftPage}:${rightPage}`, async () => {
+    const url = `/textdiff?l=${encodeURIComponent(fileName(LEFT_PDF))}&r=${encodeURIComponent(fileName(RIGHT_PDF))}&page=${leftPage}&rpage=${rightPage}&format=compact`;
     const res = await fetch(url);
+    const text = await res.text();
     if (!res.ok) {
-      const txt = await res.text();
-      console.error('textdiff error', res.status, txt);
-      return { error: true, status: res.status, text: txt };
+      const err = new Error(text);
+      err.status = res.status;
+      throw err;
     }
-    const dataText = await res.text();
-    const data = JSON.parse(dataText);
-
-    // Clear previous box overlays
-    const clearBoxes = (sideId) => {
-      const side = document.getElementById(sideId);
-      const prev = side.querySelectorAll('.td-box');
-      prev.forEach(n => n.remove());
-    };
-    clearBoxes('leftSide');
-    clearBoxes('rightSide');
-
-    // Helper: create a box element in the `.side` container using normalized coords
-    const applyAlpha = (rgbArray, baseAlpha) => {
-      const sliderAlpha = Math.max(0, Math.min(1, diffOpacity));
-      const effective = sliderAlpha === 0
-        ? 0
-        : Math.min(1, baseAlpha + (1 - baseAlpha) * sliderAlpha);
-      return `rgba(${rgbArray.join(',')}, ${effective})`;
-    };
-
-    const makeBox = (sideId, boxObj, isRight=false) => {
-      const side = document.getElementById(sideId);
-      const canvas = side.querySelector('canvas');
-      if (!canvas) return;
-      const crect = canvas.getBoundingClientRect();
-      const parentRect = side.getBoundingClientRect();
-
-      const [nx0, ny0, nx1, ny1] = boxObj.box;
-      const leftPx = (nx0 * crect.width) + (crect.left - parentRect.left);
-      const topPx = (ny0 * crect.height) + (crect.top - parentRect.top);
-      const wPx = (nx1 - nx0) * crect.width;
-      const hPx = (ny1 - ny0) * crect.height;
-
-      const div = document.createElement('div');
-      div.className = 'td-box';
-      div.style.position = 'absolute';
-      div.style.left = Math.round(leftPx) + 'px';
-      div.style.top = Math.round(topPx) + 'px';
-      div.style.width = Math.max(2, Math.round(wPx)) + 'px';
-      div.style.height = Math.max(2, Math.round(hPx)) + 'px';
-      div.style.pointerEvents = 'none';
-      div.style.boxSizing = 'border-box';
-      div.style.border = 'none';
-
-      if (isRight) {
-        const c = Math.max(0, Math.min(5, boxObj.dashCount || 0));
-        if (boxObj.improved) {
-          div.style.backgroundColor = applyAlpha([67, 160, 71], 0.12);
-        } else if (c === 0) {
-          div.style.backgroundColor = applyAlpha([25, 118, 210], 0.08);
-        } else {
-          const t = Math.min(1, c / 5);
-          const lerp = (a,b,t)=> Math.round(a + (b-a)*t);
-          const yellow = [255, 213, 79];
-          const red = [211, 47, 47];
-          const rgb = [ lerp(yellow[0], red[0], t), lerp(yellow[1], red[1], t), lerp(yellow[2], red[2], t) ];
-          const baseAlpha = 0.08 + 0.25 * t;
-          div.style.backgroundColor = applyAlpha(rgb, baseAlpha);
-        }
-      } else {
-        div.style.backgroundColor = applyAlpha([30, 136, 229], 0.08);
-      }
-
-      div.title = boxObj.text || '';
-      side.appendChild(div);
-    };
-
-    (data.left || []).forEach(b => { if (showLeftDiffs) makeBox('leftSide', b, false); });
-    (data.right || []).forEach(b => makeBox('rightSide', b, true));
+    return decodeCompactDiff(JSON.parse(text));
+  });
+}
 
+async function requestTextDiff() {
+  const seq = renderSeq;
+  try {
+    const data = await fetchTextDiff(...currentPages());
+    if (seq !== renderSeq) return { error: false };
+    currentDiff = data;
+    drawOverlays();
     return { error: false };
   } catch (err) {
     console.error('text diff error', err);
-    return { error: true, text: err.message };
+    return { error: true, status: err.status, text: err.message };
+  }
+}
+
+// Box colours: the slider raises each box's base alpha towards opaque
+const applyAlpha = (rgbArray, baseAlpha) => {
+  const sliderAlpha = Math.max(0, Math.min(1, diffOpacity));
+  const effective = sliderAlpha === 0
+    ? 0
+    : Math.min(1, baseAlpha + (1 - baseAlpha) * sliderAlpha);
+  return `rgba(${rgbArray.join(',')}, ${effective})`;
+};
+
+function boxColor(boxObj, isRight) {
+  if (!isRight) return applyAlpha([30, 136, 229], 0.08);
+  const c = Math.max(0, Math.min(5, boxObj.dashCount || 0));
+  if (boxObj.improved) return applyAlpha([67, 160, 71], 0.12);
+  if (c === 0) return applyAlpha([25, 118, 210], 0.08);
+  const t = Math.min(1, c / 5);
+  const lerp = (a,b,t)=> Math.round(a + (b-a)*t);
+  const yellow = [255, 213, 79];
+  const red = [211, 47, 47];
+  const rgb = [ lerp(yellow[0], red[0], t), lerp(yellow[1], red[1], t), lerp(yellow[2], red[2], t) ];
+  return applyAlpha(rgb, 0.08 + 0.25 * t);
+}
+
+function drawBoxes(overlay, ctx, boxes, isRight) {
+  ctx.clearRect(0, 0, overlay.width, overlay.height);
+  const w = overlay.width, h = overlay.height;
+  // at least 2 CSS pixels, like the old box elements
+  const minSize = 2 * w / (overlay.getBoundingClientRect().width || w);
+  for (const b of boxes) {
+    const [nx0, ny0, nx1, ny1] = b.box;
+    ctx.fillStyle = boxColor(b, isRight);
+    ctx.fillRect(
+      Math.round(nx0 * w), Math.round(ny0 * h),
+      Math.max(minSize, Math.round((nx1 - nx0) * w)), Math.max(minSize, Math.round((ny1 - ny0) * h)),
+    );
   }
 }
 
+// redraw (or clear) the boxes of the current page from the data already loaded
+function drawOverlays() {
+  const data = textDiffActive && currentDiff ? currentDiff : { left: [], right: [] };
+  drawBoxes(leftOverlay, leftOvCtx, showLeftDiffs ? data.left : [], false);
+  drawBoxes(rightOverlay, rightOvCtx, data.right, true);
+}
+
+// show the text of the box under the pointer as the tooltip
+function boxAt(overlay, boxes, e) {
+  const rect = overlay.getBoundingClientRect();
+  const x = (e.clientX - rect.left) / rect.width;
+  const y = (e.clientY - rect.top) / rect.height;
+  return boxes.find(b => x >= b.box[0] && x <= b.box[2] && y >= b.box[1] && y <= b.box[3]);
+}
+[['leftSide', leftOverlay, 'left'], ['rightSide', rightOverlay, 'right']].forEach(([sideId, overlay, key]) => {
+  const side = document.getElementById(sideId);
+  side.addEventListener('mousemove', (e) => {
+    const visible = textDiffActive && currentDiff && (key === 'right' || showLeftDiffs);
+    const hit = visible ? boxAt(overlay, currentDiff[key], e) : null;
+    side.title = hit ? (hit.text || '') : '';
+  });
+});
+
 // toggle text diff mode and run on demand
 const textDiffBtn = document.getElementById('textDiff');
 textDiffBtn.addEventListener('click', async (e) => {
   textDiffActive = !textDiffActive;
   textDiffBtn.textContent = textDiffActive ? 'Text Diff (on)' : 'Text Diff';
-  if (textDiffActive) await requestTextDiff();
-  else {
-    const clearBoxes = (sideId) => {
-      const side = document.getElementById(sideId);
-      const prev = side.querySelectorAll('.td-box');
-      prev.forEach(n => n.remove());
-    };
-    clearBoxes('leftSide');
-    clearBoxes('rightSide');
+  if (textDiffActive) {
+    await requestTextDiff();
+    schedulePrefetch();
+  } else {
+    drawOverlays();
   }
 });
 
 // toggle left diffs visibility
 const showLeftCheckbox = document.getElementById('showLeft');
-showLeftCheckbox.addEventListener('change', async (e) => {
+showLeftCheckbox.addEventListener('change', (e) => {
   showLeftDiffs = e.target.checked;
-  if (textDiffActive) await requestTextDiff();
+  drawOverlays();
 });
 
 // opacity slider for diff boxes
@@ -204,10 +323,50 @@ const updateOpacityLabel = () => {
   boxOpacityVal.textContent = Math.round(diffOpacity * 100) + '%';
 };
 updateOpacityLabel();
-boxOpacityInput.addEventListener('input', async (e) => {
+boxOpacityInput.addEventListener('input', (e) => {
   diffOpacity = parseFloat(e.target.value);
   updateOpacityLabel();
-  if (textDiffActive) await requestTextDiff();
+  drawOverlays();
+});
+
+// scan the whole document once and list the pages that have differences
+const scanAllBtn = document.getElementById('scanAll');
+const changedPagesSelect = document.getElementById('changedPages');
+scanAllBtn.addEventListener('click', async () => {
+  const lfile = ('' + LEFT_PDF).split('/').pop();
+  const rfile = ('' + RIGHT_PDF).split('/').pop();
+  scanAllBtn.disabled = true;
+  scanAllBtn.textContent = 'Scanning...';
+  try {
+    const align = alignedRows ? '&align=1' : '';
+    const res = await fetch(`/api/docdiff?l=${encodeURIComponent(lfile)}&r=${encodeURIComponent(rfile)}${align}`);
+    if (!res.ok) throw new Error(await res.text());
+    const data = await res.json();
+    const summary = data.summary || {};
+    const changed = summary.changedPages || [];
+    const counts = summary.changesPerPage || {};
+    changedPagesSelect.innerHTML = '';
+    const header = document.createElement('option');
+    header.value = '';
+    header.textContent = changed.length ? `${changed.length} changed page(s)` : 'No changes';
+    changedPagesSelect.appendChild(header);
+    changed.forEach(p => {
+      const opt = document.createElement('option');
+      opt.value = p;
+      opt.textContent = `Page ${p} (${counts[p] || 0})`;
+      changedPagesSelect.appendChild(opt);
+    });
+    changedPagesSelect.hidden = false;
+  } catch (err) {
+    console.error('docdiff error', err);
+  } finally {
+    scanAllBtn.disabled = false;
+    scanAllBtn.textContent = 'Find changed pages';
+  }
+});
+changedPagesSelect.addEventListener('change', (e) => {
+  const p = parseInt(e.target.value);
+  if (p) renderPage(p);
 });
 
 // optional: keyboard shortcuts
@@ -0,0 +1,632 @@
+"""Word extraction and comparison helpers behind the ``/textdiff`` endpoint."""
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import seqdiff
+from content_store import ARTIFACTS, file_digest
+from doc_cache import DOCUMENTS, PAGE_SIGNATURES, PAGE_WORDS
+from metrics import PAGES_PARSED, stage
+from ocr import ocr_kind, ocr_words
+
+# simple normalization: lowercase, keep letters+numbers and spaces
+# allow hyphen and vertical bar as well (keep them as characters to compare)
+_NORMALIZE_RE = re.compile(r'[^0-9a-z\-\| ]+')
+
+# Rough per-word footprint of a cached word dict, used for the memory bound.
+_WORD_OVERHEAD_BYTES = 480
+
+
+def normalize_text(s: str) -> str:
+    return _NORMALIZE_RE.sub('', s.lower())
+
+
+def deviation_score(text: str) -> int:
+    """Return a simple deviation metric for strings like "--|".
+
+    A lower score indicates a value closer to nominal. Ignore numbers so
+    regular values aren't treated as deviation markers.
+    """
+
+    if any(c.isdigit() for c in text):
+        return -1
+    if '-' not in text and '|' not in text:
+        return -1
+    return text.count('-')
+
+
+def dash_metric(text: str) -> int:
+    """Return the dash count used for coloring overlays."""
+
+    if any(c.isdigit() for c in text):
+        return 0
+    return text.count('-') + text.count('|')
+
+
+def _read_page_words(path: str, page_num: int) -> Tuple[Dict[str, object], ...]:
+    with DOCUMENTS.document(path) as doc:
+        if page_num < 1 or page_num > doc.page_count:
+            return ()
+        p = doc.load_page(page_num - 1)
+        # words: list of tuples (x0, y0, x1, y1, word)
+        words = p.get_text('words')
+        PAGES_PARSED.inc()
+        # page size
+        rect = p.rect
+        pw = rect.width
+        ph = rect.height
+
+    if not words:
+        # scanned page without a text layer
+        words = ocr_words(path, page_num)
+
+    items = []
+    for w in words:
+        x0, y0, x1, y1, text = w[0], w[1], w[2], w[3], w[4]
+        tn = normalize_text(text)
+        if tn.strip() == '':
+            continue
+        items.append({
+            'text': text,
+            'norm': tn,
+            'x0': x0/pw,
+            'y0': y0/ph,
+            'x1': x1/pw,
+            'y1': y1/ph,
+        })
+    return tuple(items)
+
+
+def extract_page_words(path: str, page_num: int) -> Tuple[Dict[str, object], ...]:
+    """Return normalized words for a 1-based page.
+
+    Lookups go through the in-memory LRU, then the on-disk artifact store
+    (both keyed by the document's content digest), and only then PyMuPDF.
+    The returned tuple is shared between callers and must not be mutated.
+    """
+
+    digest = file_digest(path)
+    key = (digest, page_num)
+    items = PAGE_WORDS.get(key)
+    if items is not None:
+        return items
+
+    stored = ARTIFACTS.get(ocr_kind('words'), digest, page_num)
+    if stored is not None:
+        items = tuple(
+            {'text': t, 'norm': n, 'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1}
+            for t, n, x0, y0, x1, y1 in stored
+        )
+    else:
+        items = _read_page_words(path, page_num)
+        ARTIFACTS.put(ocr_kind('words'), digest, [
+            [w['text'], w['norm'], w['x0'], w['y0'], w['x1'], w['y1']] for w in items
+        ], page_num)
+
+    size = sum(_WORD_OVERHEAD_BYTES + 2 * (len(w['text']) + len(w['norm'])) for w in items)
+    PAGE_WORDS.put(key, items, size)
+    return items
+
+
+# Bump when the signature layout or line splitting changes.
+_SIGNATURE_VERSION = 1
+
+
+def _hash(parts) -> str:
+    return hashlib.blake2b("\x1e".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _line_spans(words) -> List[Tuple[int, int]]:
+    """Split words (in extraction order) into ``[start, end)`` runs on one text line.
+
+    A line ends where the next word starts left of the previous one or its
+    vertical centre is more than half a word height away.
+    """
+
+    spans = []
+    start = 0
+    for i in range(1, len(words)):
+        prev, w = words[i - 1], words[i]
+        if w['x0'] < prev['x0'] or abs((w['y0'] + w['y1']) - (prev['y0'] + prev['y1'])) > prev['y1'] - prev['y0']:
+            spans.append((start, i))
+            start = i
+    if words:
+        spans.append((start, len(words)))
+    return spans
+
+
+def _isolated_lines(words, spans) -> List[bool]:
+    """Flag lines with no word overlapping a same-text word of another line."""
+
+    line_of = [0] * len(words)
+    for n, (start, end) in enumerate(spans):
+        line_of[start:end] = [n] * (end - start)
+    index = _BoxIndex(words, range(len(words)), _norm_key)
+    isolated = [True] * len(spans)
+    for i, w in enumerate(words):
+        if not isolated[line_of[i]]:
+            continue
+        for j in index.candidates(w['norm'], w):
+            if line_of[j] != line_of[i] and intersects(w, words[j]):
+                isolated[line_of[i]] = isolated[line_of[j]] = False
+                break
+    return isolated
+
+
+def _compute_signature(words) -> Dict[str, object]:
+    spans = _line_spans(words)
+    line_hashes = [
+        _hash(f"{w['norm']}\x1f{w['x0']!r},{w['y0']!r},{w['x1']!r},{w['y1']!r}" for w in words[start:end])
+        for start, end in spans
+    ]
+    isolated = _isolated_lines(words, spans)
+    return {
+        'v': _SIGNATURE_VERSION,
+        'hash': _hash(line_hashes),
+        'words': len(words),
+        'lines': [[h, start, end, iso] for h, (start, end), iso in zip(line_hashes, spans, isolated)],
+    }
+
+
+def page_signature(path: str, page_num: int) -> Dict[str, object]:
+    """Return the hashes of a page's words, as a whole and per text line.
+
+    ``hash`` covers every word's normalized text and box, so two pages with
+    the same hash have an empty diff under either engine. ``lines`` holds
+    ``[hash, start, end, isolated]`` per line of :func:`extract_page_words`
+    output; *isolated* lines have no word overlapping a same-text word of
+    another line. Cached like the words: memory, then the artifact store.
+    """
+
+    digest = file_digest(path)
+    key = (digest, page_num)
+    signature = PAGE_SIGNATURES.get(key)
+    if signature is not None:
+        return signature
+
+    signature = ARTIFACTS.get(ocr_kind('signature'), digest, page_num)
+    if signature is None or signature.get('v') != _SIGNATURE_VERSION:
+        with stage('extract'):
+            words = extract_page_words(path, page_num)
+        signature = _compute_signature(words)
+        ARTIFACTS.put(ocr_kind('signature'), digest, signature, page_num)
+    PAGE_SIGNATURES.put(key, signature)
+    return signature
+
+
+def _unshared_words(left_words, right_words, left_sig, right_sig):
+    """Drop the lines both pages have in common before box matching.
+
+    A line is dropped when the same hash (same words, same boxes) is an
+    isolated line on both pages. Its words can only match each other and
+    all of them do, and no other word can match one of them, so removing
+    them leaves :func:`match_words` output unchanged.
+    """
+
+    if left_sig['words'] != len(left_words) or right_sig['words'] != len(right_words):
+        return left_words, right_words
+
+    def isolated(sig):
+        return {h: (start, end) for h, start, end, iso in sig['lines'] if iso}
+
+    left_lines, right_lines = isolated(left_sig), isolated(right_sig)
+    shared = left_lines.keys() & right_lines.keys()
+    if not shared:
+        return left_words, right_words
+
+    def keep(words, lines):
+        drop = bytearray(len(words))
+        for h in shared:
+            start, end = lines[h]
+            drop[start:end] = b'\x01' * (end - start)
+        return [w for w, d in zip(words, drop) if not d]
+
+    return keep(left_words, left_lines), keep(right_words, right_lines)
+
+
+def intersects(a: Dict[str, object], b: Dict[str, object]) -> bool:
+    return not (a['x1'] < b['x0'] or a['x0'] > b['x1'] or a['y1'] < b['y0'] or a['y0'] > b['y1'])
+
+
+class _BoxIndex:
+    """Uniform grid over normalized word boxes, bucketed by an exact key.
+
+    Each word is registered in every cell its box covers, so two boxes that
+    intersect (edges touching included) always share at least one cell under
+    the same key. Cell dimensions follow the mean word size, which keeps the
+    per-cell population roughly constant regardless of page density.
+    """
+
+    def __init__(self, words, indices, key):
+        self._cells: Dict[Tuple[object, int, int], List[int]] = {}
+        if not indices:
+            self._cw = self._ch = 1.0
+            return
+
+        width = sum(words[i]['x1'] - words[i]['x0'] for i in indices) / len(indices)
+        height = sum(words[i]['y1'] - words[i]['y0'] for i in indices) / len(indices)
+        self._cw = max(width, 1e-4)
+        self._ch = max(height, 1e-4)
+
+        cells = self._cells
+        for i in indices:
+            w = words[i]
+            k = key(w)
+            for cx, cy in self._span(w):
+                bucket = cells.get((k, cx, cy))
+                if bucket is None:
+                    cells[(k, cx, cy)] = [i]
+                else:
+                    bucket.append(i)
+
+    def _span(self, w):
+        cx0 = int(w['x0'] // self._cw)
+        cx1 = int(w['x1'] // self._cw)
+        cy0 = int(w['y0'] // self._ch)
+        cy1 = int(w['y1'] // self._ch)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                yield cx, cy
+
+    def candidates(self, k, w) -> List[int]:
+        """Return indices stored under key *k* in the cells covered by *w*.
+
+        The list may contain duplicates when a word spans several cells.
+        """
+
+        cells = self._cells
+        found: List[int] = []
+        for cx, cy in self._span(w):
+            bucket = cells.get((k, cx, cy))
+            if bucket:
+                found.extend(bucket)
+        return found
+
+
+def _norm_key(w):
+    return w['norm']
+
+
+def _pipe_key(w):
+    return w['text'].count('|')
+
+
+class PreparedPage:
+    """Left-page structures of the matchers, built once and reused for many right pages.
+
+    Comparing one base document against many candidates passes the same
+    instance as *prepared* to :func:`match_words` or
+    :func:`match_words_sequence`, so the base page's box index, marker index
+    and reading order are not rebuilt per candidate. Everything is built on
+    first use.
+    """
+
+    def __init__(self, words):
+        self.words = words
+        self._index: Optional[_BoxIndex] = None
+        self._order: Optional[List[int]] = None
+        self._norms: Optional[List[str]] = None
+        self.right_box = _RightBoxBuilder(words)
+
+    @property
+    def index(self) -> "_BoxIndex":
+        if self._index is None:
+            self._index = _BoxIndex(self.words, range(len(self.words)), _norm_key)
+        return self._index
+
+    @property
+    def order(self) -> List[int]:
+        if self._order is None:
+            self._order = reading_order(self.words)
+        return self._order
+
+    @property
+    def norms(self) -> List[str]:
+        """Normalized words in reading order."""
+
+        if self._norms is None:
+            self._norms = [self.words[i]['norm'] for i in self.order]
+        return self._norms
+
+
+def match_words(
+    left_words, right_words, prepared: Optional[PreparedPage] = None
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """Return ``(left_boxes, right_boxes)`` for words that have no counterpart.
+
+    A word is unchanged when a word with the same normalized text overlaps it
+    on the other page. Left words claim right words greedily in page order
+    (each right word at most once); right words only need any overlapping
+    twin. Unmatched right deviation markers such as ``--|`` are flagged
+    ``improved`` when an overlapping left marker with the same number of bars
+    had more dashes. *prepared* is an optional :class:`PreparedPage` of
+    *left_words*.
+    """
+
+    right_index = _BoxIndex(right_words, range(len(right_words)), _norm_key)
+    matched_right = [False]*len(right_words)
+    left_boxes = []
+    for lw in left_words:
+        best = None
+        for i in right_index.candidates(lw['norm'], lw):
+            if matched_right[i] or (best is not None and i >= best):
+                continue
+            if intersects(lw, right_words[i]):
+                best = i
+        if best is not None:
+            matched_right[best] = True
+        else:
+            left_boxes.append(_left_box(lw))
+
+    if prepared is None:
+        prepared = PreparedPage(left_words)
+    left_index = prepared.index
+    right_box = prepared.right_box
+
+    # *prepared* may cover more left words than *left_words* (see diff_page)
+    prepared_words = prepared.words
+    right_boxes = []
+    for rw in right_words:
+        if any(intersects(rw, prepared_words[i]) for i in left_index.candidates(rw['norm'], rw)):
+            continue
+        right_boxes.append(right_box(rw))
+
+    return left_boxes, right_boxes
+
+
+def _left_box(lw) -> Dict[str, object]:
+    return {
+        'box': [lw['x0'], lw['y0'], lw['x1'], lw['y1']],
+        'text': lw['text'],
+        'dashCount': dash_metric(lw['text'])
+    }
+
+
+class _RightBoxBuilder:
+    """Build right-side boxes, flagging deviation markers that improved.
+
+    The index of left-side markers is only built once a right word needs it.
+    """
+
+    def __init__(self, left_words):
+        self._left_words = left_words
+        self._left_deviation = None
+        self._marker_index = None
+
+    def __call__(self, rw) -> Dict[str, object]:
+        # only count dashes/pipes if text contains no numbers
+        dashCount = dash_metric(rw['text'])
+        deviation = deviation_score(rw['text'])
+        improved = False
+        if deviation >= 0 and '|' in rw['text']:
+            left_words = self._left_words
+            if self._marker_index is None:
+                self._left_deviation = [deviation_score(lw['text']) for lw in left_words]
+                markers = [i for i, d in enumerate(self._left_deviation) if d >= 0]
+                self._marker_index = _BoxIndex(left_words, markers, _pipe_key)
+            for i in self._marker_index.candidates(_pipe_key(rw), rw):
+                if deviation < self._left_deviation[i] and intersects(rw, left_words[i]):
+                    improved = True
+                    break
+        return {
+            'box': [rw['x0'], rw['y0'], rw['x1'], rw['y1']],
+            'text': rw['text'],
+            'dashCount': dashCount,
+            'improved': improved
+        }
+
+
+def reading_order(words) -> List[int]:
+    """Return word indices in reading order: lines top to bottom, then left to right.
+
+    Words whose vertical centres lie within half a typical word height of
+    the first word on a line are treated as the same line.
+    """
+
+    if not words:
+        return []
+    heights = sorted(w['y1'] - w['y0'] for w in words)
+    tolerance = heights[len(heights) // 2] / 2
+    by_y = sorted(range(len(words)), key=lambda i: words[i]['y0'] + words[i]['y1'])
+
+    order: List[int] = []
+    line: List[int] = []
+    line_y = None
+    for i in by_y:
+        yc = (words[i]['y0'] + words[i]['y1']) / 2
+        if line_y is not None and yc - line_y > tolerance:
+            order.extend(sorted(line, key=lambda j: words[j]['x0']))
+            line = []
+            line_y = None
+        if line_y is None:
+            line_y = yc
+        line.append(i)
+    order.extend(sorted(line, key=lambda j: words[j]['x0']))
+    return order
+
+
+def match_words_sequence(
+    left_words, right_words, prepared: Optional[PreparedPage] = None
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """Sequence-diff alternative to :func:`match_words` with the same output shape.
+
+    Both pages are serialized in reading order and diffed with a
+    linear-space Myers diff over normalized words, so text that merely
+    reflowed or shifted position still counts as unchanged. Deleted words
+    become left boxes and inserted words right boxes (a replaced run
+    produces both); boxes are returned in extraction order.
+    """
+
+    if prepared is None:
+        prepared = PreparedPage(left_words)
+    left_order = prepared.order
+    right_order = reading_order(right_words)
+    ops = seqdiff.diff(prepared.norms, [right_words[j]['norm'] for j in right_order])
+
+    deleted: List[int] = []
+    inserted: List[int] = []
+    for tag, a1, a2, b1, b2 in ops:
+        if tag == seqdiff.DELETE:
+            deleted.extend(left_order[a1:a2])
+        elif tag == seqdiff.INSERT:
+            inserted.extend(right_order[b1:b2])
+
+    right_box = prepared.right_box
+    left_boxes = [_left_box(left_words[i]) for i in sorted(deleted)]
+    right_boxes = [right_box(right_words[j]) for j in sorted(inserted)]
+    return left_boxes, right_boxes
+
+
+# Selectable with /textdiff?engine=...
+ENGINES = {
+    'box': match_words,
+    'seq': match_words_sequence,
+}
+
+
+def match_pages(
+    left_words,
+    right_words,
+    left_sig: Dict[str, object],
+    right_sig: Dict[str, object],
+    engine: str = 'box',
+    prepared: Optional[PreparedPage] = None,
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """Run *engine* on two pages, skipping what their :func:`page_signature` proves unchanged.
+
+    Identical pages return no boxes. The box engine only matches the words
+    outside lines both pages share; the full left page (or *prepared*)
+    still answers the right-side lookups and the "improved" check.
+    """
+
+    if left_sig['hash'] == right_sig['hash']:
+        return [], []
+    if prepared is None:
+        prepared = PreparedPage(left_words)
+    if engine == 'box':
+        left_rest, right_rest = _unshared_words(left_words, right_words, left_sig, right_sig)
+        return match_words(left_rest, right_rest, prepared)
+    return ENGINES[engine](left_words, right_words, prepared)
+
+
+def page_count(path: str) -> int:
+    with DOCUMENTS.document(path) as doc:
+        return doc.page_count
+
+
+def diff_page(
+    left_path: str,
+    right_path: str,
+    page: int,
+    right_page: Optional[int] = None,
+    engine: str = 'box',
+) -> Dict[str, List[Dict[str, object]]]:
+    """Compare a 1-based page of two PDFs (the ``/textdiff`` payload).
+
+    *right_page* defaults to *page*; pass the aligned page number to compare
+    pages at different positions, or 0 for a page missing on the right.
+    *engine* names an entry of :data:`ENGINES`.
+    """
+
+    right_page = page if right_page is None else right_page
+    with stage('signature'):
+        left_sig = page_signature(left_path, page)
+        right_sig = page_signature(right_path, right_page)
+    if left_sig['hash'] == right_sig['hash']:
+        return {'left': [], 'right': []}
+
+    with stage('extract'):
+        left_words = extract_page_words(left_path, page)
+        right_words = extract_page_words(right_path, right_page)
+    with stage('match'):
+        left_boxes, right_boxes = match_pages(left_words, right_words, left_sig, right_sig, engine)
+    return {'left': left_boxes, 'right': right_boxes}
+
+
+def diff_document(
+    left_path: str,
+    right_path: str,
+    pool,
+    page_timeout: Optional[float] = None,
+    rows: Optional[List[List[int]]] = None,
+    engine: str = 'box',
+) -> Dict[str, object]:
+    """Diff every page of two PDFs on a :class:`workerpool.TaskPool`.
+
+    Returns per-page box lists in page order plus a summary of which pages
+    changed. Pages that fail or exceed *page_timeout* seconds are listed
+    under ``summary['failedPages']`` instead of aborting the whole run.
+
+    With *rows* (``[left page, right page]`` pairs from
+    :func:`page_align.align_documents`) each row is compared instead, and
+    ``page`` in the result is the 1-based row number.
+    """
+
+    if rows is None:
+        pages = max(page_count(left_path), page_count(right_path))
+        rows = [[p, p] for p in range(1, pages + 1)]
+    pages = len(rows)
+    results: List[Optional[Dict[str, object]]] = [None] * pages
+    failed = []
+    tasks = ((left_path, right_path, lp, rp, engine) for lp, rp in rows)
+    for idx, result, error in pool.imap(diff_page, tasks, timeout=page_timeout):
+        if error is not None:
+            failed.append({'page': idx + 1, 'error': str(error) or type(error).__name__})
+            continue
+        results[idx] = dict(result, page=idx + 1, leftPage=rows[idx][0], rightPage=rows[idx][1])
+
+    page_results = [r for r in results if r is not None]
+    changes = {r['page']: len(r['left']) + len(r['right']) for r in page_results}
+    changed = [p for p, n in changes.items() if n]
+    failed.sort(key=lambda f: f['page'])
+    return {
+        'pageCount': pages,
+        'pages': page_results,
+        'summary': {
+            'changedPages': changed,
+            'changesPerPage': {str(p): changes[p] for p in changed},
+            'totalChanges': sum(changes.values()),
+            'failedPages': failed,
+        },
+    }
+
+
+# Normalized coordinates are sent as integers in 1/COMPACT_SCALE page units.
+COMPACT_SCALE = 10000
+
+
+def encode_compact(result: Dict[str, List[Dict[str, object]]]) -> Dict[str, object]:
+    """Convert a ``diff_page`` result into the columnar ``format=compact`` shape.
+
+    Boxes become one flat list of quantized ``x0, y0, x1, y1`` integers per
+    side and texts become indexes into a shared string table, e.g.::
+
+        {"v": 1, "scale": 10000, "strings": ["--|"],
+         "left": {"box": [...], "text": [0], "dash": [2]},
+         "right": {"box": [...], "text": [0], "dash": [2], "improved": [0]}}
+    """
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def columns(boxes, with_improved):
+        flat, texts, dashes, improved = [], [], [], []
+        for b in boxes:
+            flat.extend(int(round(v * COMPACT_SCALE)) for v in b['box'])
+            sid = string_ids.get(b['text'])
+            if sid is None:
+                sid = string_ids[b['text']] = len(strings)
+                strings.append(b['text'])
+            texts.append(sid)
+            dashes.append(b['dashCount'])
+            if with_improved:
+                improved.append(1 if b.get('improved') else 0)
+        out = {'box': flat, 'text': texts, 'dash': dashes}
+        if with_improved:
+            out['improved'] = improved
+        return out
+
+    left = columns(result.get('left', []), False)
+    right = columns(result.get('right', []), True)
+    return {'v': 1, 'scale': COMPACT_SCALE, 'strings': strings, 'left': left, 'right': right}
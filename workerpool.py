@@ -0,0 +1,264 @@
+"""Process pool with bounded in-flight work and per-task time limits.
+
+``concurrent.futures`` cannot cancel a task that is already running, so a
+page or report that hangs PyMuPDF would hold a worker forever. ``TaskPool``
+tracks a deadline for every submitted task; when one expires the task is
+reported as failed, the worker processes are terminated and the other
+in-flight tasks are resubmitted to a fresh pool. ``ProcessPoolExecutor``
+breaks as a whole when one of its workers dies, so tasks of other ``imap``
+calls on the same pool are resubmitted too; that does not count against
+their attempts. Counter increments a task makes in its worker (pages
+parsed, ...) are added to this process's metrics with its result.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from metrics import REGISTRY
+
+# A task whose worker dies this many times is reported as failed instead of
+# being resubmitted again.
+_MAX_ATTEMPTS = 2
+
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def _run_task(fn: Callable, task: tuple):
+    """Run one task in a worker; also return the counter increments it made."""
+
+    before = REGISTRY.counts()
+    result = fn(*task)
+    counts = {key: value - before.get(key, 0) for key, value in REGISTRY.counts().items()}
+    return result, {key: delta for key, delta in counts.items() if delta}
+
+
+class TaskTimeout(Exception):
+    """Raised (as a result value) for tasks that exceeded their time limit."""
+
+
+class _Slots:
+    """Counting semaphore that hands free slots to blocked callers in order.
+
+    A caller that already has tasks running only takes a slot when nobody
+    is waiting, so one long ``imap`` cannot starve a request's ``call()``.
+    """
+
+    def __init__(self, count: int):
+        self._free = count
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        with self._cond:
+            if self._free and not self._waiting:
+                self._free -= 1
+                return True
+            if not blocking:
+                return False
+            ticket = object()
+            self._waiting.append(ticket)
+            try:
+                self._cond.wait_for(lambda: self._free and self._waiting[0] is ticket)
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._waiting.popleft()
+            self._free -= 1
+            self._cond.notify_all()
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._free += 1
+            self._cond.notify_all()
+
+
+class TaskPool:
+    """Lazily started ``ProcessPoolExecutor`` shared by many ``imap`` calls.
+
+    Workers are spawned rather than forked so they never inherit locks or
+    open PyMuPDF handles from the serving process, and they stay alive
+    between calls so their per-process caches remain warm.
+    """
+
+    def __init__(self, workers: Optional[int] = None, initializer: Optional[Callable] = None, initargs: tuple = ()):
+        self.workers = max(1, int(workers or default_workers()))
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Executors killed because one of their tasks timed out, as opposed
+        # to a worker crashing on a task.
+        self._killed: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+        # One slot per worker, held by every submitted task until it finishes,
+        # so concurrent imap() calls never queue work inside the executor and
+        # a task's time limit starts when a worker picks it up.
+        self._slots = _Slots(self.workers)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor, timed_out: bool = False) -> None:
+        """Kill *pool*'s workers (if it is still current) so a stuck task stops."""
+
+        with self._lock:
+            if timed_out:
+                self._killed.add(pool)
+            if self._pool is not pool:
+                return
+            self._pool = None
+        # ProcessPoolExecutor has no public API to stop a running task.
+        for proc in list((getattr(pool, "_processes", None) or {}).values()):
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False)
+
+    def _submit(self, fn: Callable, task: tuple):
+        pool = self._executor()
+        try:
+            return pool, pool.submit(_run_task, fn, task)
+        except (BrokenProcessPool, RuntimeError):
+            self._discard(pool)
+            pool = self._executor()
+            return pool, pool.submit(_run_task, fn, task)
+
+    def _release_slot(self, _future) -> None:
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def warm_up(self) -> None:
+        """Start every worker process now rather than on first use."""
+
+        for _ in self.imap(os.getpid, [()] * self.workers):
+            pass
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run ``fn(*args)`` in a worker and return its result, raising its error.
+
+        Meant for request threads sharing the pool: the caller blocks until
+        a worker is free, so *timeout* only counts the task's own run time.
+        """
+
+        for _idx, result, error in self.imap(fn, [args], timeout=timeout):
+            if error is not None:
+                raise error
+            return result
+
+    def imap(
+        self,
+        fn: Callable,
+        tasks: Iterable[tuple],
+        timeout: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+    ) -> Iterator[Tuple[int, object, Optional[BaseException]]]:
+        """Run ``fn(*task)`` for every task and yield ``(index, result, error)``.
+
+        Results arrive in completion order; *index* is the task's position in
+        *tasks* so callers can merge deterministically. At most
+        *max_in_flight* tasks (default: one per worker) are submitted at a
+        time, which keeps memory flat for long task lists. Each task also
+        holds one of the pool's worker slots, shared with every other caller,
+        so it is only submitted once a worker is free and the submission time
+        is a fair start time for the *timeout* in seconds.
+        """
+
+        limit = max(1, int(max_in_flight or self.workers))
+        source = iter(enumerate(tasks))
+        retry: deque = deque()
+        in_flight = {}
+        exhausted = False
+
+        while True:
+            while len(in_flight) < limit and (retry or not exhausted):
+                # Wait for a worker slot only when there is nothing of ours
+                # to collect; otherwise collect results first.
+                if not self._slots.acquire(blocking=not in_flight):
+                    break
+                try:
+                    if retry:
+                        idx, task, attempts = retry.popleft()
+                    else:
+                        try:
+                            idx, task = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            self._slots.release()
+                            continue
+                        attempts = 0
+                    pool, future = self._submit(fn, task)
+                except BaseException:
+                    self._slots.release()
+                    raise
+                # Released when the worker is done with it, even if this
+                # generator has been abandoned by then.
+                future.add_done_callback(self._release_slot)
+                in_flight[future] = (idx, task, attempts, pool, time.monotonic())
+
+            if not in_flight:
+                return
+
+            wait_for = None
+            if timeout is not None:
+                oldest = min(started for *_, started in in_flight.values())
+                wait_for = max(0.0, oldest + timeout - time.monotonic())
+            done, _ = wait(list(in_flight), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                idx, task, attempts, pool, _started = in_flight.pop(future)
+                try:
+                    result, counts = future.result()
+                except BrokenProcessPool as exc:
+                    self._discard(pool)
+                    if pool in self._killed:
+                        # Killed for another task's timeout, not this one's fault.
+                        retry.append((idx, task, attempts))
+                    elif attempts + 1 < _MAX_ATTEMPTS:
+                        retry.append((idx, task, attempts + 1))
+                    else:
+                        yield idx, None, exc
+                except Exception as exc:
+                    yield idx, None, exc
+                else:
+                    REGISTRY.add_counts(counts)
+                    yield idx, result, None
+
+            if timeout is None:
+                continue
+            now = time.monotonic()
+            expired_pools = {entry[3] for entry in in_flight.values() if now - entry[4] >= timeout}
+            for future, (idx, task, attempts, pool, started) in list(in_flight.items()):
+                if pool not in expired_pools:
+                    continue
+                del in_flight[future]
+                if now - started >= timeout:
+                    yield idx, None, TaskTimeout(f"timed out after {timeout:g}s")
+                else:
+                    # Innocent bystander on a pool that is about to be killed.
+                    retry.appendleft((idx, task, attempts))
+            for pool in expired_pools:
+                self._discard(pool, timed_out=True)